@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:36:51 2026
+
+"""
+
+# ALIGNED PANEL - EVERY TICKER OF A WINDOW ON ONE DATE AXIS WITH A VALIDITY MASK
+# replaces the pairwise pd.merge chain of data_array_merge and the per pair re-merge of
+# pair_data_verifier. tickers are aligned in one pass into a Date x ticker matrix, and
+# valid[t, k] marks the days ticker k has a row. one product of the mask with itself gives
+# the overlap of every pair, so the missing data rule is applied to a whole sector at once
+#
+#   overlap[i, j] = days both i and j have a row
+#   loss[i, j]    = days[i] - overlap[i, j], rows ticker i loses when merged with ticker j
+
+import numpy as np
+import pandas as pd
+
+
+class AlignedPanel():
+
+    def __init__(self, dates, tickers, values, valid=None):
+        """
+        args:
+            dates: array like of sorted unique dates, one per row
+            tickers: list of tickers, one per column
+            values: 2d np.array of prices, dates x tickers
+            valid: 2d boolean np.array, True where a ticker has a row on a date.
+                   None treats every non NaN price as valid
+        """
+        self.dates = np.asarray(dates)
+        self.tickers = list(tickers)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.valid = ~np.isnan(self.values) if valid is None else np.asarray(valid, dtype=bool)
+        self.col_index = {ticker: col for col, ticker in enumerate(self.tickers)}
+        self.overlap_matrix = None
+
+    def days(self):
+        # rows of every ticker
+        return self.valid.sum(axis=0)
+
+    def overlap(self):
+        """
+        days both tickers of every pair have a row, one matrix product over the mask
+        returns:
+            2d np.array of int64, tickers x tickers, the diagonal is days()
+        """
+        if self.overlap_matrix is None:
+            # float product runs on BLAS, counts stay exact far beyond any number of dates
+            mask = self.valid.astype(np.float64)
+            self.overlap_matrix = mask.T.dot(mask).astype(np.int64)
+        return self.overlap_matrix
+
+    def loss(self):
+        """
+        rows every ticker loses when merged with every other ticker
+        returns:
+            2d np.array of int64, loss[i, j] for ticker i merged with ticker j
+        """
+        overlap = self.overlap()
+        return np.diag(overlap)[:, None] - overlap
+
+    def verify_pairs(self, pairs, threshold=10):
+        """
+        pair_data_verifier rule for many pairs at once: a pair fails when either ticker
+        loses more than threshold rows in the merge
+        args:
+            pairs: list of (ticker_1, ticker_2) tuples, tickers of the panel
+            threshold: integer, max number of days of data we can be missing after merging
+        returns:
+            np.array of bool, True for the pairs that keep enough data
+        """
+        if len(pairs) == 0:
+            return np.zeros(0, dtype=bool)
+        idx_i = np.array([self.col_index[pair[0]] for pair in pairs])
+        idx_j = np.array([self.col_index[pair[1]] for pair in pairs])
+        loss = self.loss()
+        return (loss[idx_i, idx_j] <= threshold) & (loss[idx_j, idx_i] <= threshold)
+
+    def inner(self, tickers=None):
+        """
+        rows where every ticker has data, same dataframe as data_array_merge
+        args:
+            tickers: list of tickers, None for every ticker of the panel
+        returns:
+            pandas dataframe indexed by Date, one column per ticker
+        """
+        tickers = self.tickers if tickers is None else list(tickers)
+        cols = [self.col_index[ticker] for ticker in tickers]
+        rows = self.valid[:, cols].all(axis=1)
+        index = pd.Index(self.dates[rows], name='Date')
+        return pd.DataFrame(self.values[rows][:, cols], index=index, columns=tickers)
+
+    def pair_frame(self, pair, decimals=2):
+        """
+        merged dataframe of one pair, same as pair_data_verifier returns
+        args:
+            pair: tuple of both tickers
+            decimals: prices are rounded to decimals
+        returns:
+            pandas dataframe with columns Date, ticker_1, ticker_2
+        """
+        merged = self.inner(pair).round(decimals=decimals).reset_index()
+        return merged
+
+
+def from_frames(array_df_data, tickers=None):
+    """
+    align per ticker dataframes in one pass
+    args:
+        array_df_data: array of pandas dataframes with columns Date and a price column,
+                       ex: from common_methods.load_df_stock_data_array
+        tickers: column names of the panel, None names each column after its price column
+    returns:
+        AlignedPanel, rows are the sorted union of every frame's dates
+    """
+    if tickers is None:
+        tickers = [frame.columns[1] for frame in array_df_data]
+    frame_dates = [frame['Date'].values for frame in array_df_data]
+    if not frame_dates:
+        return AlignedPanel(np.zeros(0), tickers, np.zeros((0, 0)), np.zeros((0, 0), dtype=bool))
+    # align on day numbers, keep the caller's date objects for the index
+    all_dates = np.concatenate(frame_dates)
+    day_numbers = np.asarray(pd.to_datetime(all_dates).values.astype('datetime64[D]'), dtype=np.int64)
+    union, first = np.unique(day_numbers, return_index=True)
+
+    values = np.full((len(union), len(tickers)), np.nan)
+    valid = np.zeros((len(union), len(tickers)), dtype=bool)
+    start = 0
+    for col, frame in enumerate(array_df_data):
+        rows = np.searchsorted(union, day_numbers[start:start + len(frame)])
+        values[rows, col] = frame.iloc[:, 1].values.astype(np.float64)
+        valid[rows, col] = True
+        start += len(frame)
+    return AlignedPanel(all_dates[first], tickers, values, valid)
+
+
+def from_panel(panel):
+    """
+    wrap a Date x ticker panel, ex: from common_methods.load_price_panel. NaN prices are missing rows
+    returns:
+        AlignedPanel
+    """
+    return AlignedPanel(panel.index.values, list(panel.columns), panel.values)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:12:05 2026
+
+"""
+
+# BASKET SCREENING - BATCHED JOHANSEN TRACE TESTS OVER THREE AND FOUR TICKER BASKETS
+# C(n, 3) and C(n, 4) grow too fast to test every basket of a sector, so candidates are
+# built from the pair level structure first and only the promising ones reach the test
+#
+# stages, per basket size:
+#   exclude     - tickers we never trade in a basket, ex: SPY
+#   pairs       - Engle-Granger test of every pair (from the cointegration cache when given)
+#   structure   - every leg of the basket has a daily log return correlation of at least
+#                 min_correlation. quads are only grown from the triples that pass links
+#   links       - at least min_link_share of the legs have a pair p-value below link_p_value,
+#                 and no leg is a cointegrated pair on its own (that basket adds nothing)
+#   nested      - quads holding a cointegrated triple, optional
+#   rank        - the max_candidates baskets with the lowest mean leg p-value
+#   johansen    - trace test of r = 0 rejected at p_value, batch_johansen
+#
+# the Johansen test of a basket only needs the moments of its own columns of
+# [first differences, lagged levels, lagged differences]. one gram of those columns for the
+# whole sector gives the moments of every basket, so a batch of baskets is a stack of
+# small matrix problems instead of one statsmodels coint_johansen call per basket
+
+import itertools
+import time
+import warnings
+
+import numpy as np
+from statsmodels.tsa.coint_tables import c_sjt
+
+import coint_engine
+import instrumentation
+
+# column of the c_sjt critical values for each p_value
+CRITICAL_COLUMNS = {0.1: 0, 0.05: 1, 0.01: 2}
+
+
+def johansen_gram(prices, k_ar_diff=1):
+    """
+    moments shared by every basket of a panel, coint_johansen(det_order=0) conventions
+    args:
+        prices: 2d np.array of prices, T x n, no missing values
+        k_ar_diff: number of lagged differences in the model, type int
+    returns:
+        gram: 2d np.array, n * (2 + k_ar_diff) square. columns are the differences, the
+              levels lagged k_ar_diff + 1 rows (as coint_johansen) and each lagged difference,
+              all demeaned over the rows used
+        nobs: number of rows used, type int
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    diffs = np.diff(prices, axis=0)
+    nobs = len(diffs) - k_ar_diff
+    columns = [diffs[k_ar_diff:], prices[1:len(prices) - k_ar_diff]]
+    for lag in range(1, k_ar_diff + 1):
+        columns.append(diffs[k_ar_diff - lag:len(diffs) - lag])
+    design = np.hstack(columns)
+    design = design - design.mean(axis=0)
+    return design.T.dot(design), nobs
+
+
+def _johansen_block(sub, m, nobs):
+    # trace statistics and first cointegrating vector of a stack of basket grams
+    s_ab = sub[:, :2 * m, :2 * m]
+    if sub.shape[1] > 2 * m:
+        # residual moments after the regression on the lagged differences
+        s_ab = s_ab - np.matmul(sub[:, :2 * m, 2 * m:], np.linalg.solve(sub[:, 2 * m:, 2 * m:], sub[:, 2 * m:, :2 * m]))
+    s00 = s_ab[:, :m, :m]
+    sk0 = s_ab[:, m:, :m]
+    skk = s_ab[:, m:, m:]
+    sig = np.matmul(sk0, np.linalg.solve(s00, np.swapaxes(sk0, 1, 2)))
+    # eig(skk^-1 sig) as a symmetric problem, L^-1 sig L^-T with skk = L L'
+    chol = np.linalg.cholesky(skk)
+    half = np.linalg.solve(chol, sig)
+    sym = np.linalg.solve(chol, np.swapaxes(half, 1, 2))
+    sym = 0.5 * (sym + np.swapaxes(sym, 1, 2))
+    eigvals, eigvecs = np.linalg.eigh(sym)
+    # largest first, as coint_johansen
+    eigvals = eigvals[:, ::-1]
+    log_keep = np.log(1.0 - np.clip(eigvals, None, 1.0 - 1e-15))
+    trace = -nobs * np.cumsum(log_keep[:, ::-1], axis=1)[:, ::-1]
+    vectors = np.linalg.solve(np.swapaxes(chol, 1, 2), eigvecs[:, :, -1:])[:, :, 0]
+    return trace, vectors / vectors[:, :1]
+
+
+def batch_johansen(prices, baskets, k_ar_diff=1, gram=None, block_size=20000):
+    """
+    Johansen trace statistics of many baskets of one panel,
+    coint_johansen(prices[:, basket], 0, k_ar_diff).lr1 for every basket
+    args:
+        prices: 2d np.array of prices, T x n, no missing values
+        baskets: 2d np.array of column indices, one basket of m tickers per row
+        k_ar_diff: number of lagged differences in the model, type int
+        gram: (gram, nobs) from johansen_gram, computed when None
+        block_size: baskets solved per stacked batch, type int
+    returns:
+        trace: 2d np.array, baskets x m, trace statistic of r <= 0 .. m - 1. NaN for a
+               basket with singular moments, ex: two identical price series
+        weights: 2d np.array, baskets x m, cointegrating vector of the largest eigenvalue,
+                 scaled to a weight of 1 on the first ticker
+    """
+    baskets = np.asarray(baskets, dtype=int)
+    n_baskets, m = baskets.shape
+    trace = np.full((n_baskets, m), np.nan)
+    weights = np.full((n_baskets, m), np.nan)
+    if n_baskets == 0:
+        return trace, weights
+    n = prices.shape[1]
+    gram, nobs = johansen_gram(prices, k_ar_diff) if gram is None else gram
+    # columns of each basket in the gram: differences, levels, then every lagged difference
+    offsets = np.arange(2 + k_ar_diff) * n
+    cols = (offsets[:, None, None] + baskets[None, :, :]).transpose(1, 0, 2).reshape(n_baskets, -1)
+
+    for start in range(0, n_baskets, block_size):
+        block = cols[start:start + block_size]
+        sub = gram[block[:, :, None], block[:, None, :]]
+        try:
+            trace[start:start + len(block)], weights[start:start + len(block)] = _johansen_block(sub, m, nobs)
+        except np.linalg.LinAlgError:
+            # one singular basket fails the stack, solve the block one basket at a time
+            for row in range(len(block)):
+                try:
+                    trace[start + row], weights[start + row] = [out[0] for out in _johansen_block(sub[row:row + 1], m, nobs)]
+                except np.linalg.LinAlgError:
+                    pass
+    return trace, weights
+
+
+def trace_critical_value(m, p_value=0.01):
+    """
+    critical value of the trace test of r = 0 for m tickers, constant term (det_order=0)
+    args:
+        m: number of tickers in the basket, type int
+        p_value: 0.1, 0.05 or 0.01
+    returns:
+        float
+    """
+    return float(c_sjt(m, 0)[CRITICAL_COLUMNS[p_value]])
+
+
+def leg_positions(m):
+    # (a, b) positions of every leg of an m ticker basket
+    return list(itertools.combinations(range(m), 2))
+
+
+def grow_baskets(baskets, close, block_size=20000):
+    """
+    every basket plus one more ticker that is close to all of its members
+    args:
+        baskets: 2d np.array of sorted column indices, one basket per row
+        close: 2d boolean np.array, tickers x tickers, True where two tickers may share a basket
+    returns:
+        2d np.array of sorted, unique baskets one ticker larger
+    """
+    grown = [np.zeros((0, baskets.shape[1] + 1), dtype=int)]
+    for start in range(0, len(baskets), block_size):
+        block = baskets[start:start + block_size]
+        ok = close[block].all(axis=1)
+        ok[np.arange(len(block))[:, None], block] = False
+        rows, extra = np.nonzero(ok)
+        grown.append(np.sort(np.column_stack([block[rows], extra]), axis=1))
+    grown = np.concatenate(grown)
+    if len(grown) == 0:
+        return grown
+    return np.unique(grown, axis=0)
+
+
+def n_combinations(n, m):
+    # C(n, m) as a python int
+    if m > n:
+        return 0
+    total = 1
+    for kk in range(m):
+        total = total * (n - kk) // (kk + 1)
+    return total
+
+
+class BasketScreen():
+
+    def __init__(self, sizes=(3, 4), min_correlation=0.3, link_p_value=0.2, min_link_share=0.5,
+                 skip_cointegrated_pairs=True, skip_nested=True, max_candidates=20000,
+                 k_ar_diff=1, exclude=('SPY',)):
+        """
+        args:
+            sizes: basket sizes screened, 3 and / or 4
+            min_correlation: lowest daily log return correlation of any leg of a basket
+            link_p_value: a leg with a pair p-value below it counts as linked
+            min_link_share: lowest share of linked legs of a basket, 0 keeps every basket
+            skip_cointegrated_pairs: drop baskets holding a pair cointegrated at p_value, type bool
+            skip_nested: drop quads holding a triple found cointegrated, type bool
+            max_candidates: most baskets of each size sent to the Johansen test, None for no limit
+            k_ar_diff: number of lagged differences in the Johansen model, type int
+            exclude: tickers never put in a basket
+        """
+        self.sizes = sizes
+        self.min_correlation = min_correlation
+        self.link_p_value = link_p_value
+        self.min_link_share = min_link_share
+        self.skip_cointegrated_pairs = skip_cointegrated_pairs
+        self.skip_nested = skip_nested
+        self.max_candidates = max_candidates
+        self.k_ar_diff = k_ar_diff
+        self.exclude = exclude
+        # one dict per stage of the last run: size, stage, baskets_in, pruned, seconds
+        self.report = []
+
+    def add_stage(self, size, stage, baskets_in, baskets_out, start):
+        self.report.append({'size': size, 'stage': stage, 'baskets_in': int(baskets_in),
+                            'pruned': int(baskets_in - baskets_out), 'seconds': time.perf_counter() - start})
+        instrumentation.count("basket_{0}_pruned".format(stage), int(baskets_in - baskets_out))
+
+    def pair_matrix(self, data, cols, p_value, cache=None):
+        """
+        pair p-values of the kept columns, upper triangle, 1 elsewhere
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+            cols: np.array of the kept column indices
+            p_value: pairs below it are counted as cointegrated in the stage report
+            cache: coint_cache.CointCache object, only pairs missing from it are tested
+        returns:
+            2d np.array of p-values, kept tickers x kept tickers
+        """
+        start = time.perf_counter()
+        n = len(cols)
+        pvalue_matrix = np.ones((n, n))
+        idx_i, idx_j = coint_engine.pair_indices(n)
+        compute = lambda ii, jj: coint_engine.batch_coint(data.values, ii, jj)
+        if cache is None:
+            scores, pvalues = compute(cols[idx_i], cols[idx_j])
+        else:
+            # same pairs and keys as the pair screen, a rerun reads them from the cache
+            scores, pvalues = cache.coint(data, cols[idx_i], cols[idx_j], compute)
+        # a failed pair regression is not a link
+        pvalue_matrix[idx_i, idx_j] = np.where(np.isnan(pvalues), 1.0, pvalues)
+        self.add_stage(2, 'pairs', len(idx_i), int((pvalues < p_value).sum()), start)
+        return pvalue_matrix
+
+    def filter_links(self, baskets, pvalue_matrix, p_value):
+        # links stage, boolean mask of the baskets kept
+        legs = leg_positions(baskets.shape[1])
+        leg_pvalues = np.column_stack([pvalue_matrix[baskets[:, a], baskets[:, b]] for a, b in legs])
+        keep = (leg_pvalues < self.link_p_value).sum(axis=1) >= np.ceil(self.min_link_share * len(legs))
+        if self.skip_cointegrated_pairs:
+            keep &= ~(leg_pvalues < p_value).any(axis=1)
+        return keep, leg_pvalues.mean(axis=1)
+
+    def candidates(self, data, p_value=0.01, cache=None):
+        """
+        run the pruning stages
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+            p_value: pair threshold of skip_cointegrated_pairs
+            cache: coint_cache.CointCache object for the pair stage
+        returns:
+            dict of size to (2d np.array of baskets, column indices of data sorted within a
+            basket, np.array of mean leg p-values)
+        """
+        self.report = []
+        prices = np.asarray(data.values, dtype=float)
+        n_all = prices.shape[1]
+        start = time.perf_counter()
+        cols = np.array([col for col, key in enumerate(data.keys()) if key not in self.exclude], dtype=int)
+        self.add_stage(1, 'exclude', n_all, len(cols), start)
+        n = len(cols)
+        if n < min(self.sizes):
+            return dict([(size, (np.zeros((0, size), dtype=int), np.zeros(0))) for size in self.sizes])
+
+        pvalue_matrix = self.pair_matrix(data, cols, p_value, cache)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.atleast_2d(np.corrcoef(np.diff(np.log(prices[:, cols]), axis=0), rowvar=False))
+        close = corr >= self.min_correlation
+        np.fill_diagonal(close, False)
+
+        result = {}
+        # triples grow from correlated pairs, quads from the promising triples
+        idx_i, idx_j = coint_engine.pair_indices(n)
+        linked_pairs = close[idx_i, idx_j]
+        seeds = np.column_stack([idx_i[linked_pairs], idx_j[linked_pairs]])
+        promising = {}
+        for size in range(3, max(self.sizes) + 1):
+            start = time.perf_counter()
+            baskets = grow_baskets(seeds, close)
+            self.add_stage(size, 'structure', n_combinations(n, size), len(baskets), start)
+
+            start = time.perf_counter()
+            keep, mean_pvalues = self.filter_links(baskets, pvalue_matrix, p_value) if len(baskets) else \
+                (np.zeros(0, dtype=bool), np.zeros(0))
+            self.add_stage(size, 'links', len(baskets), int(keep.sum()), start)
+            baskets = baskets[keep]
+            mean_pvalues = mean_pvalues[keep]
+            promising[size] = (baskets, mean_pvalues)
+            seeds = baskets
+
+        for size in self.sizes:
+            baskets, mean_pvalues = promising[size]
+            result[size] = (cols[baskets] if len(baskets) else baskets, mean_pvalues)
+        return result
+
+    def find_cointegrated_baskets(self, data, p_value=0.01, cache=None):
+        """
+        basket counterpart of find_cointegrated_pairs
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+            p_value: 0.1, 0.05 or 0.01, level of the trace test and of skip_cointegrated_pairs
+            cache: coint_cache.CointCache object for the pair stage
+        returns:
+            baskets: array of ticker tuples, triples first, each in column order
+            weights: array of np.arrays, cointegrating vector of each basket, 1 on its first ticker
+        """
+        keys = data.keys()
+        prices = np.asarray(data.values, dtype=float)
+        candidates = self.candidates(data, p_value, cache)
+        gram = johansen_gram(prices, self.k_ar_diff) if prices.shape[0] > self.k_ar_diff + 2 else None
+        found_baskets = []
+        found_weights = []
+        cointegrated = set()
+
+        for size in sorted(self.sizes):
+            baskets, mean_pvalues = candidates[size]
+            if size > 3 and self.skip_nested and len(baskets):
+                start = time.perf_counter()
+                keep = np.array([not any([sub in cointegrated for sub in itertools.combinations(basket, 3)])
+                                 for basket in baskets.tolist()], dtype=bool)
+                self.add_stage(size, 'nested', len(baskets), int(keep.sum()), start)
+                baskets = baskets[keep]
+                mean_pvalues = mean_pvalues[keep]
+
+            start = time.perf_counter()
+            if self.max_candidates is not None and len(baskets) > self.max_candidates:
+                order = np.argsort(mean_pvalues, kind='stable')[:self.max_candidates]
+                baskets = baskets[np.sort(order)]
+            self.add_stage(size, 'rank', len(mean_pvalues), len(baskets), start)
+
+            start = time.perf_counter()
+            if gram is None or len(baskets) == 0:
+                self.add_stage(size, 'johansen', len(baskets), 0, start)
+                continue
+            instrumentation.count('baskets_screened', len(baskets))
+            with instrumentation.span('johansen'):
+                trace, weights = batch_johansen(prices, baskets, self.k_ar_diff, gram)
+            keep = trace[:, 0] > trace_critical_value(size, p_value)
+            self.add_stage(size, 'johansen', len(baskets), int(keep.sum()), start)
+            for basket, basket_weights in zip(baskets[keep].tolist(), weights[keep]):
+                cointegrated.add(tuple(basket))
+                found_baskets.append(tuple([keys[col] for col in basket]))
+                found_weights.append(basket_weights)
+        return found_baskets, found_weights
+
+
+def format_report(report):
+    """
+    one line per stage, ex: "3 links: 5200 in, 4810 pruned, 0.004s"
+    """
+    return "\n".join(["{0} {1}: {2} in, {3} pruned, {4:.3f}s".format(
+                      row['size'], row['stage'], row['baskets_in'], row['pruned'], row['seconds']) for row in report])
+
+
+def main():
+    # check batch_johansen against statsmodels and time the screen on synthetic sectors
+    from statsmodels.tsa.vector_ar.vecm import coint_johansen
+    import benchmark_coint
+
+    warnings.simplefilter("ignore")
+    data = benchmark_coint.factor_sector(20, 504, n_planted=4)
+    rng = np.random.RandomState(0)
+    baskets = np.sort(np.array([rng.choice(20, 4, replace=False) for ii in range(50)]), axis=1)
+    for k_ar_diff in [0, 1, 2]:
+        trace = batch_johansen(data.values, baskets, k_ar_diff)[0]
+        expected = np.array([coint_johansen(data.values[:, basket], 0, k_ar_diff).lr1 for basket in baskets])
+        print("k_ar_diff={0}: largest difference to coint_johansen {1:.2e}".format(
+              k_ar_diff, np.abs(trace - expected).max()))
+
+    for n_tickers in [25, 50, 75]:
+        data = benchmark_coint.factor_sector(n_tickers, 504, n_planted=n_tickers // 5)
+        data = data.rename(columns={data.columns[-1]: 'SPY'})
+        screen = BasketScreen()
+        start = time.perf_counter()
+        baskets, weights = screen.find_cointegrated_baskets(data)
+        print("{0} tickers: {1} baskets in {2:.3f}s".format(n_tickers, len(baskets), time.perf_counter() - start))
+        print(format_report(screen.report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:05:31 2026
+
+"""
+
+# BENCHMARK - BATCHED COINTEGRATION ENGINE VS STATSMODELS COINT LOOP
+# synthetic sector panels, no database required
+
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import common_methods as cm
+
+
+def synthetic_sector(n_tickers, n_days, n_planted=5, seed=0):
+    """
+    build a sector of random walk prices with a few planted cointegrated pairs
+    args:
+        n_tickers: number of tickers in the sector, type int
+        n_days: number of trading days, type int
+        n_planted: number of cointegrated pairs to plant, type int
+        seed: random seed, type int
+    returns:
+        pandas dataframe, each column = ticker price
+    """
+    rng = np.random.RandomState(seed)
+    prices = 50.0 + np.cumsum(rng.normal(0.0, 1.0, (n_days, n_tickers)), axis=0)
+    prices = np.abs(prices) + 5.0
+    for kk in range(min(n_planted, n_tickers // 2)):
+        leader = prices[:, 2 * kk]
+        hedge = rng.uniform(0.5, 2.0)
+        prices[:, 2 * kk + 1] = hedge * leader + rng.normal(0.0, 1.0, n_days)
+    columns = ["T{0:04d}".format(ii) for ii in range(n_tickers)]
+    return pd.DataFrame(prices, columns=columns)
+
+
+def factor_sector(n_tickers, n_days, n_planted=5, seed=0):
+    """
+    build a sector of log normal prices driven by a market and a sector factor, with a few
+    planted cointegrated pairs. returns are correlated like a real sector, unlike synthetic_sector
+    args:
+        n_tickers: number of tickers in the sector, type int
+        n_days: number of trading days, type int
+        n_planted: number of cointegrated pairs to plant, type int
+        seed: random seed, type int
+    returns:
+        pandas dataframe, each column = ticker price
+    """
+    rng = np.random.RandomState(seed)
+    market = rng.normal(0.0003, 0.01, n_days)
+    sector = rng.normal(0.0, 0.006, n_days)
+    loadings = rng.uniform(0.6, 1.4, (2, n_tickers))
+    returns = (market[:, None] * loadings[0] + sector[:, None] * loadings[1] +
+               rng.normal(0.0, 0.012, (n_days, n_tickers)))
+    prices = rng.uniform(20.0, 150.0, n_tickers) * np.exp(np.cumsum(returns, axis=0))
+    for kk in range(min(n_planted, n_tickers // 2)):
+        leader = prices[:, 2 * kk]
+        # mean reverting spread around a fixed hedge ratio
+        spread = np.zeros(n_days)
+        shocks = rng.normal(0.0, 0.01 * leader.mean(), n_days)
+        for tt in range(1, n_days):
+            spread[tt] = 0.9 * spread[tt - 1] + shocks[tt]
+        prices[:, 2 * kk + 1] = rng.uniform(0.5, 2.0) * leader + spread + 0.5 * leader.mean()
+    columns = ["T{0:04d}".format(ii) for ii in range(n_tickers)]
+    return pd.DataFrame(prices, columns=columns)
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    n_days = 504 # two years of trading days, same as identifying_pairs windows
+    sector_sizes = [10, 25, 50]
+
+    warnings.simplefilter("ignore")
+    for n_tickers in sector_sizes:
+        data = synthetic_sector(n_tickers, n_days)
+        n_pairs = n_tickers * (n_tickers - 1) // 2
+
+        t_loop, loop_res = time_call(cm.find_cointegrated_pairs, data, batched=False)
+        t_batch, batch_res = time_call(cm.find_cointegrated_pairs, data, batched=True)
+
+        max_score_diff = np.max(np.abs(loop_res[0] - batch_res[0]))
+        max_pvalue_diff = np.max(np.abs(loop_res[1] - batch_res[1]))
+        same_pairs = loop_res[2] == batch_res[2]
+
+        print("{0} tickers, {1} pairs".format(n_tickers, n_pairs))
+        print("  statsmodels loop: {0:.3f}s, batched: {1:.3f}s, speedup: {2:.1f}x".format(
+              t_loop, t_batch, t_loop / t_batch))
+        print("  max score diff: {0:.2e}, max pvalue diff: {1:.2e}, same pairs: {2}".format(
+              max_score_diff, max_pvalue_diff, same_pairs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:40:03 2026
+
+"""
+
+# BENCHMARK SUITE - SCREENING, BACKTEST AND ANALYSIS ON SYNTHETIC MARKETS
+# a deterministic synthetic universe (sectors of factor driven random walks with planted
+# cointegrated pairs) is run through every stage of the model at several scales.
+# each stage is timed and memory profiled, its fast path is checked against the reference
+# implementation on a subset, and results are appended to benchmark_results.csv so a
+# regression shows up against the previous run. no database required
+
+import contextlib
+import datetime
+import glob
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import aligned_panel
+import benchmark_coint
+import common_methods as cm
+import data_sources
+import pairs_backtester as pb
+import trade_analysis
+import trade_store
+
+RESULTS_FILE = "benchmark_results.csv"
+
+RESULT_COLUMNS = ['Run', 'Version', 'Benchmark', 'Tickers', 'Seconds', 'Peak_MB', 'Matches_Reference']
+
+# backtest settings of pairs_backtester.main
+Z_THRESHOLD = [1.0, 0.0]
+LOOKBACK_PERIODS = [5, 30]
+INITIAL_CAPITAL = 50000.0
+PARAMS = "_{0}_{1}".format(LOOKBACK_PERIODS[0], LOOKBACK_PERIODS[1])
+
+
+def synthetic_market(n_tickers, n_sectors=10, n_years=3, n_planted=5, seed=0):
+    """
+    deterministic synthetic universe, one benchmark_coint.factor_sector per sector
+    args:
+        n_tickers: number of tickers across all sectors, type int
+        n_sectors: number of sectors, tickers are split as evenly as possible, type int
+        n_years: years of business days, type int
+        n_planted: cointegrated pairs planted in every sector, type int
+        seed: random seed of the first sector, type int
+    returns:
+        price_panel: pandas dataframe indexed by Date (datetime.date), one column per ticker,
+                     same layout as cm.load_price_panel
+        list_of_stocks: list of (ticker, sector) tuples, same layout as cm.load_db_tickers_sectors
+        planted: list of planted pairs, tuples of two tickers
+    """
+    n_days = 252 * n_years
+    dates = pd.bdate_range(datetime.date(2005, 1, 3), periods=n_days).date
+    frames = []
+    list_of_stocks = []
+    planted = []
+    for ss, size in enumerate(np.diff(np.linspace(0, n_tickers, n_sectors + 1).astype(int))):
+        sector = "Sector{0:02d}".format(ss)
+        data = benchmark_coint.factor_sector(size, n_days, n_planted, seed + ss)
+        data.columns = ["S{0:02d}{1}".format(ss, ticker) for ticker in data.columns]
+        frames.append(data)
+        list_of_stocks.extend([(ticker, sector) for ticker in data.columns])
+        planted.extend([(data.columns[2 * kk], data.columns[2 * kk + 1])
+                        for kk in range(min(n_planted, size // 2))])
+    price_panel = pd.concat(frames, axis=1)
+    price_panel.index = pd.Index(dates, name='Date')
+    return price_panel, list_of_stocks, planted
+
+
+def backtest_pairs(list_of_stocks, planted, n_pairs, seed=0):
+    """
+    planted pairs first, then random pairs from the same sector, n_pairs in total
+    """
+    rng = np.random.RandomState(seed)
+    sector_dict = cm.build_dict_of_arrays(list_of_stocks)
+    sectors = list(sector_dict.keys())
+    pairs = list(planted[:n_pairs])
+    chosen = set(pairs)
+    while len(pairs) < n_pairs:
+        ticker_arr = sector_dict[sectors[rng.randint(len(sectors))]]
+        ii, jj = sorted(rng.choice(len(ticker_arr), 2, replace=False))
+        pair = (ticker_arr[ii], ticker_arr[jj])
+        if pair not in chosen:
+            chosen.add(pair)
+            pairs.append(pair)
+    return pairs
+
+
+def measure(func, *args, **kwargs):
+    """
+    run func once with tracemalloc on
+    returns:
+        seconds, peak traced memory in MB, func result
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    # the backtester and trade analysis read and write relative to the working directory
+    cur_path = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cur_path)
+
+
+def quiet(func, *args, **kwargs):
+    # daily_stats prints the trade_stats summary of every run
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def reference_printoptions():
+    # the reference backtest writes numpy scalars with repr, numpy 2 prints them as
+    # np.float64(...). print them like numpy 1 so text output can be compared
+    if int(np.__version__.split(".")[0]) >= 2:
+        return np.printoptions(legacy='1.25')
+    return contextlib.nullcontext()
+
+
+def sector_panels(price_panel, list_of_stocks):
+    sector_dict = cm.build_dict_of_arrays(list_of_stocks)
+    return [price_panel[ticker_arr] for sector, ticker_arr in sector_dict.items()]
+
+
+def bench_find_cointegrated_pairs(price_panel, list_of_stocks, check_tickers):
+    # every sector with the batched engine, the statsmodels loop on the first check_tickers
+    # tickers of the first sector
+    panels = sector_panels(price_panel, list_of_stocks)
+    seconds, peak, results = measure(lambda: [cm.find_cointegrated_pairs(panel) for panel in panels])
+    subset = panels[0].iloc[:, :check_tickers]
+    fast = cm.find_cointegrated_pairs(subset, batched=True)
+    reference = cm.find_cointegrated_pairs(subset, batched=False)
+    matches = (fast[2] == reference[2] and np.allclose(fast[0], reference[0], rtol=1e-6, atol=1e-8)
+               and np.allclose(fast[1], reference[1], rtol=1e-6, atol=1e-8))
+    return seconds, peak, matches
+
+
+def bench_data_array_merge(price_panel, list_of_stocks):
+    # data_array_merge of per ticker dataframes vs one pivot of long rows, sector by sector
+    sector_dict = cm.build_dict_of_arrays(list_of_stocks)
+    sector_frames = []
+    sector_rows = []
+    for sector, ticker_arr in sector_dict.items():
+        frames = []
+        rows = []
+        for ticker in ticker_arr:
+            stock_data = price_panel[ticker].dropna().reset_index()
+            frames.append(stock_data)
+            rows.extend(zip(stock_data['Date'], [ticker] * len(stock_data), stock_data[ticker]))
+        sector_frames.append(frames)
+        sector_rows.append((rows, ticker_arr))
+    seconds, peak, merged = measure(lambda: [cm.data_array_merge(frames) for frames in sector_frames])
+    panels = [data_sources.price_rows_panel(rows, ticker_arr).dropna() for rows, ticker_arr in sector_rows]
+    matches = all([np.array_equal(ref.values, fast.values) and list(ref.index) == list(fast.index)
+                   for ref, fast in zip(merged, panels)])
+    return seconds, peak, matches
+
+
+def bench_pair_verifier(price_panel, list_of_stocks, check_tickers, seed=0):
+    # missing data rule for every intra-sector pair from one validity mask product per sector,
+    # checked against one pair_data_verifier_reference merge per pair of the first check_tickers
+    rng = np.random.RandomState(seed)
+    sector_frames = []
+    for sector, ticker_arr in cm.build_dict_of_arrays(list_of_stocks).items():
+        frames = []
+        for ticker in ticker_arr:
+            stock_data = price_panel[ticker].dropna().reset_index()
+            # a few tickers miss a run of days, so some pairs fail the threshold
+            if rng.rand() < 0.2:
+                first = rng.randint(len(stock_data))
+                stock_data = stock_data.drop(stock_data.index[first:first + rng.randint(1, 30)])
+            frames.append(stock_data)
+        sector_frames.append((ticker_arr, frames))
+
+    def sector_pairs(ticker_arr):
+        return [(i, j) for i in range(len(ticker_arr)) for j in range(i + 1, len(ticker_arr))]
+
+    def verify_all():
+        return [aligned_panel.from_frames(frames).verify_pairs([(ticker_arr[i], ticker_arr[j])
+                                                                for i, j in sector_pairs(ticker_arr)])
+                for ticker_arr, frames in sector_frames]
+    seconds, peak, results = measure(verify_all)
+
+    ticker_arr, frames = sector_frames[0]
+    checks = [(i, j, keep) for (i, j), keep in zip(sector_pairs(ticker_arr), results[0]) if j < check_tickers]
+    matches = all([(cm.pair_data_verifier_reference([frames[i], frames[j]], (ticker_arr[i], ticker_arr[j]))
+                    is not False) == keep for i, j, keep in checks])
+    return seconds, peak, matches
+
+
+def backtest_window(price_panel):
+    # last year of our data plus the long lookback, like pairs_backtester.main
+    return price_panel.iloc[-(252 + LOOKBACK_PERIODS[1]):]
+
+
+def read_text_results(path):
+    # MasterResults.txt and every trade file of a text backtest, for comparing two runs
+    results = {}
+    for f_name in glob.glob(os.path.join(path, "PairsResults" + PARAMS, "**", "*.txt"), recursive=True):
+        with open(f_name) as ff:
+            lines = ff.read().splitlines()
+        results[os.path.relpath(f_name, path)] = sorted(lines)
+    return results
+
+
+def bench_backtest(price_panel, pairs, check_pairs, work_dir):
+    # BatchPairBackTester on every pair into a trade store. PairBackTester.backtest and
+    # BatchPairBackTester text output checked against backtest_reference on check_pairs
+    window = backtest_window(price_panel)
+    full_dir = os.path.join(work_dir, "full")
+    os.makedirs(full_dir)
+    with working_directory(full_dir):
+        store = trade_store.TradeStore("PairsResults" + PARAMS)
+        bt = pb.BatchPairBackTester(pairs, window, Z_THRESHOLD, LOOKBACK_PERIODS, INITIAL_CAPITAL, store)
+        seconds, peak, result = measure(bt.backtest)
+        store.close()
+
+    outputs = []
+    for name in ["reference", "array", "batch"]:
+        run_dir = os.path.join(work_dir, name)
+        os.makedirs(run_dir)
+        with working_directory(run_dir), reference_printoptions():
+            if name == "batch":
+                pb.BatchPairBackTester(pairs[:check_pairs], window, Z_THRESHOLD, LOOKBACK_PERIODS,
+                                       INITIAL_CAPITAL).backtest()
+            for pair in (pairs[:check_pairs] if name != "batch" else []):
+                new_pair = pb.PairBackTester(pair, window[list(pair)].dropna(), Z_THRESHOLD,
+                                             LOOKBACK_PERIODS, INITIAL_CAPITAL)
+                (new_pair.backtest_reference if name == "reference" else new_pair.backtest)()
+        outputs.append(read_text_results(run_dir))
+    matches = outputs[0] == outputs[1] and outputs[0] == outputs[2]
+    return seconds, peak, matches
+
+
+def bench_pair_backtest(price_panel, pairs, work_dir):
+    # PairBackTester.backtest on every pair one at a time into a trade store, checked against
+    # the trades of the batch backtest of the same pairs
+    window = backtest_window(price_panel)
+    pair_dir = os.path.join(work_dir, "pair")
+    os.makedirs(pair_dir)
+    
+    def backtest_all(store):
+        for pair in pairs:
+            pb.PairBackTester(pair, window[list(pair)].dropna(), Z_THRESHOLD, LOOKBACK_PERIODS,
+                              INITIAL_CAPITAL, store).backtest()
+    
+    with working_directory(pair_dir):
+        store = trade_store.TradeStore("PairsResults" + PARAMS)
+        seconds, peak, result = measure(backtest_all, store)
+        pair_trades = store.read_trades()
+        store.close()
+    with working_directory(os.path.join(work_dir, "full")):
+        store = trade_store.TradeStore("PairsResults" + PARAMS)
+        batch_trades = store.read_trades()
+        store.close()
+    return seconds, peak, repr(pair_trades) == repr(batch_trades)
+
+
+def bench_daily_stats(price_panel, check_pairs, work_dir):
+    # daily_stats on the trade store of the full backtest, checked against
+    # daily_stats_reference on a store of the check pairs
+    window = backtest_window(price_panel)
+    st_dt, end_dt = window.index[0], window.index[-1]
+    with working_directory(os.path.join(work_dir, "full")):
+        store = trade_store.TradeStore("PairsResults" + PARAMS)
+        df_trds = store.read_master()[['Trade_Id', 'Entry_Date', 'Ticker1', 'Ticker2']]
+        seconds, peak, result = measure(quiet, trade_analysis.daily_stats, df_trds, st_dt, end_dt, PARAMS, store)
+        store.close()
+
+    check_dir = os.path.join(work_dir, "check")
+    os.makedirs(check_dir)
+    with working_directory(check_dir):
+        store = trade_store.TradeStore("PairsResults" + PARAMS)
+        pb.BatchPairBackTester(check_pairs, window, Z_THRESHOLD, LOOKBACK_PERIODS, INITIAL_CAPITAL,
+                               store).backtest()
+        df_trds = store.read_master()[['Trade_Id', 'Entry_Date', 'Ticker1', 'Ticker2']]
+        fast = quiet(trade_analysis.daily_stats, df_trds, st_dt, end_dt, PARAMS, store)
+        reference = quiet(trade_analysis.daily_stats_reference, df_trds, st_dt, end_dt, PARAMS, store)
+        store.close()
+    return seconds, peak, repr(fast) == repr(reference)
+
+
+def git_version():
+    try:
+        # the checkout of this file, not whatever directory the suite is run from
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(scales, n_sectors=10, n_years=3, check_tickers=20, check_pairs=10, seed=0):
+    """
+    every benchmark at every scale
+    args:
+        scales: list of ticker counts, ex: [50, 500, 5000]
+        n_sectors: sectors of the synthetic universe, type int
+        n_years: years of synthetic data, type int
+        check_tickers: tickers of the first sector screened with the statsmodels loop, type int
+        check_pairs: pairs run through the reference backtest and daily_stats, type int
+        seed: random seed, type int
+    returns:
+        pandas dataframe with RESULT_COLUMNS
+    """
+    run = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    version = git_version()
+    rows = []
+    for n_tickers in scales:
+        price_panel, list_of_stocks, planted = synthetic_market(n_tickers, n_sectors, n_years, seed=seed)
+        pairs = backtest_pairs(list_of_stocks, planted, n_tickers, seed)
+        work_dir = tempfile.mkdtemp(prefix="benchmark_")
+        try:
+            benchmarks = [
+                ('find_cointegrated_pairs', bench_find_cointegrated_pairs, (price_panel, list_of_stocks,
+                                                                             check_tickers)),
+                ('data_array_merge', bench_data_array_merge, (price_panel, list_of_stocks)),
+                ('pair_verifier', bench_pair_verifier, (price_panel, list_of_stocks, check_tickers, seed)),
+                ('backtest', bench_backtest, (price_panel, pairs, check_pairs, work_dir)),
+                ('pair_backtest', bench_pair_backtest, (price_panel, pairs, work_dir)),
+                ('daily_stats', bench_daily_stats, (price_panel, pairs[:check_pairs], work_dir)),
+            ]
+            for name, bench, args in benchmarks:
+                seconds, peak, matches = bench(*args)
+                rows.append([run, version, name, n_tickers, seconds, peak, matches])
+                print("{0} tickers, {1}: {2:.3f}s, peak {3:.1f} MB, matches reference: {4}".format(
+                      n_tickers, name, seconds, peak, matches))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def save_results(results, f_name=RESULTS_FILE):
+    """
+    append a run to our results file
+    returns:
+        pandas dataframe of every stored run, this one included
+    """
+    if os.path.exists(f_name):
+        results = pd.concat([pd.read_csv(f_name), results], ignore_index=True)
+    results.to_csv(f_name, index=False)
+    return results
+
+
+def compare_runs(history, tolerance=1.25):
+    """
+    latest run against the previous run of the same benchmark and scale
+    args:
+        history: pandas dataframe of stored runs, see save_results
+        tolerance: slowdown ratio flagged as a regression, type float
+    returns:
+        pandas dataframe with Benchmark, Tickers, Previous, Latest, Ratio, Regression
+    """
+    rows = []
+    runs = list(dict.fromkeys(history['Run'].astype(str)))
+    if len(runs) < 2:
+        return pd.DataFrame(rows, columns=['Benchmark', 'Tickers', 'Previous', 'Latest', 'Ratio', 'Regression'])
+    previous = history[history['Run'].astype(str) == runs[-2]].set_index(['Benchmark', 'Tickers'])
+    latest = history[history['Run'].astype(str) == runs[-1]].set_index(['Benchmark', 'Tickers'])
+    for key in latest.index:
+        if key in previous.index:
+            ratio = latest.loc[key, 'Seconds'] / previous.loc[key, 'Seconds']
+            rows.append([key[0], key[1], previous.loc[key, 'Seconds'], latest.loc[key, 'Seconds'], ratio,
+                         ratio > tolerance or not latest.loc[key, 'Matches_Reference']])
+    return pd.DataFrame(rows, columns=['Benchmark', 'Tickers', 'Previous', 'Latest', 'Ratio', 'Regression'])
+
+
+def main():
+    scales = [50, 500, 5000]
+    n_sectors = 10
+    n_years = 3
+
+    warnings.simplefilter("ignore")
+    results = run_benchmarks(scales, n_sectors, n_years)
+    history = save_results(results)
+    comparison = compare_runs(history)
+    if len(comparison) > 0:
+        print(comparison.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:14:36 2026
+
+"""
+
+# COINTEGRATION RESULT CACHE - ONE SQLITE FILE OF PAIR STATISTICS
+# the Engle-Granger statistic of a pair over a window only changes when its prices do.
+# every result is stored under the pair, the window's first and last date, the test
+# settings and a hash of the two aligned price columns, so a rerun, a new p_value
+# threshold or a resumed screen only tests the pairs that are not in the cache yet.
+# revised prices hash differently and miss, stale rows are dropped by invalidate or
+# by evict, which keeps the max_entries most recently used results
+#
+# results: ticker1, ticker2, start_date, end_date (YYYYMMDD), settings, data_hash,
+#          score, pvalue, last_used (run generation of the last hit)
+
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+import instrumentation
+
+CACHE_NAME = "coint_cache.sqlite"
+MAX_ENTRIES = 2000000
+
+# statsmodels coint(S1, S2) defaults reproduced by coint_engine
+SETTINGS = "engle_granger,trend=c,autolag=aic,maxlag={0}"
+
+SCHEMA = """
+         CREATE TABLE IF NOT EXISTS results (
+             id INTEGER PRIMARY KEY,
+             ticker1 TEXT NOT NULL,
+             ticker2 TEXT NOT NULL,
+             start_date INTEGER NOT NULL,
+             end_date INTEGER NOT NULL,
+             settings TEXT NOT NULL,
+             data_hash TEXT NOT NULL,
+             score REAL,
+             pvalue REAL,
+             last_used INTEGER NOT NULL
+         );
+         CREATE UNIQUE INDEX IF NOT EXISTS idx_results_key
+             ON results(start_date, end_date, settings, ticker1, ticker2, data_hash);
+         CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used);
+         CREATE TABLE IF NOT EXISTS generation (
+             id INTEGER PRIMARY KEY CHECK (id = 0),
+             value INTEGER NOT NULL
+         );
+         """
+
+LOOKUP_SQL = """
+             SELECT id, ticker1, ticker2, data_hash, score, pvalue FROM results
+             WHERE start_date = ? AND end_date = ? AND settings = ?
+             AND ticker1 IN (SELECT value FROM json_each(?))
+             """
+
+
+def date_int(date):
+    # YYYYMMDD of a datetime.date, datetime64 or pandas Timestamp
+    return int(np.datetime64(date, 'D').astype(object).strftime("%Y%m%d"))
+
+
+def column_hashes(dates, prices):
+    """
+    hash of every price column together with its dates
+    args:
+        dates: array like of the row dates
+        prices: 2d np.array of prices, rows x columns
+    returns:
+        list of strings, one per column
+    """
+    date_bytes = np.asarray(dates, dtype='datetime64[D]').astype(np.int64).tobytes()
+    prices = np.asarray(prices, dtype=np.float64)
+    hashes = []
+    for col in range(prices.shape[1]):
+        digest = hashlib.sha1(date_bytes)
+        digest.update(np.ascontiguousarray(prices[:, col]).tobytes())
+        hashes.append(digest.hexdigest()[:16])
+    return hashes
+
+
+class CointCache():
+
+    def __init__(self, path=CACHE_NAME, max_entries=MAX_ENTRIES):
+        """
+        args:
+            path: sqlite file, created when missing
+            max_entries: most results kept by evict, type int
+        """
+        self.path = path
+        self.max_entries = max_entries
+        # workers of one screen share the file, wait for each other's writes
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO generation VALUES (0, 0)")
+            self.conn.execute("UPDATE generation SET value = value + 1")
+            self.generation = self.conn.execute("SELECT value FROM generation").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def lookup(self, keys, dates, prices, idx_i, idx_j, compute, maxlag=None):
+        """
+        statistics of every pair from the cache, pairs not in it are computed and added
+        args:
+            keys: list of tickers, one per price column
+            dates: array like of the row dates, the window is dates[0] to dates[-1]
+            prices: 2d np.array of aligned prices, no missing values
+            idx_i: np.array of column indices used as S1
+            idx_j: np.array of column indices used as S2
+            compute: function (idx_i, idx_j) returning scores, pvalues of the missing pairs
+            maxlag: maximum ADF lag passed to the test, part of the key
+        returns:
+            scores (np.array), pvalues (np.array), same as compute on every pair
+        """
+        idx_i = np.asarray(idx_i, dtype=int)
+        idx_j = np.asarray(idx_j, dtype=int)
+        scores = np.full(len(idx_i), np.nan)
+        pvalues = np.full(len(idx_i), np.nan)
+        if len(idx_i) == 0 or len(dates) == 0:
+            return compute(idx_i, idx_j)
+
+        keys = [str(key) for key in keys]
+        hashes = column_hashes(dates, prices)
+        window = (date_int(dates[0]), date_int(dates[-1]), SETTINGS.format(maxlag))
+        cached = {}
+        for row_id, ticker1, ticker2, data_hash, score, pvalue in self.conn.execute(
+                LOOKUP_SQL, window + (json_list(sorted(set([keys[ii] for ii in idx_i]))),)):
+            cached[(ticker1, ticker2, data_hash)] = (row_id, score, pvalue)
+
+        hit_ids = []
+        missing = []
+        for pp, (ii, jj) in enumerate(zip(idx_i, idx_j)):
+            entry = cached.get((keys[ii], keys[jj], hashes[ii] + hashes[jj]))
+            if entry is None:
+                missing.append(pp)
+                continue
+            hit_ids.append(entry[0])
+            # sqlite keeps nan as NULL
+            scores[pp] = np.nan if entry[1] is None else entry[1]
+            pvalues[pp] = np.nan if entry[2] is None else entry[2]
+        instrumentation.count('coint_cache_hits', len(hit_ids))
+        instrumentation.count('coint_cache_misses', len(missing))
+
+        missing = np.array(missing, dtype=int)
+        rows = []
+        if len(missing):
+            new_scores, new_pvalues = compute(idx_i[missing], idx_j[missing])
+            scores[missing] = new_scores
+            pvalues[missing] = new_pvalues
+            rows = [(keys[ii], keys[jj]) + window + (hashes[ii] + hashes[jj], float(score), float(pvalue),
+                                                     self.generation)
+                    for ii, jj, score, pvalue in zip(idx_i[missing], idx_j[missing], new_scores, new_pvalues)]
+        # one transaction per lookup, a crashed screen keeps every finished sector
+        with self.conn:
+            self.conn.executemany("UPDATE results SET last_used = ? WHERE id = ?",
+                                  [(self.generation, row_id) for row_id in hit_ids])
+            self.conn.executemany("INSERT OR REPLACE INTO results (ticker1, ticker2, start_date, end_date, "
+                                  "settings, data_hash, score, pvalue, last_used) VALUES (?,?,?,?,?,?,?,?,?)", rows)
+        return scores, pvalues
+
+    def coint(self, data, idx_i, idx_j, compute, maxlag=None):
+        """
+        lookup for the columns of a Date x ticker dataframe
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+        """
+        return self.lookup(list(data.keys()), data.index, data.values, idx_i, idx_j, compute, maxlag)
+
+    def invalidate(self, tickers=None, revised_from=None):
+        """
+        drop results of revised prices. they would miss anyway, this frees their space
+        args:
+            tickers: list of tickers whose prices were revised, None for every ticker
+            revised_from: datetime object, first revised date. windows ending before it are kept,
+                          None drops every window
+        returns:
+            integer, number of results dropped
+        """
+        SQL = "DELETE FROM results WHERE 1 = 1"
+        args = []
+        if revised_from is not None:
+            SQL += " AND end_date >= ?"
+            args.append(date_int(revised_from))
+        if tickers is not None:
+            SQL += (" AND (ticker1 IN (SELECT value FROM json_each(?))"
+                    " OR ticker2 IN (SELECT value FROM json_each(?)))")
+            args.extend([json_list(tickers), json_list(tickers)])
+        with self.conn:
+            return self.conn.execute(SQL, args).rowcount
+
+    def evict(self, max_entries=None):
+        """
+        keep the max_entries most recently used results
+        returns:
+            integer, number of results dropped
+        """
+        max_entries = self.max_entries if max_entries is None else max_entries
+        extra = len(self) - max_entries
+        if extra <= 0:
+            return 0
+        with self.conn:
+            dropped = self.conn.execute("DELETE FROM results WHERE id IN "
+                                        "(SELECT id FROM results ORDER BY last_used, id LIMIT ?)",
+                                        (extra,)).rowcount
+        self.conn.execute("VACUUM")
+        return dropped
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM results")
+
+
+def json_list(values):
+    # tickers as a json array for json_each, tickers never hold quotes
+    return "[" + ",".join(['"{0}"'.format(value) for value in values]) + "]"
+
+
+def main():
+    # screen a synthetic sector twice, the second screen is read from the cache
+    import time
+    import benchmark_suite
+    import coint_engine
+
+    path = "coint_cache_check.sqlite"
+    if os.path.exists(path):
+        os.remove(path)
+    price_panel, list_of_stocks, planted = benchmark_suite.synthetic_market(60, n_sectors=1, n_years=2)
+    data = price_panel.dropna()
+    idx_i, idx_j = coint_engine.pair_indices(data.shape[1])
+    compute = lambda ii, jj: coint_engine.batch_coint(data.values, ii, jj)
+
+    cache = CointCache(path)
+    for run in ["empty cache", "cached"]:
+        start = time.perf_counter()
+        scores, pvalues = cache.coint(data, idx_i, idx_j, compute)
+        print("{0}: {1} pairs in {2:.3f}s".format(run, len(idx_i), time.perf_counter() - start))
+    direct = coint_engine.batch_coint(data.values, idx_i, idx_j)
+    print("matches batch_coint: {0}".format(np.array_equal(scores, direct[0]) and np.array_equal(pvalues, direct[1])))
+    print("dropped after revising {0}: {1}".format(data.columns[0], cache.invalidate([data.columns[0]])))
+    cache.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
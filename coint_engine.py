@@ -0,0 +1,577 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:40 2026
+
+"""
+
+# BATCHED ENGLE-GRANGER COINTEGRATION ENGINE
+# runs every pair regression and residual ADF statistic of a sector panel as
+# stacked numpy linear algebra instead of one statsmodels coint call per pair
+
+import numpy as np
+import pandas as pd
+import statsmodels.tsa.stattools as ts
+from scipy.stats import norm
+from statsmodels.tsa.adfvalues import _tau_maxs, _tau_mins, _tau_stars, _tau_smallps, _tau_largeps
+
+# statsmodels coint flags a pair as (almost) perfectly collinear above this R^2
+COLLINEAR_RSQ = 1 - 100 * np.sqrt(np.finfo(float).eps)
+
+# a per pair cross product costs about as much as this many ticker pairs of a dense gram tile,
+# tiles whose pairs fill less than 1 / PAIR_PRODUCT_COST of the tile use per pair products
+PAIR_PRODUCT_COST = 4
+
+
+def default_maxlag(nobs):
+    """
+    maximum ADF lag used by statsmodels adfuller when maxlag is None
+    args:
+        nobs: number of observations in the residual series, type int
+    returns:
+        integer, Schwert (1989) maximum lag
+    """
+    maxlag = int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0)))
+    return min(nobs // 2 - 1, maxlag)
+
+
+def mackinnon_pvalues(scores, N=2):
+    """
+    mackinnonp(stat, regression='c', N=N) for a whole array of statistics at once
+    args:
+        scores: np.array of Engle-Granger statistics
+        N: number of series in the cointegrating regression, type int
+    returns:
+        np.array of p-values
+    """
+    scores = np.asarray(scores, dtype=float)
+    with np.errstate(invalid='ignore', over='ignore'):
+        small = np.polyval(np.asarray(_tau_smallps['c'][N - 1])[::-1], scores)
+        large = np.polyval(np.asarray(_tau_largeps['c'][N - 1])[::-1], scores)
+        pvalues = norm.cdf(np.where(scores <= _tau_stars['c'][N - 1], small, large))
+    pvalues = np.atleast_1d(pvalues)
+    pvalues[scores > _tau_maxs['c'][N - 1]] = 1.0
+    pvalues[scores < _tau_mins['c'][N - 1]] = 0.0
+    return pvalues
+
+
+def pair_indices(n):
+    """
+    upper triangle (i, j) indices in the same order as the find_cointegrated_pairs loop
+    args:
+        n: number of tickers, type int
+    returns:
+        two np.arrays of ints, row index i and column index j with i < j
+    """
+    return np.triu_indices(n, k=1)
+
+
+def hedge_ratios(centered, idx_i, idx_j):
+    """
+    OLS slope and R^2 of column i regressed on column j (with constant) for every pair
+    args:
+        centered: 2d np.array of prices with column means removed, T x n
+        idx_i: np.array of dependent column indices
+        idx_j: np.array of independent column indices
+    returns:
+        betas (np.array), rsquared (np.array)
+    """
+    cross = centered.T.dot(centered)
+    var = np.diag(cross)
+    cov = cross[idx_i, idx_j]
+    betas = cov / var[idx_j]
+    rsquared = cov * cov / (var[idx_i] * var[idx_j])
+    return betas, rsquared
+
+
+def _design(levels, diffs, lag, first_row, last_row):
+    """
+    ADF regression design for every column of a panel, target appended as last column
+    args:
+        levels: 2d np.array of series levels, T x n
+        diffs: 2d np.array of first differences of levels, (T-1) x n
+        lag: number of lagged differences, type int
+        first_row: first diff index s to include, type int
+        last_row: one past the last diff index s to include, type int
+    returns:
+        3d np.array, rows x n x (lag + 2) holding
+        [level(s), diff(s-1), ..., diff(s-lag), diff(s)]
+    """
+    rows = np.arange(first_row, last_row)
+    design = np.empty((len(rows), levels.shape[1], lag + 2))
+    design[:, :, 0] = levels[rows]
+    for ll in range(1, lag + 1):
+        design[:, :, ll] = diffs[rows - ll]
+    design[:, :, lag + 1] = diffs[rows]
+    return design
+
+
+def _pair_grams(design, idx_i, idx_j, betas, block_size=32):
+    """
+    gram matrices of every pair residual design, built from shared ticker grams. only the
+    tickers of the requested pairs enter a product and sparse tiles multiply their pairs
+    directly, so a pruned pair list costs in proportion to its pairs
+    args:
+        design: 3d np.array from _design, rows x n x m
+        idx_i: np.array of dependent column indices
+        idx_j: np.array of independent column indices
+        betas: np.array of hedge ratios, one per pair
+        block_size: number of dependent tickers per gram tile, bounds memory on large sectors
+    returns:
+        3d np.array, pairs x m x m
+    """
+    rows, n, m = design.shape
+    grams = np.empty((len(idx_i), m, m))
+    used = np.union1d(idx_i, idx_j)
+    diag = np.matmul(design[:, used].transpose(1, 2, 0), design[:, used].transpose(1, 0, 2))
+    pos = np.searchsorted(used, np.arange(n))
+    tickers_i = np.unique(idx_i)
+
+    for start in range(0, len(tickers_i), block_size):
+        tile_i = tickers_i[start:start + block_size]
+        sel = np.nonzero(np.isin(idx_i, tile_i))[0]
+        ii = idx_i[sel]
+        jj = idx_j[sel]
+        # the tile only needs the independent tickers its pairs use
+        tile_j = np.unique(jj)
+        if len(sel) * PAIR_PRODUCT_COST < len(tile_i) * len(tile_j):
+            # a pruned screen leaves the tile sparse, multiply the pairs directly
+            cross = np.empty((len(sel), m, m))
+            for chunk in range(0, len(sel), block_size * 8):
+                part = slice(chunk, chunk + block_size * 8)
+                cross[part] = np.matmul(design[:, ii[part]].transpose(1, 2, 0),
+                                        design[:, jj[part]].transpose(1, 0, 2))
+        else:
+            left = design[:, tile_i].reshape(rows, len(tile_i) * m)
+            right = design[:, tile_j].reshape(rows, len(tile_j) * m)
+            tile = left.T.dot(right).reshape(len(tile_i), m, len(tile_j), m).transpose(0, 2, 1, 3)
+            cross = tile[np.searchsorted(tile_i, ii), np.searchsorted(tile_j, jj)]
+        grams[sel] = _residual_grams(diag[pos[ii]], cross, diag[pos[jj]], betas[sel])
+    return grams
+
+
+def _residual_grams(diag_i, cross, diag_j, betas):
+    # the residual design of (i, j) is Z_i - b * Z_j, so its gram is a
+    # quadratic form in the ticker blocks Z_i'Z_i, Z_i'Z_j and Z_j'Z_j
+    b = betas[:, None, None]
+    return diag_i - b * (cross + cross.transpose(0, 2, 1)) + b * b * diag_j
+
+
+def _nested_aic(grams, nobs):
+    """
+    AIC of every nested ADF regression (lags 0..maxlag) from one cholesky per pair
+    args:
+        grams: 3d np.array, pairs x m x m gram with the target as last column
+        nobs: number of rows used in every regression, type int
+    returns:
+        2d np.array, pairs x (m - 1) AIC values indexed by lag
+    """
+    chol = np.linalg.cholesky(grams)
+    m = grams.shape[1]
+    coefs = chol[:, m - 1, :m - 1] ** 2
+    # ssr of the regression on the first k+1 regressors is the squared target
+    # residual plus the squared projections on the regressors that were left out
+    tail = np.cumsum(coefs[:, ::-1], axis=1)[:, ::-1]
+    tail = np.concatenate([tail[:, 1:], np.zeros((len(grams), 1))], axis=1)
+    ssr = chol[:, m - 1, m - 1][:, None] ** 2 + tail
+    llf = -nobs / 2.0 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+    k_params = np.arange(1, m)
+    return -2.0 * llf + 2.0 * k_params
+
+
+def _tstats(grams, nobs):
+    """
+    t-statistic of the lagged level coefficient for a batch of ADF regressions
+    args:
+        grams: 3d np.array, pairs x m x m gram with the target as last column
+        nobs: number of rows in every regression, type int
+    returns:
+        np.array of ADF statistics
+    """
+    k = grams.shape[1] - 1
+    xx = grams[:, :k, :k]
+    xy = grams[:, :k, k]
+    inv_xx = np.linalg.inv(xx)
+    params = np.einsum('pab,pb->pa', inv_xx, xy)
+    ssr = grams[:, k, k] - np.einsum('pa,pa->p', params, xy)
+    sigma2 = ssr / (nobs - k)
+    return params[:, 0] / np.sqrt(sigma2 * inv_xx[:, 0, 0])
+
+
+def batch_coint(prices, idx_i, idx_j, maxlag=None):
+    """
+    Engle-Granger cointegration statistics for many pairs of one price panel.
+    matches statsmodels coint(S1, S2) with trend 'c' and autolag 'aic'.
+    args:
+        prices: 2d np.array of prices, T x n, no missing values
+        idx_i: np.array of column indices used as S1
+        idx_j: np.array of column indices used as S2
+        maxlag: maximum ADF lag, default None uses the statsmodels rule
+    returns:
+        scores (np.array), pvalues (np.array)
+    """
+    prices = np.asarray(prices, dtype=float)
+    idx_i = np.asarray(idx_i, dtype=int)
+    idx_j = np.asarray(idx_j, dtype=int)
+    n_obs = prices.shape[0]
+    scores = np.full(len(idx_i), -np.inf)
+    if len(idx_i) == 0:
+        return scores, np.zeros(0)
+
+    centered = prices - prices.mean(axis=0)
+    diffs = np.diff(centered, axis=0)
+    betas, rsquared = hedge_ratios(centered, idx_i, idx_j)
+    if maxlag is None:
+        maxlag = default_maxlag(n_obs)
+
+    # collinear pairs keep the -inf statistic like statsmodels does
+    live = np.nonzero(rsquared < COLLINEAR_RSQ)[0]
+    bi = idx_i[live]
+    bj = idx_j[live]
+    bb = betas[live]
+
+    # lag selection uses the common maxlag sample for every candidate lag
+    nobs_max = n_obs - 1 - maxlag
+    design = _design(centered, diffs, maxlag, maxlag, n_obs - 1)
+    grams = _pair_grams(design, bi, bj, bb)
+    try:
+        aic = _nested_aic(grams, nobs_max)
+    except np.linalg.LinAlgError:
+        aic = None
+
+    if aic is None:
+        # a degenerate residual in the batch, let statsmodels handle every pair
+        for pp in live:
+            scores[pp] = ts.coint(prices[:, idx_i[pp]], prices[:, idx_j[pp]], maxlag=maxlag)[0]
+    else:
+        best_lag = np.argmin(aic, axis=1)
+        for lag in np.unique(best_lag):
+            grp = np.nonzero(best_lag == lag)[0]
+            keep = list(range(lag + 1)) + [maxlag + 1]
+            final = grams[grp][:, keep][:, :, keep]
+            if lag < maxlag:
+                # the chosen lag regression also uses the rows the longer lags trimmed
+                resid = centered[:, bi[grp]] - bb[grp] * centered[:, bj[grp]]
+                extra = _design(resid, np.diff(resid, axis=0), lag, lag, maxlag)
+                final = final + np.einsum('rpa,rpb->pab', extra, extra)
+            scores[live[grp]] = _tstats(final, n_obs - 1 - lag)
+
+    pvalues = mackinnon_pvalues(scores)
+    return scores, pvalues
+
+
+def dickey_fuller_stats(prices, idx_i, idx_j):
+    """
+    Dickey-Fuller statistic (no lagged differences) of every pair hedge residual,
+    a cheap stationarity proxy ahead of the full Engle-Granger test
+    args:
+        prices: 2d np.array of prices, T x n, no missing values
+        idx_i: np.array of column indices used as S1
+        idx_j: np.array of column indices used as S2
+    returns:
+        np.array of statistics, nan for collinear pairs
+    """
+    prices = np.asarray(prices, dtype=float)
+    idx_i = np.asarray(idx_i, dtype=int)
+    idx_j = np.asarray(idx_j, dtype=int)
+    if len(idx_i) == 0:
+        return np.zeros(0)
+    centered = prices - prices.mean(axis=0)
+    betas, rsquared = hedge_ratios(centered, idx_i, idx_j)
+    design = _design(centered, np.diff(centered, axis=0), 0, 0, len(prices) - 1)
+    grams = _pair_grams(design, idx_i, idx_j, betas)
+    # one regressor, so the t-statistic needs no matrix inverse
+    nobs = len(prices) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        param = grams[:, 0, 1] / grams[:, 0, 0]
+        sigma2 = (grams[:, 1, 1] - param * grams[:, 0, 1]) / (nobs - 1)
+        return param / np.sqrt(sigma2 / grams[:, 0, 0])
+
+
+def find_cointegrated_pairs_batched(data, p_value=0.01, maxlag=None, cache=None):
+    """
+    batched drop in for find_cointegrated_pairs
+    args:
+        data: needs to be pd_df where each column = individual ticker Adj_Close
+        p_value: threshold for accepting a pairs model (float), default 0.01
+        maxlag: maximum ADF lag, default None uses the statsmodels rule
+        cache: coint_cache.CointCache object, only pairs missing from it are tested.
+               default None tests every pair
+    returns:
+        score_matrix (np.array), pvalue_matrix (np.array), pairs (array)
+    """
+    n = data.shape[1]
+    score_matrix = np.zeros((n, n))
+    pvalue_matrix = np.ones((n, n))
+    keys = data.keys()
+    idx_i, idx_j = pair_indices(n)
+    compute = lambda ii, jj: batch_coint(data.values, ii, jj, maxlag=maxlag)
+    if cache is None:
+        scores, pvalues = compute(idx_i, idx_j)
+    else:
+        scores, pvalues = cache.coint(data, idx_i, idx_j, compute, maxlag)
+    score_matrix[idx_i, idx_j] = scores
+    pvalue_matrix[idx_i, idx_j] = pvalues
+    pairs = [(keys[i], keys[j]) for i, j, pv in zip(idx_i, idx_j, pvalues) if pv < p_value]
+    return score_matrix, pvalue_matrix, pairs
+
+
+# INCREMENTAL SCREENING FROM PER BLOCK SUFFICIENT STATISTICS
+# every entry of a window's hedge regression and ADF design gram is a sum over rows of
+# q(h)q(h)', q(h+l)d(h)' or d(h)d(h-k)' (q = price level, d = first difference).
+# these moments are summed once per block (e.g. per month), so a window is the sum of its
+# blocks with a few edge rows removed, instead of a refit of the raw window
+
+class BlockMoments():
+
+    def __init__(self, prices, block_ids, maxlag):
+        """
+        args:
+            prices: 2d np.array of prices, T x n, NaN where a ticker has no price
+            block_ids: np.array of T non decreasing block labels, ex: year * 12 + month
+            maxlag: largest ADF lag of any window screened, type int
+        """
+        self.prices = np.asarray(prices, dtype=float)
+        self.block_ids = np.asarray(block_ids)
+        self.maxlag = maxlag
+        self.missing = np.isnan(self.prices)
+        n_rows, n = self.prices.shape
+        
+        # a fixed reference level per ticker keeps the level moments well conditioned,
+        # window means are removed when a window is assembled
+        has_price = (~self.missing).any(axis=0)
+        reference = np.zeros(n)
+        reference[has_price] = np.nanmean(self.prices[:, has_price], axis=0)
+        levels = np.nan_to_num(self.prices - reference)
+        diffs = np.nan_to_num(np.diff(self.prices, axis=0))
+        # zero padding so q(h+l) and d(h-k) exist for every row, padded rows only ever
+        # enter edge rows that are removed again
+        self.levels = np.vstack([levels, np.zeros((maxlag + 1, n))])
+        self.diffs = np.vstack([np.zeros((maxlag, n)), diffs, np.zeros((1, n))])
+        
+        labels, self.block_starts = np.unique(self.block_ids, return_index=True)
+        self.block_labels = list(labels)
+        self.block_stops = np.append(self.block_starts[1:], n_rows)
+        self.block_moments = {}
+
+    def row_moments(self, first_row, last_row):
+        """
+        moments summed over rows first_row to last_row - 1
+        returns:
+            3d np.array, (2 * maxlag + 3) x n x n holding q(h)q(h)', q(h+l)d(h)' for
+            l = 0..maxlag and d(h)d(h-k)' for k = 0..maxlag
+        """
+        lag = self.maxlag
+        rows = np.arange(first_row, last_row)
+        levels = self.levels[rows]
+        diffs = self.diffs[rows + lag]
+        moments = np.empty((2 * lag + 3,) + (self.prices.shape[1],) * 2)
+        moments[0] = levels.T.dot(levels)
+        for ll in range(lag + 1):
+            moments[1 + ll] = self.levels[rows + ll].T.dot(diffs)
+        for kk in range(lag + 1):
+            moments[lag + 2 + kk] = diffs.T.dot(self.diffs[rows + lag - kk])
+        return moments
+
+    def release(self, first_row):
+        """
+        drop the cached moments of blocks ending before first_row, windows only move forward
+        """
+        for label, stop in zip(self.block_labels, self.block_stops):
+            if stop <= first_row:
+                self.block_moments.pop(label, None)
+
+    def window_moments(self, first_row, last_row):
+        """
+        moments summed over rows first_row to last_row - 1 from cached blocks, rows of
+        blocks only partly in the window are summed directly
+        """
+        lo = np.searchsorted(self.block_starts, first_row, side='left')
+        hi = np.searchsorted(self.block_stops, last_row, side='right')
+        if lo >= hi:
+            return self.row_moments(first_row, last_row)
+        
+        total = self.row_moments(first_row, self.block_starts[lo])
+        total += self.row_moments(self.block_stops[hi - 1], last_row)
+        for bb in range(lo, hi):
+            label = self.block_labels[bb]
+            if label not in self.block_moments:
+                self.block_moments[label] = self.row_moments(self.block_starts[bb], self.block_stops[bb])
+            total += self.block_moments[label]
+        return total
+
+    def complete(self, cols, first_row, last_row):
+        return not self.missing[first_row:last_row, cols].any()
+
+    def hedge_ratios(self, moments, cols, first_row, last_row, idx_i, idx_j):
+        """
+        same as hedge_ratios on the centered window, from the window moments
+        returns:
+            betas (np.array), rsquared (np.array), window means of the reference levels
+        """
+        n_obs = last_row - first_row
+        means = self.levels[first_row:last_row, cols].mean(axis=0)
+        cross = moments[0][np.ix_(cols, cols)] - n_obs * np.outer(means, means)
+        var = np.diag(cross)
+        cov = cross[idx_i, idx_j]
+        betas = cov / var[idx_j]
+        rsquared = cov * cov / (var[idx_i] * var[idx_j])
+        return betas, rsquared, means
+
+    def design_gram(self, moments, cols, first_row, last_row, means, lag, skip):
+        """
+        ticker gram of the ADF design with lag lagged differences over design rows
+        first_row + skip to last_row - 2, levels centered by the window means.
+        edge rows of the shifted sums are removed from the window moments
+        returns:
+            4d np.array, n x m x n x m with m = lag + 2, columns
+            [level(s), diff(s-1), ..., diff(s-lag), diff(s)]
+        """
+        maxlag = self.maxlag
+        first_design = first_row + skip
+        last_design = last_row - 1
+        n_rows = last_design - first_design
+        n = len(cols)
+        m = lag + 2
+        window = moments[:, cols][:, :, cols]
+        
+        def shifted_sum(index, left, right, shift):
+            # moment summed over the design rows shifted back by shift: the window
+            # moments less the head rows before and the tail rows after that range
+            head = np.arange(first_row, first_design - shift)
+            tail = np.arange(last_design - shift, last_row)
+            return window[index] - left(head).T.dot(right(head)) - left(tail).T.dot(right(tail))
+        
+        level = lambda rows: self.levels[rows][:, cols]
+        diff = lambda rows: self.diffs[rows + maxlag][:, cols]
+        # column of every lag of the difference columns, the level column is handled on its own
+        lag_col = dict([(ll, ll) for ll in range(1, lag + 1)] + [(0, m - 1)])
+        level_sum = self.levels[first_design:last_design, cols].sum(axis=0)
+        
+        # filled column block by column block, then laid out as n x m x n x m
+        blocks = np.empty((m, m, n, n))
+        blocks[0, 0] = (shifted_sum(0, level, level, 0) - np.outer(means, level_sum)
+                        - np.outer(level_sum, means) + n_rows * np.outer(means, means))
+        for ll in range(lag + 1):
+            lead = lambda rows: self.levels[rows + ll][:, cols]
+            # sum of diff(s - ll) over the design rows telescopes to two levels
+            diff_sum = self.levels[last_design - ll, cols] - self.levels[first_design - ll, cols]
+            level_diff = shifted_sum(1 + ll, lead, diff, ll) - np.outer(means, diff_sum)
+            blocks[0, lag_col[ll]] = level_diff
+            blocks[lag_col[ll], 0] = level_diff.T
+        
+        for kk in range(lag + 1):
+            lagged = lambda rows: self.diffs[rows + maxlag - kk][:, cols]
+            # every pair of difference columns kk lags apart
+            for ll in range(lag + 1 - kk):
+                diff_diff = shifted_sum(maxlag + 2 + kk, diff, lagged, ll)
+                blocks[lag_col[ll], lag_col[ll + kk]] = diff_diff
+                blocks[lag_col[ll + kk], lag_col[ll]] = diff_diff.T
+        return np.ascontiguousarray(blocks.transpose(2, 0, 3, 1))
+
+
+def window_coint(block_moments, cols, first_row, last_row, idx_i, idx_j, maxlag=None):
+    """
+    Engle-Granger statistics of many pairs over one window of a BlockMoments panel,
+    same results as batch_coint on the window prices
+    args:
+        block_moments: BlockMoments object of the full panel
+        cols: np.array of panel columns in the window, the window has no missing prices
+        first_row: first panel row of the window, type int
+        last_row: one past the last panel row of the window, type int
+        idx_i: np.array of indices into cols used as S1
+        idx_j: np.array of indices into cols used as S2
+        maxlag: maximum ADF lag, default None uses the statsmodels rule
+    returns:
+        scores (np.array), pvalues (np.array)
+    """
+    idx_i = np.asarray(idx_i, dtype=int)
+    idx_j = np.asarray(idx_j, dtype=int)
+    n_obs = last_row - first_row
+    scores = np.full(len(idx_i), -np.inf)
+    if len(idx_i) == 0:
+        return scores, np.zeros(0)
+    if maxlag is None:
+        maxlag = default_maxlag(n_obs)
+    if maxlag > block_moments.maxlag:
+        raise ValueError("window maxlag {0} above BlockMoments maxlag {1}".format(maxlag, block_moments.maxlag))
+    
+    moments = block_moments.window_moments(first_row, last_row)
+    betas, rsquared, means = block_moments.hedge_ratios(moments, cols, first_row, last_row, idx_i, idx_j)
+    
+    # collinear pairs keep the -inf statistic like statsmodels does
+    live = np.nonzero(rsquared < COLLINEAR_RSQ)[0]
+    bi = idx_i[live]
+    bj = idx_j[live]
+    bb = betas[live]
+    
+    # lag selection uses the common maxlag sample for every candidate lag
+    gram = block_moments.design_gram(moments, cols, first_row, last_row, means, maxlag, maxlag)
+    grams = _residual_grams(gram[bi, :, bi], gram[bi, :, bj], gram[bj, :, bj], bb)
+    try:
+        aic = _nested_aic(grams, n_obs - 1 - maxlag)
+    except np.linalg.LinAlgError:
+        aic = None
+    
+    if aic is None:
+        # a degenerate residual in the batch, refit the window prices directly
+        prices = block_moments.prices[first_row:last_row][:, cols]
+        return batch_coint(prices, idx_i, idx_j, maxlag=maxlag)
+    
+    best_lag = np.argmin(aic, axis=1)
+    for lag in np.unique(best_lag):
+        grp = np.nonzero(best_lag == lag)[0]
+        keep = list(range(lag + 1)) + [maxlag + 1]
+        final = grams[grp][:, keep][:, :, keep]
+        if lag < maxlag:
+            # the chosen lag regression also uses the rows the longer lags trimmed,
+            # they all sit in the first maxlag + 1 rows of the window
+            head = block_moments.levels[first_row:first_row + maxlag + 1, cols] - means
+            resid = head[:, bi[grp]] - bb[grp] * head[:, bj[grp]]
+            extra = _design(resid, np.diff(resid, axis=0), lag, lag, maxlag)
+            final = final + np.einsum('rpa,rpb->pab', extra, extra)
+        scores[live[grp]] = _tstats(final, n_obs - 1 - lag)
+    
+    pvalues = mackinnon_pvalues(scores)
+    return scores, pvalues
+
+
+def find_cointegrated_pairs_incremental(block_moments, keys, cols, first_row, last_row,
+                                        p_value=0.01, maxlag=None, cache=None, dates=None):
+    """
+    find_cointegrated_pairs for the window rows first_row to last_row - 1 of a BlockMoments panel.
+    windows with a missing price are screened on their complete rows like the database path
+    args:
+        block_moments: BlockMoments object of the full panel
+        keys: list of tickers in the window, type string
+        cols: list of panel columns of keys
+        first_row: first panel row of the window, type int
+        last_row: one past the last panel row of the window, type int
+        p_value: threshold for accepting a pairs model (float), default 0.01
+        maxlag: maximum ADF lag, default None uses the statsmodels rule
+        cache: coint_cache.CointCache object, only pairs missing from it are tested.
+               needs dates, default None tests every pair
+        dates: panel row dates, np.array of datetime64
+    returns:
+        score_matrix (np.array), pvalue_matrix (np.array), pairs (array)
+    """
+    cols = np.asarray(cols, dtype=int)
+    if not block_moments.complete(cols, first_row, last_row):
+        prices = block_moments.prices[first_row:last_row][:, cols]
+        index = None if dates is None else dates[first_row:last_row]
+        data = pd.DataFrame(prices, columns=list(keys), index=index).dropna()
+        return find_cointegrated_pairs_batched(data, p_value=p_value, maxlag=maxlag, cache=cache)
+    
+    n = len(cols)
+    score_matrix = np.zeros((n, n))
+    pvalue_matrix = np.ones((n, n))
+    idx_i, idx_j = pair_indices(n)
+    compute = lambda ii, jj: window_coint(block_moments, cols, first_row, last_row, ii, jj, maxlag=maxlag)
+    if cache is None:
+        scores, pvalues = compute(idx_i, idx_j)
+    else:
+        scores, pvalues = cache.lookup(keys, dates[first_row:last_row], block_moments.prices[first_row:last_row][:, cols],
+                                       idx_i, idx_j, compute, maxlag)
+    score_matrix[idx_i, idx_j] = scores
+    pvalue_matrix[idx_i, idx_j] = pvalues
+    pairs = [(keys[i], keys[j]) for i, j, pv in zip(idx_i, idx_j, pvalues) if pv < p_value]
+    return score_matrix, pvalue_matrix, pairs
@@ -18,6 +18,13 @@ import functools
 from itertools import combinations
 import statsmodels.api as sm
 
+import coint_engine
+import aligned_panel
+import data_sources
+import instrumentation
+import price_cache
+import trading_calendar
+
 def build_dict_of_arrays(list_of_tups):
     """
     create a dictionary from list of tuples. key = sector, values = array of tickers
@@ -40,14 +47,22 @@ def build_dict_of_arrays(list_of_tups):
             
     return sector_dict
 
+@instrumentation.timed('merge')
 def data_array_merge(data_array):
     """
-    merge all dfs into one dfs
+    merge all dfs into one dfs. every df is aligned in one pass by aligned_panel, same
+    result as the chain of inner merges in data_array_merge_reference
     args:
         data_array: array of pandas df
     returns:
         merged_df, single pandas dataframe
     """
+    return aligned_panel.from_frames(data_array).inner()
+
+def data_array_merge_reference(data_array):
+    """
+    original chain of pairwise inner merges on Date, kept to verify data_array_merge
+    """
     merged_df = functools.reduce(lambda left,right: pd.merge(left,right,on='Date'), data_array)
     merged_df.set_index('Date', inplace=True)
     return merged_df
@@ -57,20 +72,11 @@ def fetch_last_day_mth(year_, conn):
     return date of the last day of data we have for a given year in our Postgres DB. 
     args:
         year_: year, type int
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
     return:
         integer, last trading day of year that we have data for
     """  
-    cur = conn.cursor()
-    SQL =   """
-            SELECT MAX(date_part('day', date_price)) FROM daily_data
-            WHERE date_price BETWEEN '%s-12-01' AND '%s-12-31'
-            """
-    cur.execute(SQL, [year_,year_])        
-    data = cur.fetchall()
-    cur.close()
-    last_day = int(data[0][0])
-    return last_day
+    return fetch_last_day_any_mth(year_, 12, conn)
 
 def fetch_last_day_any_mth(year_, mth_, conn):
     """
@@ -78,31 +84,38 @@ def fetch_last_day_any_mth(year_, mth_, conn):
     args:
         year_: year, type int
         mth_: month, type int
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
     return:
-        integer, last trading day of year that we have data for
+        integer, last trading day of month that we have data for
     """  
-    cur = conn.cursor()
-    SQL =   """
-            SELECT MAX(date_part('day', date_price)) FROM daily_data
-            WHERE date_price BETWEEN '%s-%s-01' AND '%s-%s-30'
-            """
-    cur.execute(SQL, [year_,mth_, year_, mth_])        
-    data = cur.fetchall()
-    cur.close()
-    last_day = int(data[0][0])
-    return last_day
-
-def find_cointegrated_pairs(data, p_value=0.01):
+    last_session = get_calendar(conn).last_session_of_month(year_, mth_)
+    if last_session is None:
+        raise ValueError("no trading days in {0}-{1:02d}".format(year_, mth_))
+    return last_session.day
+
+@instrumentation.timed('cointegration')
+def find_cointegrated_pairs(data, p_value=0.01, batched=True, cascade=None, cache=None):
     """
     statsmodels.tsa.stattools coint method for identifying pairs
     args:
         data: needs to be pd_df where each column = individual ticker Adj_Close
         p_value: threshold for accepting a pairs model (float), default 0.01
+        batched: run all pairs at once through coint_engine (bool), default True
+                 False runs the reference statsmodels coint loop
+        cascade: screening_cascade.ScreeningCascade object, only pairs surviving its
+                 pre-filter stages are tested. default None tests every pair
+        cache: coint_cache.CointCache object, the batched and cascade screens only test
+               pairs missing from it. default None tests every pair
     returns:
         score_matrix (np.array), pvalue_matrix (np.array), pairs (array)
     """
     n = data.shape[1]
+    instrumentation.count('pairs_screened', n * (n - 1) // 2)
+    if cascade is not None:
+        return cascade.find_cointegrated_pairs(data, p_value, cache)
+    if batched:
+        return coint_engine.find_cointegrated_pairs_batched(data, p_value, cache=cache)
+
     score_matrix = np.zeros((n, n))
     pvalue_matrix = np.ones((n, n))
     keys = data.keys()
@@ -124,89 +137,157 @@ def load_db_credential_info(f_name_path):
     """
     load text file holding our database credential info and the database name
     args:
-        f_name_path: name of file preceded with "\\", type string
+        f_name_path: name of file in the working directory, ex: "database_info.txt".
+                     a leading "\\" or "/" is ignored
     returns:
         array of 4 values that should match text file info
     """
     cur_path = os.getcwd()
     # lets load our database credentials and info
-    f = open(cur_path + f_name_path, 'r')
-    lines = f.readlines()[1:]
+    with open(os.path.join(cur_path, f_name_path.lstrip("\\/")), 'r') as f:
+        lines = f.readlines()[1:]
     lines = lines[0].split(',')
     return lines
 
+def connect_db(db_info):
+    """
+    connect to the database named in our credential info
+    args:
+        db_info: array of db_host, db_user, db_password, db_name from load_db_credential_info
+    returns:
+        a Postgres DB connection object, or a data_sources.EmbeddedSource when db_host is "embedded"
+    """
+    return data_sources.connect(db_info)
+
+@instrumentation.timed('query')
 def load_db_tickers_start_date(start_date, conn):
     """
     return a list of stock tickers that have data on the start_date arg provided
     args:
         start_date: datetime object to be used to query or PostgreSQL database
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
     returns:
         list of tuples
     """
     # convert start_date to string for our SQL query
     date_string = start_date.strftime("%Y-%m-%d")
-    
-    cur = conn.cursor()
-    SQL =   """
-            SELECT ticker FROM symbol
-            WHERE id IN
-              (SELECT DISTINCT(stock_id) 
-               FROM daily_data
-               WHERE date_price = %s)
-            """
-    cur.execute(SQL, (date_string,))        
-    data = cur.fetchall()
+    data = data_sources.get_source(conn).tickers_on_date(date_string, with_sector=False)
     return data
 
+@instrumentation.timed('query')
 def load_db_tickers_sectors(start_date, conn):
     """
     return a list of tuples. each tuple is a ticker paired with it's sector
     args:
         start_date: datetime object to be used to query or PostgreSQL database
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
     returns:
         list of tuples
     """
     # convert start_date to string for our SQL query
     date_string = start_date.strftime("%Y-%m-%d")
-    cur = conn.cursor()
-    SQL =   """
-            SELECT ticker, sector FROM symbol
-            WHERE id IN
-              (SELECT DISTINCT(stock_id) 
-               FROM daily_data
-               WHERE date_price = %s)
-            """
-    cur.execute(SQL, (date_string,))        
-    data = cur.fetchall()
+    data = data_sources.get_source(conn).tickers_on_date(date_string, with_sector=True)
     return data
 
-def load_df_stock_data_array(stocks, start_date, end_date, conn):
+# local price cache shared by all loaders, opened on first use
+_price_cache = None
+
+def get_price_cache():
+    """
+    return the local price cache if one has been built, otherwise None
+    returns:
+        price_cache.PriceCache object or None
+    """
+    global _price_cache
+    if _price_cache is None:
+        cache = price_cache.PriceCache()
+        if not cache.exists():
+            return None
+        _price_cache = cache
+    return _price_cache
+
+# trading calendar shared by all date lookups, loaded on first use
+_calendar = None
+
+def get_calendar(conn):
+    """
+    return the trading calendar, loaded once per process from the price cache dates,
+    or from the distinct dates in daily_data when there is no price cache
+    args:
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        trading_calendar.TradingCalendar object
+    """
+    global _calendar
+    if _calendar is None:
+        cache = get_price_cache()
+        if cache is not None:
+            _calendar = trading_calendar.TradingCalendar(cache.dates)
+        else:
+            _calendar = trading_calendar.TradingCalendar(data_sources.get_source(conn).trading_dates())
+    return _calendar
+
+def refresh_price_cache(conn):
+    """
+    build the local price cache or append the rows newer than its last date
+    args:
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        integer, number of rows added to the cache
+    """
+    global _price_cache, _calendar
+    cache = price_cache.PriceCache()
+    rows_added = cache.refresh(conn)
+    _price_cache = cache
+    # new dates reach the calendar on its next use
+    _calendar = None
+    print("Price cache refreshed with {0} rows.".format(rows_added))
+    return rows_added
+
+def cached_ticker_dfs(stocks, start_date, end_date, cache, value_col=None):
+    """
+    per ticker dataframes sliced from the price cache, same layout as the per ticker SQL loaders
+    args:
+        stocks: tuple of strings, each string is ticker
+        start_date: datetime object, data starts after this date
+        end_date: datetime object, data ends on or before this date
+        cache: price_cache.PriceCache object
+        value_col: name of the price column, type string. None names it after the ticker
+    returns:
+        array of pandas dataframe, each dataframe is stock data
+    """
+    panel = cache.panel(stocks, start_date, end_date)
+    array_pd_dfs = []
+    for col, ticker in enumerate(stocks):
+        stock_data = panel.iloc[:, col].dropna().reset_index()
+        stock_data.columns = ['Date', ticker if value_col is None else value_col]
+        array_pd_dfs.append(stock_data)
+    return array_pd_dfs
+
+@instrumentation.timed('query')
+def load_df_stock_data_array(stocks, start_date, end_date, conn, use_cache=True):
     """
     return an array where each element is a dataframe of loaded data
     args:
         stocks: tuple of strings, each string is ticker
         start_date: datetime object to filter our pandas dataframe
         end_date: datetime object to filter our pandas dataframe
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+        use_cache: read from the local price cache when it exists, type bool
     returns:
         array of pandas dataframe, each dataframe is stock data
     """    
+    cache = get_price_cache() if use_cache else None
+    if cache is not None:
+        return cached_ticker_dfs(stocks, start_date, end_date, cache)
+
     array_pd_dfs = []    
 
-    cur = conn.cursor()
-    SQL = """
-          SELECT date_price, adj_close_price 
-          FROM daily_data 
-          INNER JOIN symbol ON symbol.id = daily_data.stock_id 
-          WHERE symbol.ticker LIKE %s
-          """
+    source = data_sources.get_source(conn)
     # for each ticker in our pair
     for ticker in stocks:
         # fetch our stock data from our Postgres DB
-        cur.execute(SQL, (ticker,))
-        results = cur.fetchall()
+        results = source.ticker_history(ticker)
         # create a pandas dataframe of our results
         stock_data = pd.DataFrame(results, columns=['Date', ticker])
         # ensure our data is in order of date
@@ -224,31 +305,51 @@ def load_df_stock_data_array(stocks, start_date, end_date, conn):
         
     return array_pd_dfs
 
-def load_pairs_stock_data(pair, start_date, end_date, conn):
+@instrumentation.timed('query')
+def load_price_panel(stocks, start_date, end_date, conn, use_cache=True):
+    """
+    load every ticker for a date range with one query into a wide Date x ticker panel
+    args:
+        stocks: tuple or list of strings, each string is ticker
+        start_date: datetime object, panel starts after this date
+        end_date: datetime object, panel ends on or before this date
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+        use_cache: read from the local price cache when it exists, type bool
+    returns:
+        pandas dataframe indexed by Date, one float64 column per ticker in stocks order.
+        days a ticker has no data are NaN, use .dropna() for the inner merge
+        that data_array_merge returns
+    """
+    cache = get_price_cache() if use_cache else None
+    if cache is not None:
+        return cache.panel(stocks, start_date, end_date)
+
+    return data_sources.get_source(conn).price_panel(stocks, start_date, end_date)
+
+@instrumentation.timed('query')
+def load_pairs_stock_data(pair, start_date, end_date, conn, use_cache=True):
     """
     return a list of tuples. each tuple is a ticker paired with it's sector
     args:
         pair: tuple of two strings, each string is ticker
         start_date: datetime object to filter our pandas dataframe
         end_date: datetime object to filter our pandas dataframe
-        conn: a Postgres DB connection object
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+        use_cache: read from the local price cache when it exists, type bool
     returns:
         array of pandas dataframe, each dataframe is stock data
     """    
+    cache = get_price_cache() if use_cache else None
+    if cache is not None:
+        return cached_ticker_dfs(pair, start_date, end_date, cache, 'Adj_Close')
+
     array_pd_dfs = []    
 
-    cur = conn.cursor()
-    SQL = """
-          SELECT date_price, adj_close_price 
-          FROM daily_data 
-          INNER JOIN symbol ON symbol.id = daily_data.stock_id 
-          WHERE symbol.ticker LIKE %s
-          """
+    source = data_sources.get_source(conn)
     # for each ticker in our pair
     for ticker in pair:
         # fetch our stock data from our Postgres DB
-        cur.execute(SQL, (ticker,))
-        results = cur.fetchall()
+        results = source.ticker_history(ticker)
         # create a pandas dataframe of our results
         stock_data = pd.DataFrame(results, columns=['Date', 'Adj_Close'])
         # ensure our data is in order of date
@@ -266,10 +367,40 @@ def load_pairs_stock_data(pair, start_date, end_date, conn):
         
     return array_pd_dfs
 
+@instrumentation.timed('merge')
 def pair_data_verifier(array_df_data, pair_tickers, threshold=10):
     """
     merge two dataframes, verify if we still have the same number of data we originally had.
     use an inputted threshold that tells us whether we've lost too much data in our merge or not.
+    for many pairs of one sector use aligned_panel.AlignedPanel.verify_pairs, which checks
+    every pair with one product of the validity mask
+    args:
+        array_df_data: array of two pandas dataframes
+        pair_tickers: tuple of both tickers
+        threshold: integer, max number of days of data we can be missing after merging two
+                            dataframes of data.
+                   default = 10 to represent 10 days.
+    returns:
+        boolean False or new merged pandas dataframe
+        
+        False: if our new merged dataframe is missing too much data (> threshold)
+        merged pandas dataframe: if our pd.dataframe index length is < threshold
+    """
+    panel = aligned_panel.from_frames(array_df_data, pair_tickers)
+    
+    if not panel.verify_pairs([tuple(pair_tickers)], threshold)[0]:
+        instrumentation.count('pairs_missing_data')
+        instrumentation.progress('missing_data', "This pair {0} and {1} were missing data.",
+                                 pair_tickers[0], pair_tickers[1])
+        return False
+    else:
+        return panel.pair_frame(pair_tickers)
+
+def pair_data_verifier_reference(array_df_data, pair_tickers, threshold=10):
+    """
+    original pair_data_verifier, one pd.merge per pair, kept to verify pair_data_verifier.
+    merge two dataframes, verify if we still have the same number of data we originally had.
+    use an inputted threshold that tells us whether we've lost too much data in our merge or not.
     args:
         array_df_data: array of two pandas dataframes
         pair_tickers: tuple of both tickers
@@ -303,7 +434,8 @@ def pair_data_verifier(array_df_data, pair_tickers, threshold=10):
 #        time.sleep(2)
     
     if (old_size_1 - new_size) > threshold or (old_size_2 - new_size) > threshold:
-        print("This pair {0} and {1} were missing data.".format(stock_1, stock_2))
+        instrumentation.count('pairs_missing_data')
+        instrumentation.progress('missing_data', "This pair {0} and {1} were missing data.", stock_1, stock_2)
         return False
     else:
         return df_merged
@@ -364,6 +496,7 @@ def remove_ticker(ticker, array_pairs_to_clean):
             clean_pairs.append(pair)
     return clean_pairs
 
+@instrumentation.timed('file_write')
 def write_dict_text(f_name, dict_):
     """
     write dictionary info to text file.
@@ -382,9 +515,11 @@ def write_dict_text(f_name, dict_):
         for ele in ticker_arr:
             new_str = (sector + "," + str(ele)).replace("(","").replace(")","").replace("'","").replace(" ","")
             file_to_write.write("%s\n" % (new_str,)) 
+    file_to_write.close()
 
-    print("{0} file created.".format(f_name))
+    instrumentation.progress('file_created', "{0} file created.", f_name)
     
+@instrumentation.timed('file_write')
 def write_results_text_file(f_name, sub_array):
     """
     write an array to text file. This python script will write data into script directory.
@@ -399,4 +534,5 @@ def write_results_text_file(f_name, sub_array):
     file_to_write = open(f_name, 'w')
 
     for ele in sub_array:
-        file_to_write.write("%s\n" % (ele,)) 
\ No newline at end of file
+        file_to_write.write("%s\n" % (ele,))
+    file_to_write.close()
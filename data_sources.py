@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:52:16 2026
+
+"""
+
+# DATA SOURCES - THE QUERIES BEHIND THE COMMON_METHODS LOADERS
+# every loader in common_methods asks get_source(conn) for its data, so the same scripts run
+# against the PostgreSQL securities_master database or an embedded copy of it
+#
+# PostgresSource  a psycopg2 connection to securities_master
+# EmbeddedSource  an in-process SQLite file with the symbol and daily_data columns the
+#                 loaders use. daily_data is clustered by (stock_id, date_price), so a
+#                 ticker's history is one contiguous range scan
+#
+# database_info.txt with database_host = embedded opens database_name as an EmbeddedSource
+
+import io
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+EMBEDDED_HOST = "embedded"
+
+# every price of a list of tickers in a date range, one row per ticker and day
+PRICE_PANEL_SQL = """
+                  SELECT date_price, ticker, adj_close_price
+                  FROM daily_data
+                  INNER JOIN symbol ON symbol.id = daily_data.stock_id
+                  WHERE symbol.ticker = ANY(%s)
+                  AND date_price > %s AND date_price <= %s
+                  """
+
+EXPORT_SQL = """
+             SELECT ticker, date_price, adj_close_price
+             FROM daily_data
+             INNER JOIN symbol ON symbol.id = daily_data.stock_id
+             """
+
+EMBEDDED_SCHEMA = """
+                  CREATE TABLE IF NOT EXISTS symbol (
+                      id INTEGER PRIMARY KEY,
+                      ticker TEXT NOT NULL,
+                      sector TEXT
+                  );
+                  CREATE TABLE IF NOT EXISTS daily_data (
+                      stock_id INTEGER NOT NULL,
+                      date_price TEXT NOT NULL,
+                      adj_close_price REAL,
+                      PRIMARY KEY (stock_id, date_price)
+                  ) WITHOUT ROWID;
+                  CREATE INDEX IF NOT EXISTS idx_symbol_ticker ON symbol(ticker);
+                  """
+
+DATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_daily_data_date ON daily_data(date_price, stock_id)"
+
+
+def price_rows_panel(results, stocks):
+    """
+    pivot (date, ticker, price) rows of PRICE_PANEL_SQL into a Date x ticker panel
+    args:
+        results: list of tuples (date_price, ticker, adj_close_price)
+        stocks: tuple or list of strings, column order of the panel
+    returns:
+        pandas dataframe indexed by Date, one float64 column per ticker in stocks order
+    """
+    stock_data = pd.DataFrame(results, columns=['Date', 'Ticker', 'Adj_Close'])
+    stock_data['Adj_Close'] = stock_data['Adj_Close'].astype(float)
+    panel = stock_data.pivot(index='Date', columns='Ticker', values='Adj_Close')
+    # keep the requested column order, tickers without data become all NaN columns
+    panel = panel.reindex(columns=list(stocks)).sort_index().astype(np.float64)
+    panel.columns.name = None
+    return panel
+
+
+def iso_dates(values):
+    # 'YYYY-MM-DD' strings to datetime.date objects, like psycopg2 returns for a date column
+    return np.asarray(values, dtype='datetime64[D]').astype(object)
+
+
+class PostgresSource():
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def trading_dates(self):
+        # every distinct date in daily_data, sorted, for trading_calendar.TradingCalendar
+        cur = self.conn.cursor()
+        SQL =   """
+                SELECT DISTINCT date_price FROM daily_data
+                ORDER BY date_price
+                """
+        cur.execute(SQL)
+        data = cur.fetchall()
+        cur.close()
+        return np.array([row[0] for row in data], dtype='datetime64[D]')
+
+    def tickers_on_date(self, date_string, with_sector):
+        cur = self.conn.cursor()
+        SQL =   """
+                SELECT ticker{0} FROM symbol
+                WHERE id IN
+                  (SELECT DISTINCT(stock_id)
+                   FROM daily_data
+                   WHERE date_price = %s)
+                """.format(", sector" if with_sector else "")
+        cur.execute(SQL, (date_string,))
+        data = cur.fetchall()
+        cur.close()
+        return data
+
+    def ticker_history(self, ticker):
+        cur = self.conn.cursor()
+        SQL = """
+              SELECT date_price, adj_close_price
+              FROM daily_data
+              INNER JOIN symbol ON symbol.id = daily_data.stock_id
+              WHERE symbol.ticker LIKE %s
+              """
+        cur.execute(SQL, (ticker,))
+        results = cur.fetchall()
+        cur.close()
+        return results
+
+    def price_panel(self, stocks, start_date, end_date):
+        cur = self.conn.cursor()
+        cur.execute(PRICE_PANEL_SQL, (list(stocks), start_date, end_date))
+        results = cur.fetchall()
+        cur.close()
+        return price_rows_panel(results, stocks)
+
+    def export_rows(self, after_date=None):
+        """
+        bulk export of daily_data rows with COPY ... TO STDOUT
+        args:
+            after_date: datetime object, only export rows after this date. None exports all
+        returns:
+            pandas dataframe with columns Ticker, Date (datetime64), Adj_Close (float64)
+        """
+        cur = self.conn.cursor()
+        SQL = EXPORT_SQL
+        if after_date is not None:
+            SQL = cur.mogrify(SQL + " WHERE date_price > %s", (after_date,)).decode()
+        buffer = io.StringIO()
+        cur.copy_expert("COPY ({0}) TO STDOUT WITH CSV".format(SQL), buffer)
+        cur.close()
+        buffer.seek(0)
+        return pd.read_csv(buffer, names=['Ticker', 'Date', 'Adj_Close'],
+                           dtype={'Ticker': str, 'Adj_Close': np.float64}, parse_dates=['Date'])
+
+    def export_table(self, SQL, columns):
+        # one COPY of a query into a dataframe, used to fill an EmbeddedSource
+        cur = self.conn.cursor()
+        buffer = io.StringIO()
+        cur.copy_expert("COPY ({0}) TO STDOUT WITH CSV".format(SQL), buffer)
+        cur.close()
+        buffer.seek(0)
+        return pd.read_csv(buffer, names=columns, keep_default_na=False, na_values=[''])
+
+
+class EmbeddedSource():
+
+    def __init__(self, path):
+        """
+        args:
+            path: SQLite file, created with an empty schema if missing, type string
+        """
+        self.path = path
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(EMBEDDED_SCHEMA)
+        self.conn.execute(DATE_INDEX_SQL)
+
+    # same transaction methods as a psycopg2 connection, scripts close or roll back either
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def trading_dates(self):
+        # DISTINCT reads the (date_price, stock_id) index, not the table
+        SQL = """
+              SELECT DISTINCT date_price FROM daily_data
+              ORDER BY date_price
+              """
+        return np.array([row[0] for row in self.conn.execute(SQL)], dtype='datetime64[D]')
+
+    def tickers_on_date(self, date_string, with_sector):
+        SQL = """
+              SELECT ticker{0} FROM symbol
+              WHERE id IN
+                (SELECT stock_id
+                 FROM daily_data
+                 WHERE date_price = ?)
+              """.format(", sector" if with_sector else "")
+        return self.conn.execute(SQL, (date_string,)).fetchall()
+
+    def ticker_history(self, ticker):
+        SQL = """
+              SELECT date_price, adj_close_price
+              FROM daily_data
+              INNER JOIN symbol ON symbol.id = daily_data.stock_id
+              WHERE symbol.ticker = ?
+              """
+        rows = self.conn.execute(SQL, (ticker,)).fetchall()
+        if not rows:
+            return []
+        dates, prices = zip(*rows)
+        return list(zip(iso_dates(dates), prices))
+
+    def price_panel(self, stocks, start_date, end_date):
+        # one range scan per ticker over the clustered primary key
+        SQL = """
+              SELECT date_price, ticker, adj_close_price
+              FROM symbol
+              INNER JOIN daily_data ON daily_data.stock_id = symbol.id
+              WHERE symbol.ticker IN (SELECT value FROM json_each(?))
+              AND date_price > ? AND date_price <= ?
+              """
+        rows = self.conn.execute(SQL, (json.dumps(list(stocks)), start_date.strftime("%Y-%m-%d"),
+                                       end_date.strftime("%Y-%m-%d"))).fetchall()
+        if not rows:
+            return price_rows_panel([], stocks)
+        dates, tickers, prices = zip(*rows)
+        return price_rows_panel(list(zip(iso_dates(dates), tickers, prices)), stocks)
+
+    def export_rows(self, after_date=None):
+        """
+        every daily_data row, same layout as PostgresSource.export_rows
+        """
+        SQL = EXPORT_SQL
+        params = ()
+        if after_date is not None:
+            SQL = SQL + " WHERE date_price > ?"
+            params = (after_date.strftime("%Y-%m-%d"),)
+        rows = pd.read_sql_query(SQL, self.conn, params=params)
+        rows.columns = ['Ticker', 'Date', 'Adj_Close']
+        rows['Date'] = pd.to_datetime(rows['Date'])
+        rows['Adj_Close'] = rows['Adj_Close'].astype(np.float64)
+        return rows
+
+    def load_frames(self, symbols, daily):
+        """
+        bulk insert symbol and daily_data rows in one transaction, existing rows are replaced
+        args:
+            symbols: pandas dataframe with columns id, ticker, sector
+            daily: pandas dataframe with columns stock_id, date_price, adj_close_price
+        returns:
+            integer, number of daily_data rows loaded
+        """
+        # insert in primary key order, each ticker's rows are appended to the end of the table
+        daily = daily.sort_values(['stock_id', 'date_price'], kind='stable')
+        dates = pd.to_datetime(daily['date_price']).dt.strftime("%Y-%m-%d")
+        prices = daily['adj_close_price'].astype(float)
+        symbol_rows = [(int(row[0]), row[1], None if pd.isnull(row[2]) else row[2])
+                       for row in symbols[['id', 'ticker', 'sector']].itertuples(index=False)]
+        daily_rows = zip(daily['stock_id'].astype(int).tolist(), dates.tolist(),
+                         [None if np.isnan(price) else price for price in prices.tolist()])
+        with self.conn:
+            # the date index is rebuilt once after the load instead of updated row by row
+            self.conn.execute("DROP INDEX IF EXISTS idx_daily_data_date")
+            self.conn.executemany("INSERT OR REPLACE INTO symbol VALUES (?,?,?)", symbol_rows)
+            self.conn.executemany("INSERT OR REPLACE INTO daily_data VALUES (?,?,?)", daily_rows)
+            self.conn.execute(DATE_INDEX_SQL)
+        self.conn.execute("ANALYZE")
+        return len(daily)
+
+    def import_postgres(self, conn):
+        """
+        copy the symbol and daily_data columns the loaders use from securities_master
+        args:
+            conn: a Postgres DB connection object
+        returns:
+            integer, number of daily_data rows loaded
+        """
+        source = PostgresSource(conn)
+        symbols = source.export_table("SELECT id, ticker, sector FROM symbol", ['id', 'ticker', 'sector'])
+        daily = source.export_table("SELECT stock_id, date_price, adj_close_price FROM daily_data",
+                                    ['stock_id', 'date_price', 'adj_close_price'])
+        return self.load_frames(symbols, daily)
+
+    def import_csv(self, symbol_csv, daily_csv):
+        """
+        load CSV files with a header row of column names
+        args:
+            symbol_csv: path of a file with columns id, ticker, sector
+            daily_csv: path of a file with columns stock_id, date_price, adj_close_price
+        returns:
+            integer, number of daily_data rows loaded
+        """
+        symbols = pd.read_csv(symbol_csv, keep_default_na=False, na_values=[''])
+        daily = pd.read_csv(daily_csv)
+        return self.load_frames(symbols, daily)
+
+
+def get_source(conn):
+    """
+    data source for a connection argument of the common_methods loaders
+    args:
+        conn: a Postgres DB connection object or an EmbeddedSource
+    returns:
+        PostgresSource or EmbeddedSource
+    """
+    if isinstance(conn, (EmbeddedSource, PostgresSource)):
+        return conn
+    return PostgresSource(conn)
+
+
+def is_embedded(db_info):
+    return db_info[0].strip() == EMBEDDED_HOST
+
+
+def connect(db_info):
+    """
+    open the database named in database_info.txt
+    args:
+        db_info: array of db_host, db_user, db_password, db_name
+    returns:
+        EmbeddedSource when db_host is "embedded" (db_name is the SQLite file),
+        otherwise a Postgres DB connection object
+    """
+    db_host, db_user, db_password, db_name = [value.strip() for value in db_info]
+    if is_embedded(db_info):
+        return EmbeddedSource(db_name)
+    return psycopg2.connect(host=db_host,database=db_name, user=db_user, password=db_password)
+
+
+def main():
+    # copy securities_master from the PostgreSQL database in database_info.txt into an
+    # embedded file. point database_info.txt at it with: embedded,,,securities_master.sqlite
+    with open("database_info.txt") as f:
+        db_info = f.readlines()[1].split(',')
+    conn = connect(db_info)
+    embedded = EmbeddedSource("securities_master.sqlite")
+    print("Imported {0} daily_data rows.".format(embedded.import_postgres(conn)))
+    embedded.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
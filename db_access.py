@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:05:44 2026
+
+"""
+
+# POOLED DATABASE ACCESS - CONCURRENT QUERIES OVER A CONNECTION POOL
+# AsyncDataAccess runs blocking psycopg2 queries on a thread pool from asyncio, every query
+# borrows a connection from a psycopg2 ThreadedConnectionPool, so the per-window universe,
+# calendar and price queries of many windows run at the same time.
+# price rows are streamed in batches from a server-side (named) cursor.
+# DataAccess is the synchronous facade: same method names and arguments as the
+# common_methods loaders, without the conn argument
+
+import asyncio
+import datetime
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import psycopg2.pool
+
+import common_methods as cm
+import data_sources
+
+TRADING_DATES_SQL = """
+                    SELECT DISTINCT date_price FROM daily_data
+                    WHERE date_price > %s AND date_price <= %s
+                    ORDER BY date_price
+                    """
+
+# names of server-side cursors, unique within the process
+_cursor_ids = itertools.count()
+
+
+class AsyncDataAccess():
+
+    def __init__(self, db_info, max_conn=8):
+        """
+        args:
+            db_info: array of db_host, db_user, db_password, db_name
+            max_conn: most connections open at once, also the most queries in flight
+        """
+        db_host, db_user, db_password, db_name = db_info
+        self.max_conn = max_conn
+        self.pool = psycopg2.pool.ThreadedConnectionPool(1, max_conn, host=db_host, database=db_name,
+                                                         user=db_user, password=db_password)
+        self.executor = ThreadPoolExecutor(max_workers=max_conn)
+        # created on first use, inside the running event loop
+        self.slots = None
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.closeall()
+
+    def get_slots(self):
+        # one slot per pooled connection, so a borrowed connection is never refused
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_conn)
+        return self.slots
+
+    def call(self, func, args):
+        # runs on an executor thread: borrow a connection, run func(*args, conn), hand it back
+        conn = self.pool.getconn()
+        try:
+            result = func(*args, conn)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    async def run(self, func, *args):
+        """
+        run a blocking loader that takes conn as its last argument on a pooled connection
+        args:
+            func: ex: cm.load_db_tickers_sectors
+            args: func arguments before conn
+        returns:
+            func result
+        """
+        async with self.get_slots():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.call, func, args)
+
+    async def fetch_last_day_mth(self, year_):
+        return await self.run(cm.fetch_last_day_mth, year_)
+
+    async def fetch_last_day_any_mth(self, year_, mth_):
+        return await self.run(cm.fetch_last_day_any_mth, year_, mth_)
+
+    async def load_db_tickers_start_date(self, start_date):
+        return await self.run(cm.load_db_tickers_start_date, start_date)
+
+    async def load_db_tickers_sectors(self, start_date):
+        return await self.run(cm.load_db_tickers_sectors, start_date)
+
+    async def load_trading_dates(self, start_date, end_date):
+        """
+        every date with price data in (start_date, end_date], in order
+        returns:
+            list of datetime.date
+        """
+        def trading_dates(start_date, end_date, conn):
+            cur = conn.cursor()
+            cur.execute(TRADING_DATES_SQL, (start_date, end_date))
+            data = [row[0] for row in cur.fetchall()]
+            cur.close()
+            return data
+        return await self.run(trading_dates, start_date, end_date)
+
+    async def stream_prices(self, stocks, start_date, end_date, batch_size=50000):
+        """
+        rows of data_sources.PRICE_PANEL_SQL from a server-side cursor, batch_size rows at a time,
+        so a large window is never held twice in memory on the client
+        args:
+            stocks: tuple or list of strings, each string is ticker
+            start_date: datetime object, rows after this date
+            end_date: datetime object, rows on or before this date
+            batch_size: rows fetched per round trip, type int
+        returns:
+            async iterator of lists of tuples (date_price, ticker, adj_close_price)
+        """
+        async with self.get_slots():
+            loop = asyncio.get_running_loop()
+            conn = await loop.run_in_executor(self.executor, self.pool.getconn)
+            try:
+                # named cursors live on the server and need the open transaction
+                cur = conn.cursor(name="price_stream_{0}".format(next(_cursor_ids)))
+                await loop.run_in_executor(self.executor, cur.execute, data_sources.PRICE_PANEL_SQL,
+                                           (list(stocks), start_date, end_date))
+                while True:
+                    rows = await loop.run_in_executor(self.executor, cur.fetchmany, batch_size)
+                    if not rows:
+                        break
+                    yield rows
+                cur.close()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self.pool.putconn(conn)
+
+    async def load_price_panel(self, stocks, start_date, end_date, use_cache=True):
+        """
+        same panel as cm.load_price_panel, queried through a streamed server-side cursor
+        """
+        cache = cm.get_price_cache() if use_cache else None
+        if cache is not None:
+            return cache.panel(stocks, start_date, end_date)
+        results = []
+        async for rows in self.stream_prices(stocks, start_date, end_date):
+            results.extend(rows)
+        return data_sources.price_rows_panel(results, stocks)
+
+    async def load_window(self, start_dt, end_dt, stocks=None):
+        """
+        universe, calendar and (optionally) prices of one window, queried concurrently
+        args:
+            start_dt: datetime object, window starts after this date
+            end_dt: datetime object, window ends on this date
+            stocks: tickers to load prices for, None skips the price query
+        returns:
+            list_of_stocks (list of (ticker, sector) tuples), trading dates (list), price panel or None
+        """
+        queries = [self.load_db_tickers_sectors(start_dt), self.load_trading_dates(start_dt, end_dt)]
+        if stocks is not None:
+            queries.append(self.load_price_panel(stocks, start_dt, end_dt))
+        results = await asyncio.gather(*queries)
+        panel = results[2] if stocks is not None else None
+        return results[0], results[1], panel
+
+    async def load_windows(self, windows, stocks=None):
+        """
+        load_window for every (start_dt, end_dt) window at once
+        returns:
+            list of load_window results, in windows order
+        """
+        return await asyncio.gather(*[self.load_window(start_dt, end_dt, stocks)
+                                      for start_dt, end_dt in windows])
+
+
+class DataAccess():
+
+    def __init__(self, db_info, max_conn=8):
+        """
+        synchronous facade of AsyncDataAccess for scripts without an event loop
+        args:
+            db_info: array of db_host, db_user, db_password, db_name
+            max_conn: most connections open at once, type int
+        """
+        self.loop = asyncio.new_event_loop()
+        self.data = AsyncDataAccess(db_info, max_conn)
+
+    def close(self):
+        self.data.close()
+        self.loop.close()
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def map(self, method, arg_list):
+        """
+        call one AsyncDataAccess method for every argument tuple concurrently
+        args:
+            method: method name, ex: "fetch_last_day_mth"
+            arg_list: list of argument tuples, ex: [(2004,), (2005,)]
+        returns:
+            list of results, in arg_list order
+        """
+        async def gather():
+            return await asyncio.gather(*[getattr(self.data, method)(*args) for args in arg_list])
+        return self.run(gather())
+
+    def fetch_last_day_mth(self, year_):
+        return self.run(self.data.fetch_last_day_mth(year_))
+
+    def fetch_last_day_any_mth(self, year_, mth_):
+        return self.run(self.data.fetch_last_day_any_mth(year_, mth_))
+
+    def load_db_tickers_start_date(self, start_date):
+        return self.run(self.data.load_db_tickers_start_date(start_date))
+
+    def load_db_tickers_sectors(self, start_date):
+        return self.run(self.data.load_db_tickers_sectors(start_date))
+
+    def load_trading_dates(self, start_date, end_date):
+        return self.run(self.data.load_trading_dates(start_date, end_date))
+
+    def load_price_panel(self, stocks, start_date, end_date, use_cache=True):
+        return self.run(self.data.load_price_panel(stocks, start_date, end_date, use_cache))
+
+    def load_windows(self, windows, stocks=None):
+        return self.run(self.data.load_windows(windows, stocks))
+
+
+def main():
+    # check the pooled loaders against common_methods on a local PostgreSQL database
+    # and time the yearly window queries run one after another vs concurrently
+    db_credential_info_p = "database_info.txt"
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    db_host, db_user, db_password, db_name = db_info
+    conn = psycopg2.connect(host=db_host,database=db_name, user=db_user, password=db_password)
+    data = DataAccess(db_info)
+
+    # same two year windows as identifying_pairs
+    year_array = list(range(2004, 2017))
+    start = time.perf_counter()
+    last_days = [cm.fetch_last_day_mth(year, conn) for year in year_array]
+    windows = [(datetime.date(year, 12, last_days[ii]), datetime.date(year + 2, 12, last_days[ii + 2]))
+               for ii, year in enumerate(year_array[:-2])]
+    universes = [cm.load_db_tickers_sectors(start_dt, conn) for start_dt, end_dt in windows]
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pooled_last_days = data.map("fetch_last_day_mth", [(year,) for year in year_array])
+    pooled_windows = data.load_windows(windows)
+    pooled_seconds = time.perf_counter() - start
+
+    print("last days match: {0}".format(pooled_last_days == last_days))
+    print("universes match: {0}".format([sorted(window[0]) for window in pooled_windows] ==
+                                        [sorted(universe) for universe in universes]))
+    tickers = [ticker for ticker, sector in universes[-1][:20]]
+    start_dt, end_dt = windows[-1]
+    direct = cm.load_price_panel(tickers, start_dt, end_dt, conn, use_cache=False)
+    pooled = data.load_price_panel(tickers, start_dt, end_dt, use_cache=False)
+    print("price panels match: {0}".format(direct.equals(pooled)))
+    print("serial {0:.2f}s, pooled {1:.2f}s".format(serial_seconds, pooled_seconds))
+
+    data.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
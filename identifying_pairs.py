@@ -9,26 +9,76 @@ Created on Fri Jul 27 09:50:49 2018
 # WITH INTRODUCTION OF SPY AS A MEMBER OF EACH SECTOR
 
 import psycopg2
+import sqlite3
 import datetime
 import seaborn
 import pandas as pd
 import os
 import functools
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.pyplot as plt
 
+import basket_screening
 import common_methods as cm
+import coint_cache
+import coint_engine
+import data_sources
+import db_access
+import instrumentation
+import screening_cascade
 
 
-def main():
-    skip_etfs = True
-    # create a path version of our text file
-    db_credential_info_p = "\\" + "database_info.txt"
-    
-    # create our instance variables for host, username, password and database name
-    db_host, db_user, db_password, db_name = cm.load_db_credential_info(db_credential_info_p)
-    conn = psycopg2.connect(host=db_host,database=db_name, user=db_user, password=db_password)
-    
-    year_array = list(range(2004, 2015))
+# each worker process keeps its own database connection and cointegration cache connection
+_worker_conn = None
+_worker_cache = None
+_worker_p_value = None
+
+# threshold for accepting a pairs model in screen_sector and screen_sector_windows. screen_sector_baskets
+# uses it for the trace test too, so basket screens need one of basket_screening.CRITICAL_COLUMNS
+P_VALUE = 0.01
+
+# candidate pre-filter ahead of the cointegration test, ex: screening_cascade.ScreeningCascade().
+# None tests every pair of a sector
+SCREENING_CASCADE = None
+
+# three and four ticker basket screen run by screen_sector_baskets
+BASKET_SCREEN = basket_screening.BasketScreen()
+
+# cointegration result cache file, reruns and resumed screens only test pairs missing from it.
+# None tests every pair
+COINT_CACHE = coint_cache.CACHE_NAME
+
+
+def init_worker(db_info, p_value=None):
+    """
+    open the database connection used by every task run in this process
+    args:
+        db_info: array of db_host, db_user, db_password, db_name
+        p_value: threshold for accepting a pairs model, None uses P_VALUE
+    returns:
+        NoneType
+    """
+    global _worker_conn, _worker_cache, _worker_p_value
+    _worker_conn = cm.connect_db(db_info)
+    _worker_p_value = P_VALUE if p_value is None else p_value
+    if COINT_CACHE is not None:
+        _worker_cache = coint_cache.CointCache(COINT_CACHE)
+
+
+def build_screening_tasks(year_array, conn, skip_etfs=True):
+    """
+    break our rolling screen into independent (window, sector) tasks
+    args:
+        year_array: list of first years of each two year window, type int
+        conn: a Postgres DB connection object
+        skip_etfs: do not screen the ETF sector, type bool
+    returns:
+        list of tuples (end_dt_str, sector, ticker_arr, start_dt, end_dt),
+        in window order and then sector order
+    """
+    tasks = []
     
     for yr in year_array:
         # create a pairs file for each two year chunk in our range
@@ -40,46 +90,446 @@ def main():
         # date range to pull data from
         start_dt = datetime.date(year,12,last_tr_day_start)
         end_dt = datetime.date(end_year,12,last_tr_day_end)
-        start_dt_str = start_dt.strftime("%Y%m%d")
-        end_dt_str = end_dt.strftime("%Y%m%d")
+        tasks.extend(window_tasks(start_dt, end_dt, conn, skip_etfs))
+                
+    return tasks
+
+
+def build_screening_tasks_pooled(year_array, data, skip_etfs=True):
+    """
+    same tasks as build_screening_tasks, with the calendar queries of every year and the
+    universe queries of every window issued concurrently over a connection pool
+    args:
+        year_array: list of first years of each two year window, type int
+        data: db_access.DataAccess object
+        skip_etfs: do not screen the ETF sector, type bool
+    returns:
+        list of tuples (end_dt_str, sector, ticker_arr, start_dt, end_dt),
+        in window order and then sector order
+    """
+    years = sorted(set(year_array) | set([year + 2 for year in year_array]))
+    last_days = dict(zip(years, data.map("fetch_last_day_mth", [(year,) for year in years])))
+    windows = [(datetime.date(year,12,last_days[year]), datetime.date(year + 2,12,last_days[year + 2]))
+               for year in year_array]
+    universes = data.map("load_db_tickers_sectors", [(start_dt,) for start_dt, end_dt in windows])
+    
+    tasks = []
+    for (start_dt, end_dt), list_of_stocks in zip(windows, universes):
+        tasks.extend(universe_tasks(start_dt, end_dt, list_of_stocks, skip_etfs))
+    return tasks
+
+
+def build_monthly_screening_tasks(first_end, last_end, conn, skip_etfs=True, window_months=24):
+    """
+    same tasks as build_screening_tasks for a window ending on the last trading day of
+    every month, so pairs can be re-formed monthly
+    args:
+        first_end: (year, month) of the first window end, type tuple of int
+        last_end: (year, month) of the last window end, type tuple of int
+        conn: a Postgres DB connection object
+        skip_etfs: do not screen the ETF sector, type bool
+        window_months: length of every window in months, type int
+    returns:
+        list of tuples (end_dt_str, sector, ticker_arr, start_dt, end_dt),
+        in window order and then sector order
+    """
+    tasks = []
+    first_month = first_end[0] * 12 + first_end[1] - 1
+    last_month = last_end[0] * 12 + last_end[1] - 1
+    
+    for month in range(first_month, last_month + 1):
+        # windows hold whole months, (last session, last session]
+        start_dt = last_session_of_month(month - window_months, conn)
+        end_dt = last_session_of_month(month, conn)
+        tasks.extend(window_tasks(start_dt, end_dt, conn, skip_etfs))
         
-        # list of stocks and their sector
-        list_of_stocks = cm.load_db_tickers_sectors(start_dt, conn)
-        # dict: key = sector with values = array of all tickers pertaining to a sector
-        sector_dict = cm.build_dict_of_arrays(list_of_stocks)
-        # write these arrays to text files later
-        passed_pairs = {}
-        #all_failed_pairs = []
+    return tasks
+
+
+def last_session_of_month(month, conn):
+    """
+    args:
+        month: months since year 0, year * 12 + month - 1, type int
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        datetime.date of the last trading day of that month we have data for
+    """
+    year, mth = divmod(month, 12)
+    last_session = cm.get_calendar(conn).last_session_of_month(year, mth + 1)
+    if last_session is None:
+        raise ValueError("no trading days in {0}-{1:02d}".format(year, mth + 1))
+    return last_session
+
+
+def window_tasks(start_dt, end_dt, conn, skip_etfs=True):
+    """
+    one screening task per sector for the window (start_dt, end_dt]
+    args:
+        start_dt: datetime object, window starts after this date
+        end_dt: datetime object, window ends on this date
+        conn: a Postgres DB connection object
+        skip_etfs: do not screen the ETF sector, type bool
+    returns:
+        list of tuples (end_dt_str, sector, ticker_arr, start_dt, end_dt)
+    """
+    # list of stocks and their sector
+    list_of_stocks = cm.load_db_tickers_sectors(start_dt, conn)
+    if not list_of_stocks:
+        # the universe is the tickers priced on start_dt, a non trading day has none
+        raise ValueError("no tickers priced on {0}, window {0}-{1} has no universe".format(
+            start_dt.strftime("%Y%m%d"), end_dt.strftime("%Y%m%d")))
+    return universe_tasks(start_dt, end_dt, list_of_stocks, skip_etfs)
+
+
+def universe_tasks(start_dt, end_dt, list_of_stocks, skip_etfs=True):
+    """
+    one screening task per sector for the window (start_dt, end_dt], from a loaded universe
+    args:
+        start_dt: datetime object, window starts after this date
+        end_dt: datetime object, window ends on this date
+        list_of_stocks: list of (ticker, sector) tuples, see cm.load_db_tickers_sectors
+        skip_etfs: do not screen the ETF sector, type bool
+    returns:
+        list of tuples (end_dt_str, sector, ticker_arr, start_dt, end_dt)
+    """
+    tasks = []
+    end_dt_str = end_dt.strftime("%Y%m%d")
+    
+    # dict: key = sector with values = array of all tickers pertaining to a sector
+    sector_dict = cm.build_dict_of_arrays(list_of_stocks)
+    
+    for sector, ticker_arr in sector_dict.items():
+        if skip_etfs and sector != "ETF":
+            # we need to append SPY to each sub_array to ensure that cointegrated pairs
+            # don't include a 3rd variable in why they are cointegrated
+            tasks.append((end_dt_str, sector, ticker_arr + ['SPY'], start_dt, end_dt))
+            
+    return tasks
+
+
+def build_sector_tasks(tasks):
+    """
+    group window tasks by sector, so each sector panel is loaded once and its windows
+    screened from shared per-month sufficient statistics
+    args:
+        tasks: list of tasks from build_screening_tasks or build_monthly_screening_tasks
+    returns:
+        list of tuples (sector, list of indices into tasks), indices in window order
+    """
+    sectors = {}
+    for ii, task in enumerate(tasks):
+        sectors.setdefault(task[1], []).append(ii)
+    return list(sectors.items())
+
+
+def screen_sector(task):
+    """
+    find cointegrated pairs for one sector in one window.
+    any error is caught and returned so a bad sector does not stop the whole run.
+    args:
+        task: tuple (end_dt_str, sector, ticker_arr, start_dt, end_dt)
+    returns:
+        tuple (array of pairs or None, error message or None)
+    """
+    end_dt_str, sector, ticker_arr, start_dt, end_dt = task
+    try:
+        with instrumentation.tagged(sector=sector, window=end_dt_str):
+            # inner merge of all tickers in our sector on Date
+            merged_data = cm.load_price_panel(ticker_arr, start_dt, end_dt, _worker_conn).dropna()
+            
+            scores, pvalues, pairs = cm.find_cointegrated_pairs(merged_data, _worker_p_value,
+                                                                cascade=SCREENING_CASCADE, cache=_worker_cache)
+        if SCREENING_CASCADE is not None:
+            for row in SCREENING_CASCADE.report:
+                instrumentation.count("cascade_{0}_pruned".format(row['stage']), row['pruned'])
+            instrumentation.progress('cascade', "Cascade for sector {0}, window ending {1}:\n{2}", sector, end_dt_str,
+                                     screening_cascade.format_report(SCREENING_CASCADE.report),
+                                     level=logging.DEBUG)
+        # seaborn heatmap for each sector within each range of time
+        # uncomment this section to print out seaborn heatmaps in iPython console
+#        confidence_level = 1 - 0.01
+#        m = [0,0.2,0.4,0.6,0.8,1]
+#        plt.figure(figsize=(min(10,len(pvalues)), min(10,len(pvalues))))
+#        seaborn.heatmap(pvalues, xticklabels=ticker_arr, 
+#                        yticklabels=ticker_arr, cmap='RdYlGn_r', 
+#                        mask = (pvalues >= confidence_level))
+#        plt.show()
+
+        new_pairs = cm.remove_ticker('SPY', pairs)
+        return new_pairs, None
+    except Exception as err:
+        # a failed query leaves the transaction aborted, clear it for the next task
+        try:
+            _worker_conn.rollback()
+        except (AttributeError, psycopg2.Error, sqlite3.Error):
+            pass
+        return None, repr(err)
+
+
+def screen_sector_windows(sector_task):
+    """
+    find cointegrated pairs for every window of one sector. the sector panel is loaded once
+    and each window is built from per-month sufficient statistics, see coint_engine.BlockMoments.
+    any error is caught and returned so a bad window does not stop the whole run.
+    args:
+        sector_task: tuple (sector, list of tasks from build_monthly_screening_tasks), tasks in window order
+    returns:
+        list of (array of pairs or None, error message or None) tuples, one per task
+    """
+    sector, tasks = sector_task
+    try:
+        tickers = list(dict.fromkeys([ticker for task in tasks for ticker in task[2]]))
+        first_start = min([task[3] for task in tasks])
+        last_end = max([task[4] for task in tasks])
+        with instrumentation.tagged(sector=sector):
+            price_panel = cm.load_price_panel(tickers, first_start, last_end, _worker_conn)
         
-        for sector, ticker_arr in sector_dict.items():
-            if skip_etfs and sector != "ETF":
-                # we need to append SPY to each sub_array to ensure that cointegrated pairs
-                # don't include a 3rd variable in why they are cointegrated
+        dates = np.array(price_panel.index, dtype='datetime64[D]')
+        months = dates.astype('datetime64[M]').astype(int)
+        bounds = [(np.searchsorted(dates, np.datetime64(task[3], 'D'), side='right'),
+                   np.searchsorted(dates, np.datetime64(task[4], 'D'), side='right')) for task in tasks]
+        maxlag = coint_engine.default_maxlag(max([last_row - first_row for first_row, last_row in bounds]))
+        moments = coint_engine.BlockMoments(price_panel.values, months, maxlag)
+    except Exception as err:
+        try:
+            _worker_conn.rollback()
+        except (AttributeError, psycopg2.Error, sqlite3.Error):
+            pass
+        return [(None, repr(err))] * len(tasks)
+    
+    col_index = {ticker: col for col, ticker in enumerate(tickers)}
+    results = []
+    for task, (first_row, last_row) in zip(tasks, bounds):
+        ticker_arr = task[2]
+        try:
+            cols = [col_index[ticker] for ticker in ticker_arr]
+            instrumentation.count('pairs_screened', len(cols) * (len(cols) - 1) // 2)
+            with instrumentation.span('cointegration', sector=sector, window=task[0]):
+                scores, pvalues, pairs = coint_engine.find_cointegrated_pairs_incremental(
+                    moments, ticker_arr, cols, first_row, last_row, _worker_p_value, cache=_worker_cache,
+                    dates=dates)
+            results.append((cm.remove_ticker('SPY', pairs), None))
+        except Exception as err:
+            results.append((None, repr(err)))
+        # windows only move forward, earlier months are not needed again
+        moments.release(first_row)
+    return results
 
-                ticker_arr.append('SPY')
 
-                data_array_of_dfs = cm.load_df_stock_data_array(ticker_arr, start_dt, end_dt, conn)
-                merged_data = cm.data_array_merge(data_array_of_dfs)
-                
+def screen_sector_baskets(task):
+    """
+    find cointegrated three and four ticker baskets for one sector in one window.
+    the pair stage reads the pairs screened by screen_sector from the cointegration cache.
+    any error is caught and returned so a bad sector does not stop the whole run.
+    args:
+        task: tuple (end_dt_str, sector, ticker_arr, start_dt, end_dt)
+    returns:
+        tuple (array of baskets or None, error message or None)
+    """
+    end_dt_str, sector, ticker_arr, start_dt, end_dt = task
+    try:
+        with instrumentation.tagged(sector=sector, window=end_dt_str):
+            merged_data = cm.load_price_panel(ticker_arr, start_dt, end_dt, _worker_conn).dropna()
+            # SPY is in BASKET_SCREEN.exclude, no basket holds it
+            baskets, weights = BASKET_SCREEN.find_cointegrated_baskets(merged_data, _worker_p_value,
+                                                                       cache=_worker_cache)
+        instrumentation.progress('basket_cascade', "Basket screen for sector {0}, window ending {1}:\n{2}", sector,
+                                 end_dt_str, basket_screening.format_report(BASKET_SCREEN.report), level=logging.DEBUG)
+        return baskets, None
+    except Exception as err:
+        try:
+            _worker_conn.rollback()
+        except (AttributeError, psycopg2.Error, sqlite3.Error):
+            pass
+        return None, repr(err)
 
-                scores, pvalues, pairs = cm.find_cointegrated_pairs(merged_data)
-                # seaborn heatmap for each sector within each range of time
-                # uncomment this section to print out seaborn heatmaps in iPython console
-#                confidence_level = 1 - 0.01
-#                m = [0,0.2,0.4,0.6,0.8,1]
-#                plt.figure(figsize=(min(10,len(pvalues)), min(10,len(pvalues))))
-#                seaborn.heatmap(pvalues, xticklabels=ticker_arr, 
-#                                yticklabels=ticker_arr, cmap='RdYlGn_r', 
-#                                mask = (pvalues >= confidence_level))
-#                plt.show()
-
-                new_pairs = cm.remove_ticker('SPY', pairs)
-                passed_pairs[sector] = new_pairs
-                print("Complete sector {0} for date range: {1}-{2}".format(sector, start_dt_str, end_dt_str))
-                
-        f_name = "coint_method_pairs_{0}".format(end_dt_str)    
-        cm.write_dict_text(f_name, passed_pairs)
+
+def check_basket_p_value(p_value):
+    # the basket trace test only has critical values at the levels of basket_screening.CRITICAL_COLUMNS
+    if p_value not in basket_screening.CRITICAL_COLUMNS:
+        raise ValueError("basket screening needs a p_value in {0}, got {1}".format(
+                         sorted(basket_screening.CRITICAL_COLUMNS), p_value))
+
+
+def run_screening_tasks(tasks, db_info, n_workers=1, screen=screen_sector, p_value=None):
+    """
+    run every screening task, in this process or on a process pool
+    args:
+        tasks: list of tasks from build_screening_tasks
+        db_info: array of db_host, db_user, db_password, db_name
+        n_workers: number of worker processes, type int. 1 runs serially
+        screen: function run on every task, screen_sector, screen_sector_windows or screen_sector_baskets
+        p_value: threshold for accepting a pairs model, None uses P_VALUE
+    returns:
+        list of screen results in the same order as tasks
+    """
+    p_value = P_VALUE if p_value is None else p_value
+    if screen is screen_sector_baskets:
+        # checked once here, not as a failure of every task
+        check_basket_p_value(p_value)
+    if n_workers <= 1:
+        init_worker(db_info, p_value)
+        return [screen(task) for task in tasks]
+    
+    results = []
+    # the threshold is sent to every worker, a process started by spawn does not see a changed P_VALUE
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker,
+                             initargs=(db_info, p_value)) as executor:
+        # every task reports its own spans and counters back to our recorder
+        futures = [executor.submit(instrumentation.call_with_report, screen, task) for task in tasks]
+        # collect in submission order so our output files are deterministic
+        for future in futures:
+            try:
+                result, task_report = future.result()
+                instrumentation.recorder.merge(task_report)
+                results.append(result)
+            except Exception as err:
+                # worker process died or the task could not be sent to it
+                results.append((None, repr(err)))
+    return results
+
+
+def run_sector_tasks(tasks, db_info, n_workers=1, p_value=None):
+    """
+    screen every task sector by sector with screen_sector_windows
+    args:
+        tasks: list of tasks from build_monthly_screening_tasks
+        db_info: array of db_host, db_user, db_password, db_name
+        n_workers: number of worker processes, type int. 1 runs serially
+        p_value: threshold for accepting a pairs model, None uses P_VALUE
+    returns:
+        list of (pairs, error) tuples in the same order as tasks
+    """
+    sector_tasks = build_sector_tasks(tasks)
+    sector_results = run_screening_tasks([(sector, [tasks[ii] for ii in task_ids])
+                                          for sector, task_ids in sector_tasks],
+                                         db_info, n_workers, screen_sector_windows, p_value)
+    results = [None] * len(tasks)
+    for (sector, task_ids), sector_result in zip(sector_tasks, sector_results):
+        if isinstance(sector_result, tuple):
+            # the worker process died, every window of the sector failed
+            sector_result = [sector_result] * len(task_ids)
+        for ii, result in zip(task_ids, sector_result):
+            results[ii] = result
+    return results
+
+
+def write_screening_results(tasks, results, directory=None, kind="pairs"):
+    """
+    gather task results per window and write one coint_method_{kind} file per window
+    args:
+        tasks: list of tasks from build_screening_tasks
+        results: list of (pairs, error) tuples from run_screening_tasks
+        directory: folder for the pairs files, None writes to the script directory
+        kind: "pairs", or "baskets" for screen_sector_baskets results written to
+              coint_method_baskets files, one basket per line: sector,ticker_1,ticker_2,ticker_3[,ticker_4]
+    returns:
+        list of strings, one per failed task
+    """
+    windows = {}
+    failures = []
+    
+    for task, (pairs, error) in zip(tasks, results):
+        end_dt_str, sector, ticker_arr, start_dt, end_dt = task
+        # write these arrays to text files later
+        passed_pairs = windows.setdefault(end_dt_str, {})
+        start_dt_str = start_dt.strftime("%Y%m%d")
+        if error is None:
+            passed_pairs[sector] = pairs
+            instrumentation.count("{0}_found".format(kind), len(pairs))
+            instrumentation.progress('complete', "Complete sector {0} for date range: {1}-{2}",
+                                     sector, start_dt_str, end_dt_str)
+        else:
+            failures.append("{0},{1},{2}".format(end_dt_str, sector, error))
+            instrumentation.count('sector_tasks_failed')
+            instrumentation.progress('failed', "Failed sector {0} for date range: {1}-{2}: {3}",
+                                     sector, start_dt_str, end_dt_str, error, level=logging.WARNING)
+    
+    for end_dt_str, passed_pairs in windows.items():
+        f_name = "coint_method_{0}_{1}".format(kind, end_dt_str)
+        if directory is not None:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            f_name = os.path.join(directory, f_name)
+        with instrumentation.tagged(window=end_dt_str):
+            cm.write_dict_text(f_name, passed_pairs)
+        
+    return failures
+
+
+def main():
+    skip_etfs = True
+    # re-form pairs at every month end from per-month sufficient statistics,
+    # False screens one window per year
+    monthly_formation = False
+    # issue the calendar and universe queries of every window concurrently over a connection pool
+    use_pooled_db = True
+    # also screen three and four ticker baskets of every window with BASKET_SCREEN,
+    # written to coint_method_baskets files next to the pairs files
+    basket_formation = False
+    # number of worker processes, each (window, sector) task runs independently
+    n_workers = os.cpu_count() or 1
+    # threshold of the pairs models, and of the basket trace test when basket_formation is on
+    p_value = P_VALUE
+    if basket_formation:
+        # before any pair screening is done
+        check_basket_p_value(p_value)
+    # rate limited progress messages, logging.DEBUG shows all of them and the per sector cascade reports
+    instrumentation.configure_logging(logging.INFO)
+    # create a path version of our text file
+    db_credential_info_p = "database_info.txt"
+    
+    # create our instance variables for host, username, password and database name
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
+    
+    year_array = list(range(2004, 2015))
+    
+    if monthly_formation:
+        # same two year windows, ending every month from Dec 2006 to Dec 2016
+        tasks = build_monthly_screening_tasks((year_array[0] + 2, 12), (year_array[-1] + 2, 12),
+                                              conn, skip_etfs)
+        conn.close()
+        results = run_sector_tasks(tasks, db_info, n_workers, p_value)
+        # monthly windows are kept apart from the yearly files pairs_backtester reads
+        directory = "coint_pairs_monthly"
+        failures = write_screening_results(tasks, results, directory)
+    elif use_pooled_db and not data_sources.is_embedded(db_info):
+        conn.close()
+        data = db_access.DataAccess(db_info)
+        tasks = build_screening_tasks_pooled(year_array, data, skip_etfs)
+        data.close()
+        results = run_screening_tasks(tasks, db_info, n_workers, p_value=p_value)
+        directory = None
+        failures = write_screening_results(tasks, results)
+    else:
+        tasks = build_screening_tasks(year_array, conn, skip_etfs)
+        conn.close()
+        results = run_screening_tasks(tasks, db_info, n_workers, p_value=p_value)
+        directory = None
+        failures = write_screening_results(tasks, results)
+    
+    if failures:
+        cm.write_results_text_file("coint_method_failures", failures)
+        print("{0} of {1} sector tasks failed.".format(len(failures), len(tasks)))
+    if basket_formation:
+        # the pair stage of every basket screen is read back from the cointegration cache
+        results = run_screening_tasks(tasks, db_info, n_workers, screen_sector_baskets, p_value)
+        basket_failures = write_screening_results(tasks, results, directory, kind="baskets")
+        if basket_failures:
+            cm.write_results_text_file("coint_method_basket_failures", basket_failures)
+            print("{0} of {1} sector basket tasks failed.".format(len(basket_failures), len(tasks)))
+    if COINT_CACHE is not None:
+        # drop the least recently used results beyond the cache size limit
+        cache = coint_cache.CointCache(COINT_CACHE)
+        cache.evict()
+        cache.close()
+    # per stage totals, per sector and per window breakdowns
+    instrumentation.write_report("run_report_identifying_pairs.json")
     
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:31:47 2026
+
+"""
+
+# INSTRUMENTATION - TIMING SPANS, COUNTERS AND RATE LIMITED PROGRESS LOGGING
+# stages (query, merge, cointegration, backtest, file_write, analysis) are wrapped in named
+# spans. every span adds to its stage total and to a breakdown per tag (ex: sector, window),
+# and the slowest tagged spans are kept, so a run report shows where the time went.
+# tags set with instrumentation.tagged apply to every span opened inside it, so the
+# common_methods loaders are broken down by the sector or pair a script is working on.
+# spans nest, ex: a file_write inside a backtest. seconds are inclusive and self_seconds
+# leave out nested spans, so self_seconds add up to the time spent in all stages.
+#
+#   with instrumentation.tagged(sector=sector, window=end_dt_str):
+#       with instrumentation.span('cointegration'):
+#           ...
+#   instrumentation.count('pairs_tested', n_pairs)
+#   instrumentation.progress('backtest', "Finished trading for {0}", pair)
+#   instrumentation.write_report("run_report_pairs_backtester.json")
+#
+# progress messages go to the "pairs_trading" logger, at most one per key every
+# PROGRESS_INTERVAL seconds, so they cost nothing inside hot loops
+
+import contextlib
+import functools
+import heapq
+import itertools
+import json
+import logging
+import time
+
+PROGRESS_INTERVAL = 5.0
+N_SLOWEST = 20
+
+logger = logging.getLogger("pairs_trading")
+
+
+class Instrumentation():
+
+    def __init__(self, n_slowest=N_SLOWEST):
+        self.n_slowest = n_slowest
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        # stage: [count, seconds, max seconds, self seconds]
+        self.stages = {}
+        # stage: {tag: {value: seconds}}
+        self.breakdowns = {}
+        self.counters = {}
+        # min heap of (seconds, order, stage, tags), the n_slowest longest tagged spans
+        self.slowest = []
+        self.order = itertools.count()
+        # progress key: [last time logged, messages suppressed since]
+        self.last_logged = {}
+        # tags of the enclosing tagged blocks
+        self.tags = {}
+        # seconds of nested spans, one entry per open span
+        self.open_spans = []
+
+    def add_span(self, stage, seconds, tags, self_seconds=None):
+        totals = self.stages.setdefault(stage, [0, 0.0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+        totals[3] += seconds if self_seconds is None else self_seconds
+        if not tags:
+            return
+        breakdown = self.breakdowns.setdefault(stage, {})
+        for tag, value in tags.items():
+            values = breakdown.setdefault(tag, {})
+            values[str(value)] = values.get(str(value), 0.0) + seconds
+        entry = (seconds, next(self.order), stage, dict([(tag, str(value)) for tag, value in tags.items()]))
+        if len(self.slowest) < self.n_slowest:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    @contextlib.contextmanager
+    def span(self, stage, **tags):
+        if self.tags:
+            tags = dict(self.tags, **tags)
+        self.open_spans.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            nested = self.open_spans.pop()
+            if self.open_spans:
+                self.open_spans[-1] += seconds
+            self.add_span(stage, seconds, tags, seconds - nested)
+
+    @contextlib.contextmanager
+    def tagged(self, **tags):
+        previous = self.tags
+        self.tags = dict(previous, **tags)
+        try:
+            yield
+        finally:
+            self.tags = previous
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def progress(self, key, message, *args, level=logging.INFO, interval=PROGRESS_INTERVAL):
+        """
+        log message.format(*args) unless a message with the same key was logged less than
+        interval seconds ago. messages are only formatted when they are logged, and
+        are never left out when the logger is at logging.DEBUG
+        """
+        if not logger.isEnabledFor(level):
+            return
+        now = time.perf_counter()
+        last = self.last_logged.get(key)
+        if last is not None and now - last[0] < interval and not logger.isEnabledFor(logging.DEBUG):
+            last[1] += 1
+            return
+        suppressed = last[1] if last is not None else 0
+        self.last_logged[key] = [now, 0]
+        if suppressed:
+            message = message + " ({0} similar messages suppressed)".format(suppressed)
+        logger.log(level, message.format(*args))
+
+    def report(self):
+        """
+        machine readable summary of the run
+        returns:
+            dict with stages (count, seconds, max_seconds, self_seconds per stage, slowest first),
+            breakdowns (seconds per tag value), counters and slowest (tagged spans)
+        """
+        stages = sorted(self.stages.items(), key=lambda item: -item[1][3])
+        return {
+                'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                'wall_seconds': time.time() - self.started,
+                'stages': dict([(stage, {'count': totals[0], 'seconds': totals[1], 'max_seconds': totals[2],
+                                         'self_seconds': totals[3]})
+                                for stage, totals in stages]),
+                'breakdowns': self.breakdowns,
+                'counters': self.counters,
+                'slowest': [dict([('stage', stage), ('seconds', seconds)] + list(tags.items()))
+                            for seconds, order, stage, tags in sorted(self.slowest, reverse=True)],
+               }
+
+    def merge(self, report):
+        """
+        add the spans and counters of another report, ex: from a worker process
+        """
+        for stage, totals in report['stages'].items():
+            own = self.stages.setdefault(stage, [0, 0.0, 0.0, 0.0])
+            own[0] += totals['count']
+            own[1] += totals['seconds']
+            own[2] = max(own[2], totals['max_seconds'])
+            own[3] += totals['self_seconds']
+        for stage, breakdown in report['breakdowns'].items():
+            own_breakdown = self.breakdowns.setdefault(stage, {})
+            for tag, values in breakdown.items():
+                own_values = own_breakdown.setdefault(tag, {})
+                for value, seconds in values.items():
+                    own_values[value] = own_values.get(value, 0.0) + seconds
+        for name, n in report['counters'].items():
+            self.count(name, n)
+        for entry in report['slowest']:
+            tags = dict([(tag, value) for tag, value in entry.items() if tag not in ('stage', 'seconds')])
+            item = (entry['seconds'], next(self.order), entry['stage'], tags)
+            if len(self.slowest) < self.n_slowest:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+
+# one recorder per process, like the price cache and worker connection
+recorder = Instrumentation()
+
+
+def span(stage, **tags):
+    return recorder.span(stage, **tags)
+
+
+def timed(stage):
+    """
+    decorator, every call of the function is a span of stage
+    args:
+        stage: stage name, ex: 'query'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with recorder.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def tagged(**tags):
+    return recorder.tagged(**tags)
+
+
+def count(name, n=1):
+    recorder.count(name, n)
+
+
+def progress(key, message, *args, **kwargs):
+    recorder.progress(key, message, *args, **kwargs)
+
+
+def report():
+    return recorder.report()
+
+
+def reset():
+    recorder.reset()
+
+
+def call_with_report(func, arg):
+    """
+    run func(arg) in a worker process on a fresh recorder
+    returns:
+        func result, report of the spans and counters it recorded
+    """
+    recorder.reset()
+    result = func(arg)
+    return result, recorder.report()
+
+
+def configure_logging(level=logging.INFO):
+    """
+    send progress messages to the console at level and above, ex: logging.DEBUG shows
+    every message without rate limiting
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+def write_report(f_name):
+    """
+    write our run report as json, print the stage totals
+    args:
+        f_name: ex: "run_report_pairs_backtester.json"
+    returns:
+        dict, the report written
+    """
+    run_report = report()
+    with open(f_name, "w") as ff:
+        json.dump(run_report, ff, indent=2)
+    for stage, totals in run_report['stages'].items():
+        print("{0}: {1} spans, {2:.3f}s total, {3:.3f}s self, {4:.3f}s max".format(
+              stage, totals['count'], totals['seconds'], totals['self_seconds'], totals['max_seconds']))
+    return run_report
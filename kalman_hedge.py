@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:48:26 2026
+
+"""
+
+# KALMAN FILTER HEDGE RATIO - TIME VARYING HEDGE RATIO AND INTERCEPT OF MANY PAIRS AT ONCE
+# price_1 = hedge * price_2 + intercept + noise, where the state (hedge, intercept) follows
+# a random walk. every pair of a window is one column of time x pair arrays, and each bar
+# updates the 2 x 2 state of every pair together as stacked numpy arrays
+#
+#   state covariance P, prior R = P + delta / (1 - delta) * I
+#   forecast error  e = price_1 - (hedge * price_2 + intercept), variance Q = F R F' + obs_var
+#   gain K = R F' / Q, state += K e, P = R - K F R             with F = [price_2, 1]
+#
+# the state of bar t only uses prices up to bar t, so hedge[t-1] and the forecast error
+# e[t-1] are known when the backtester trades on bar t
+
+import numpy as np
+
+# state drift per bar, larger values let the hedge ratio move faster
+DELTA = 1e-4
+# variance of the observation noise, in squared price units
+OBS_VAR = 1e-3
+
+
+def batch_kalman_hedge(price_1, price_2, delta=DELTA, obs_var=OBS_VAR):
+    """
+    filter the hedge ratio and intercept of every pair
+    args:
+        price_1: 2d np.array of prices, time x pair, NaN past the last bar of a pair
+        price_2: 2d np.array of prices, same shape as price_1
+        delta: state drift per bar, type float
+        obs_var: observation noise variance, type float
+    returns:
+        hedge: 2d np.array, filtered hedge ratio after each bar
+        intercept: 2d np.array, filtered intercept after each bar
+        error: 2d np.array, forecast error of price_1 from the state of the bar before
+        error_var: 2d np.array, variance of that forecast error
+        all NaN where price_1 or price_2 is NaN
+    """
+    price_1 = np.asarray(price_1, dtype=np.float64)
+    price_2 = np.asarray(price_2, dtype=np.float64)
+    n_bars, n_pairs = price_1.shape
+    hedge = np.full((n_bars, n_pairs), np.nan)
+    intercept = np.full((n_bars, n_pairs), np.nan)
+    error = np.full((n_bars, n_pairs), np.nan)
+    error_var = np.full((n_bars, n_pairs), np.nan)
+    if n_bars == 0:
+        return hedge, intercept, error, error_var
+
+    drift = delta / (1.0 - delta)
+    # state starts at the price ratio of the first bar, the static hedge of PairBackTester
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = price_1[0] / price_2[0]
+    alpha = np.zeros(n_pairs)
+    # state covariance as its three distinct entries, [[p11, p12], [p12, p22]]
+    p11 = np.zeros(n_pairs)
+    p12 = np.zeros(n_pairs)
+    p22 = np.zeros(n_pairs)
+    valid = ~(np.isnan(price_1[0]) | np.isnan(price_2[0]))
+    hedge[0] = np.where(valid, beta, np.nan)
+    intercept[0] = np.where(valid, alpha, np.nan)
+
+    for tt in range(1, n_bars):
+        x = price_2[tt]
+        y = price_1[tt]
+        valid = ~(np.isnan(x) | np.isnan(y))
+        r11 = p11 + drift
+        r12 = p12
+        r22 = p22 + drift
+        # F R, and Q = F R F' + obs_var
+        fr1 = x * r11 + r12
+        fr2 = x * r12 + r22
+        q = fr1 * x + fr2 + obs_var
+        e = y - (beta * x + alpha)
+        k1 = fr1 / q
+        k2 = fr2 / q
+        # pairs past their last bar keep their state
+        beta = np.where(valid, beta + k1 * e, beta)
+        alpha = np.where(valid, alpha + k2 * e, alpha)
+        p11 = np.where(valid, r11 - k1 * fr1, p11)
+        p12 = np.where(valid, r12 - k1 * fr2, p12)
+        p22 = np.where(valid, r22 - k2 * fr2, p22)
+        hedge[tt] = np.where(valid, beta, np.nan)
+        intercept[tt] = np.where(valid, alpha, np.nan)
+        error[tt] = np.where(valid, e, np.nan)
+        error_var[tt] = np.where(valid, q, np.nan)
+    return hedge, intercept, error, error_var
+
+
+def kalman_hedge_reference(price_1, price_2, delta=DELTA, obs_var=OBS_VAR):
+    """
+    textbook one pair filter with full 2 x 2 matrices, kept to verify batch_kalman_hedge
+    args:
+        price_1: list or 1d np.array of prices, no missing values
+        price_2: list or 1d np.array of prices, no missing values
+    returns:
+        hedge, intercept, error, error_var as 1d np.arrays
+    """
+    n_bars = len(price_1)
+    theta = np.array([price_1[0] / price_2[0], 0.0])
+    P = np.zeros((2, 2))
+    Vw = delta / (1.0 - delta) * np.eye(2)
+    hedge = np.full(n_bars, np.nan)
+    intercept = np.full(n_bars, np.nan)
+    error = np.full(n_bars, np.nan)
+    error_var = np.full(n_bars, np.nan)
+    hedge[0], intercept[0] = theta
+
+    for tt in range(1, n_bars):
+        F = np.array([price_2[tt], 1.0])
+        R = P + Vw
+        e = price_1[tt] - F.dot(theta)
+        Q = F.dot(R).dot(F) + obs_var
+        K = R.dot(F) / Q
+        theta = theta + K * e
+        P = R - np.outer(K, F.dot(R))
+        hedge[tt], intercept[tt] = theta
+        error[tt] = e
+        error_var[tt] = Q
+    return hedge, intercept, error, error_var
+
+
+def main():
+    # check the batched filter against the one pair reference and time it on a window of pairs
+    import time
+    import benchmark_coint
+
+    prices = benchmark_coint.factor_sector(400, 273, n_planted=100).values
+    price_1 = prices[:, 0::2].copy()
+    price_2 = prices[:, 1::2].copy()
+    # ragged pairs, the last pair stops 20 bars early
+    price_1[-20:, -1] = np.nan
+    price_2[-20:, -1] = np.nan
+
+    start = time.perf_counter()
+    batch = batch_kalman_hedge(price_1, price_2)
+    print("{0} pairs x {1} bars in {2:.4f}s".format(price_1.shape[1], price_1.shape[0], time.perf_counter() - start))
+    worst = 0.0
+    for pp in [0, 1, 57, price_1.shape[1] - 1]:
+        n_bars = np.count_nonzero(~np.isnan(price_1[:, pp]))
+        reference = kalman_hedge_reference(price_1[:n_bars, pp], price_2[:n_bars, pp])
+        for out, ref in zip(batch, reference):
+            worst = max(worst, np.nanmax(np.abs(out[:n_bars, pp] - ref) / np.maximum(np.abs(ref), 1.0)))
+    print("largest relative difference to the reference filter: {0:.2e}".format(worst))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,6 @@ Created on Fri Jul 27 13:13:18 2018
 # WORKING WITH SINGLE PAIRS - LOADING DB DATA
 
 import datetime
-import psycopg2
 import common_methods as cm
 import statsmodels.tsa.stattools as ts
 import matplotlib.pyplot as plt
@@ -16,12 +15,302 @@ import numpy as np
 import os
 import pandas as pd    
 import glob
+import logging
+
+import instrumentation
+import kalman_hedge
+import trade_store
+
+# position codes of the array backtest cores
+FLAT, LONG, SHORT = 0, 1, -1
+POSITION_NAMES = {FLAT: "", LONG: "Long", SHORT: "Short"}
+# fixed schema of a daily record and of a closed trade summary. the backtest cores append them
+# to RecordBuffers and they are only formatted to text or trade store rows at write time
+RECORD_DTYPE = np.dtype([('bar', np.int32), ('position', np.int8), ('zscore', np.float64),
+                         ('pos1', np.float64), ('pos2', np.float64), ('ratio', np.float64),
+                         ('price_1', np.float64), ('price_2', np.float64), ('days', np.int32),
+                         ('pnl', np.float64)])
+TRADE_DTYPE = np.dtype([('first_rec', np.int64), ('last_rec', np.int64), ('entry_bar', np.int32),
+                        ('position', np.int8), ('pos1', np.float64), ('pos2', np.float64),
+                        ('orig_ratio', np.float64), ('exit_bar', np.int32), ('trd_mean', np.float64),
+                        ('max_day', np.float64), ('min_day', np.float64), ('days', np.int32),
+                        ('pnl', np.float64)])
+# BatchPairBackTester rows also carry the pair column, the trade number of the pair and a sequence
+BATCH_RECORD_DTYPE = np.dtype([('pair', np.int32), ('trade_no', np.int32), ('seq', np.int32)] + RECORD_DTYPE.descr)
+BATCH_TRADE_DTYPE = np.dtype([('pair', np.int32), ('trade_no', np.int32)] + TRADE_DTYPE.descr)
+# closed trades formatted and written per batch, bounds the text rows held at once
+WRITE_BATCH_TRADES = 5000
+DAILY_HEADER = trade_store.DAILY_HEADER
+# hedge ratio of the second leg: "ratio" trades the price ratio, "kalman" the kalman_hedge ratio
+HEDGE_MODES = ("ratio", "kalman")
+
+
+def hedge_signal(price_1, price_2, hedge_mode="ratio"):
+    """
+    hedge ratio that sizes the second leg and the series our z-score is built from
+    args:
+        price_1: 2d np.array of prices, time x pair, NaN past the last bar of a pair
+        price_2: 2d np.array of prices, same shape as price_1
+        hedge_mode: "ratio" uses price_1 / price_2 for both. "kalman" hedges with the
+                    kalman_hedge ratio and builds the z-score from the hedged spread
+                    price_1 - hedge * price_2
+    returns:
+        hedge (np.array), signal (np.array), same shape as price_1
+    """
+    if hedge_mode == "kalman":
+        hedge, intercept, error, error_var = kalman_hedge.batch_kalman_hedge(price_1, price_2)
+        # the forecast error is close to white noise, the hedged spread keeps the slow
+        # mean reversion our short / long moving average z-score trades
+        return hedge, price_1 - hedge * price_2
+    if hedge_mode != "ratio":
+        raise ValueError("hedge_mode must be one of {0}, got {1}".format(HEDGE_MODES, hedge_mode))
+    ratios = price_1 / price_2
+    return ratios, ratios
+
+
+def results_params(lookback_periods, hedge_mode="ratio"):
+    """
+    suffix of our results directory and trade store, ex: "_5_30" or "_5_30_kalman"
+    """
+    params = "_{0}_{1}".format(lookback_periods[0], lookback_periods[1])
+    if hedge_mode != "ratio":
+        params += "_" + hedge_mode
+    return params
+
+
+def load_pairs_file(f_name):
+    """
+    pairs of a coint_method_pairs file with their sector
+    args:
+        f_name: path of the pairs file, type string
+    returns:
+        list of (sector, (ticker_1, ticker_2)) tuples in file order
+    """
+    sector_pairs = []
+    with open(f_name) as f:
+        for line in f:
+            (key, val1, val2) = line.split(",")
+            pair = (val1, val2.strip("\n"))
+            if pair != ('GOOG','GOOGL'):
+                sector_pairs.append((key, pair))
+    return sector_pairs
+
+
+def trading_window(pairs_file, conn):
+    """
+    out of sample dates of a pairs file, the backtest range of its pairs
+    args:
+        pairs_file: file name, ex: coint_method_pairs_20061229.txt
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        trd_start_dt, trd_end_dt as datetime objects, trading data starts after trd_start_dt
+    """
+    year_int = int(pairs_file.split(".")[0].split('_')[-1][0:4])
+    end_yr_int = year_int + 1
+    month_int = int(pairs_file.split(".")[0].split('_')[-1][4:6])
+    # start in month 11 not 12 to allow zscores to be calculated
+    last_tr_day_start = cm.fetch_last_day_any_mth(end_yr_int, 11, conn)
+    trd_start_dt = datetime.date(year_int,month_int - 1,last_tr_day_start)
+    last_tr_day_end = cm.fetch_last_day_any_mth(end_yr_int, 12, conn)
+    trd_end_dt = datetime.date(end_yr_int,month_int,last_tr_day_end)
+    return trd_start_dt, trd_end_dt
+
+
+def step_trade_rules(ii, zscore, active, last, long_pos, short_pos, entry_bar, upper, lower,
+                     enter, mark, close):
+    """
+    PairBackTester.backtest entry / exit blocks of one bar, for many pairs at once.
+    the only copy of our trading rules for the array engines, each engine passes
+    callbacks that keep its own trade state and output
+    args:
+        ii: bar number, type int, or np.array of every pair's bar number
+        zscore: np.array, z-score of the bar before, one per pair
+        active: bool np.array, pairs with a bar today
+        last: bool np.array, pairs whose final bar this is, open trades are closed
+        long_pos, short_pos: bool np.arrays of open trades, updated in place by the callbacks
+        entry_bar: np.array, bar each open trade was entered on
+        upper: entry threshold, type float or np.array with one per pair
+        lower: exit threshold, type float or np.array with one per pair
+        enter: enter(mask, side) opens a LONG or SHORT trade for every pair in mask
+        mark: mark(mask) adds today's PnL to the open trades in mask
+        close: close(mask, final) closes the trades in mask, final is True on their last bar
+    returns:
+        NoneType
+    """
+    # WE HAVE A NEW LONG SIGNAL
+    mask = active & (zscore < -upper) & ~long_pos
+    if mask.any():
+        enter(mask, LONG)
+    # WE NEED TO EXIT LONG SIGNAL
+    mask = active & (zscore > -lower) & long_pos
+    if mask.any():
+        mark(mask)
+        close(mask, False)
+    # WE HAVE A NEW SHORT SIGNAL
+    mask = active & (zscore > upper) & ~short_pos
+    if mask.any():
+        enter(mask, SHORT)
+    # WE NEED TO EXIT SHORT SIGNAL
+    mask = active & (zscore < lower) & short_pos
+    if mask.any():
+        mark(mask)
+        close(mask, False)
+
+    in_trade = long_pos | short_pos
+    # last bar of a pair, close any open trade
+    mask = active & last & in_trade
+    if mask.any():
+        mark(mask)
+        close(mask, True)
+    # open trades carry on
+    mask = active & ~last & in_trade & (entry_bar != ii)
+    if mask.any():
+        mark(mask)
+
+
+class RecordBuffer():
+
+    def __init__(self, dtype, capacity=1024):
+        """
+        growable preallocated array of fixed schema rows
+        args:
+            dtype: structured np.dtype of a row, ex: RECORD_DTYPE
+            capacity: rows allocated up front, type int
+        """
+        self.rows = np.empty(max(capacity, 1), dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes
+
+    def reserve(self, n):
+        # capacity doubles, so appending stays amortized constant time
+        if self.size + n > len(self.rows):
+            rows = np.empty(max(2 * len(self.rows), self.size + n), dtype=self.rows.dtype)
+            rows[:self.size] = self.rows[:self.size]
+            self.rows = rows
+
+    def append(self, values):
+        # one row from a tuple in dtype field order
+        if self.size == len(self.rows):
+            self.reserve(1)
+        self.rows[self.size] = values
+        self.size += 1
+
+    def extend(self, n):
+        # the next n rows, to be filled field by field
+        self.reserve(n)
+        block = self.rows[self.size:self.size + n]
+        self.size += n
+        return block
+
+    def values(self):
+        return self.rows[:self.size]
+
+
+def date_strings(dates):
+    """
+    'YYYYMMDD' strings of a DatetimeIndex, formatted in one pass
+    returns:
+        list of strings
+    """
+    return [day.replace("-", "") for day in np.asarray(dates, dtype='datetime64[D]').astype(str).tolist()]
+
+
+def pair_trade_rows(stock_1, stock_2, dates, records, closed_trades):
+    """
+    master row and daily rows of every closed trade of a pair
+    args:
+        stock_1: first ticker of our pair, type string
+        stock_2: second ticker of our pair, type string
+        dates: 'YYYYMMDD' string of every bar of our pair, indexed by bar number, see date_strings
+        records: np.array of RECORD_DTYPE (or BATCH_RECORD_DTYPE) daily records
+        closed_trades: np.array of TRADE_DTYPE (or BATCH_TRADE_DTYPE) trade summaries
+    returns:
+        list of (master row, list of daily rows) tuples, see trade_store.format_master_row
+    """
+    trades = []
+    # python values of every field in one conversion
+    record_rows = records[list(RECORD_DTYPE.names)].tolist()
+    
+    for trade in closed_trades[list(TRADE_DTYPE.names)].tolist():
+        (first_rec, last_rec, entry_bar, position, pos1, pos2, orig_ratio, exit_bar,
+         trd_mean, max_day, min_day, days_in_trade, trade_pnl) = trade
+        entry_date_str = dates[entry_bar]
+        position_str = POSITION_NAMES[position]
+        trd_id = entry_date_str + "_" + position_str + "{0}{1}".format(stock_1, stock_2)
+        
+        daily_rows = [(trd_id, dates[bar], POSITION_NAMES[rec_position], stock_1, stock_2,
+                       zscore, rec_pos1, rec_pos2, ratio, price_1, price_2, days, pnl)
+                      for (bar, rec_position, zscore, rec_pos1, rec_pos2, ratio, price_1, price_2, days, pnl)
+                      in record_rows[first_rec:last_rec]]
+        master_row = (trd_id, entry_date_str, position_str, stock_1, stock_2, pos1, pos2, orig_ratio,
+                      dates[exit_bar], trd_mean, max_day, min_day, days_in_trade, trade_pnl)
+        trades.append((master_row, daily_rows))
+    return trades
+
+
+@instrumentation.timed('file_write')
+def write_trades(params, trades, store=None):
+    """
+    save closed trades to our trade store, or to the original text layout when store is None
+    args:
+        params: directory suffix, ex: "_5_30", type string
+        trades: list of (master row, list of daily rows) tuples from pair_trade_rows
+        store: trade_store.TradeStore object or None
+    returns:
+        NoneType
+    """
+    if store is None:
+        trade_store.write_text_trades("PairsResults"+params, trades)
+    else:
+        store.add_trades(trades)
+
+
+def pair_price_arrays(pairs, price_panel):
+    """
+    line up the bars of every pair (dates where both tickers have a price) as columns
+    of padded time x pair arrays
+    args:
+        pairs: list of tuples, each tuple is two tickers
+        price_panel: pandas dataframe indexed by Date, one column per ticker
+    returns:
+        n_bars (np.array), bar_rows (np.array), price_1 (np.array), price_2 (np.array)
+        column p of bar_rows holds the price_panel row of each bar of pair p, -1 past its last bar.
+        price_1 and price_2 are NaN past the last bar
+    """
+    values = price_panel.values.astype(float)
+    columns = {ticker: col for col, ticker in enumerate(price_panel.columns)}
+    n_pairs = len(pairs)
+    pair_rows = []
+    for stock_1, stock_2 in pairs:
+        col_1 = values[:, columns[stock_1]]
+        col_2 = values[:, columns[stock_2]]
+        pair_rows.append(np.nonzero(~np.isnan(col_1) & ~np.isnan(col_2))[0])
+        
+    n_bars = np.array([len(rows) for rows in pair_rows], dtype=int)
+    max_bars = n_bars.max() if n_pairs > 0 else 0
+    bar_rows = np.full((max_bars, n_pairs), -1, dtype=int)
+    price_1 = np.full((max_bars, n_pairs), np.nan)
+    price_2 = np.full((max_bars, n_pairs), np.nan)
+    for pp, (stock_1, stock_2) in enumerate(pairs):
+        rows = pair_rows[pp]
+        bar_rows[:len(rows), pp] = rows
+        price_1[:len(rows), pp] = values[rows, columns[stock_1]]
+        price_2[:len(rows), pp] = values[rows, columns[stock_2]]
+    return n_bars, bar_rows, price_1, price_2
 
 
 class PairBackTester():
     
-    def __init__(self, pair, merged_df, z_threshold, lookback_periods, initial_capital):
+    def __init__(self, pair, merged_df, z_threshold, lookback_periods, initial_capital, store=None,
+                 hedge_mode="ratio"):
         self.pair = pair
+        self.store = store
         self.stock_1 = self.pair[0]
         self.stock_2 = self.pair[1]
         self.merged_df = merged_df
@@ -29,50 +318,47 @@ class PairBackTester():
         self.z_lower_thresh = z_threshold[1]
         self.short_lookback = lookback_periods[0]
         self.long_lookback = lookback_periods[1]
-        self.params = "_{0}_{1}".format(self.short_lookback, self.long_lookback)
+        self.params = results_params(lookback_periods, hedge_mode)
         self.initial_capital = initial_capital        
-        self.ratios = self.merged_df[self.stock_1] / self.merged_df[self.stock_2]
-        self.ma_short = self.ratios.rolling(window = self.short_lookback, center = False).mean()
-        self.ma_long = self.ratios.rolling(window = self.long_lookback, center = False).mean()
-        self.std = self.ratios.rolling(window = self.long_lookback, center = False).std()
-        self.zscore = (self.ma_short - self.ma_long)/self.std
-        self.total_dollars_per_trade = self.initial_capital * 2.0
-        self.long_pos = False
-        self.short_pos = False
-        self.daily_data = []
-        # CREATE OUR COLUMNS
-        self.daily_data.append("Date,Position,Ticker1,Ticker2,ZScore,Ticker1_Shares,Ticker2_Shares,Ratio,Ticker1_P,Ticker2_P,Days,PnL")
+        if hedge_mode == "ratio":
+            self.ratios = self.merged_df[self.stock_1] / self.merged_df[self.stock_2]
+            signal = self.ratios
+        else:
+            hedge, signal = hedge_signal(self.merged_df[[self.stock_1]].values, self.merged_df[[self.stock_2]].values,
+                                         hedge_mode)
+            self.ratios = pd.Series(hedge[:, 0], index=self.merged_df.index)
+            signal = pd.Series(signal[:, 0], index=self.merged_df.index)
+        # the moving averages are only needed for the z-score, a kept object holds ratios and zscore
+        ma_short = signal.rolling(window = self.short_lookback, center = False).mean()
+        ma_long = signal.rolling(window = self.long_lookback, center = False).mean()
+        std = signal.rolling(window = self.long_lookback, center = False).std()
+        self.zscore = (ma_short - ma_long)/std
         self.directory_pair = "PairsResults"+self.params+"/{0}_{1}".format(self.stock_1, self.stock_2)
         self.create_directories()
         
-        self.TrdID = ""
-        self.position = ""
-        self.pos1 = 0.0
-        self.pos2 = 0.0
-        self.EntryP_S1 = 0.0
-        self.EntryP_S2 = 0.0
+    def reset_reference_state(self):
+        # bar by bar trade state of backtest_reference, backtest keeps its state in locals
         self.YestP_S1 = 0.0
         self.YestP_S2 = 0.0
         self.CurrentP_S1 = 0.0
         self.CurrentP_S2 = 0.0
+        self.EntryP_S1 = 0.0
+        self.EntryP_S2 = 0.0
         self.ExitP_S1 = 0.0
         self.ExitP_S2 = 0.0
-        self.PnL = 0.0
-        self.Pnl_history = []
-        self.TradePnL = 0.0
-        self.OrigTrRatio = 0.0
         self.TrRatio = 0.0
         self.EntryDateStr = ""
         self.EntryDate = None
         self.ExitDateStr = ""
-        self.days_in_trade = 0
+        self.reset_trade()
         
     def create_directories(self):
         main_directory = "PairsResults"+self.params
         
         if not os.path.exists(main_directory):
             os.makedirs(main_directory)
-        if not os.path.exists(self.directory_pair):
+        # pair directories only hold text trade files
+        if self.store is None and not os.path.exists(self.directory_pair):
             os.makedirs(self.directory_pair)
     
     def collect_data(self, ii, position, pos1, pos2, tr_ratio, stock1_p, stock2_p):
@@ -80,7 +366,7 @@ class PairBackTester():
         self.daily_data.append(
                                self.merged_df.index[ii].strftime('%Y%m%d') + "," +
                                position + "," + self.stock_1 + "," +
-                               self.stock_2 + "," + repr(self.zscore[ii-1]) + "," +
+                               self.stock_2 + "," + repr(self.zscore.iloc[ii-1]) + "," +
                                repr(pos1) + "," + repr(pos2) + "," + repr(tr_ratio) + "," +
                                repr(stock1_p) + "," + repr(stock2_p) + "," +
                                repr(self.days_in_trade) + "," + repr(self.PnL)
@@ -142,12 +428,12 @@ class PairBackTester():
         
     def set_new_trade(self, ii, EntryD):
         if self.position == "Long":
-            self.pos1 = self.initial_capital/self.merged_df[self.stock_1][ii]
+            self.pos1 = self.initial_capital/self.merged_df[self.stock_1].iloc[ii]
         else:
-            self.pos1 = self.initial_capital/self.merged_df[self.stock_1][ii] * -1.0  
+            self.pos1 = self.initial_capital/self.merged_df[self.stock_1].iloc[ii] * -1.0  
         # if pos1 is long, pos2 is short, vice versa if pos1 is short, pos2 is long
         self.OrigTrRatio = self.TrRatio
-        self.pos2 = self.pos1 * self.ratios[ii-1] * -1.0
+        self.pos2 = self.pos1 * self.ratios.iloc[ii-1] * -1.0
         self.EntryP_S1 = self.CurrentP_S1
         self.EntryP_S2 = self.CurrentP_S2
         self.PnL = 0.0
@@ -158,15 +444,156 @@ class PairBackTester():
     def backtest(self):
         # method to run after we've instantiated a new PairBackTester object
         # we only enter trades using previous day z-score and ratio
+        # same rules and block order as backtest_reference, run over plain arrays.
+        # daily records and trade summaries go into RecordBuffers and are formatted to text at the end
+        price_1 = self.merged_df[self.stock_1].values.tolist()
+        price_2 = self.merged_df[self.stock_2].values.tolist()
+        ratios = self.ratios.values.tolist()
+        zscores = self.zscore.values.tolist()
+        n_bars = len(ratios)
+        upper = self.z_upper_thresh
+        lower = self.z_lower_thresh
+        capital = self.initial_capital
+        
+        # about one record per bar in a trade, the buffer grows past that
+        records = RecordBuffer(RECORD_DTYPE, n_bars)
+        closed_trades = RecordBuffer(TRADE_DTYPE, 16)
+        # at most one daily pnl per bar of a trade
+        pnl_history = np.empty(max(n_bars, 1))
+        n_pnl = 0
+        trade_start = 0
+        
+        long_pos = False
+        short_pos = False
+        position = FLAT
+        pos1 = 0.0
+        pos2 = 0.0
+        orig_ratio = 0.0
+        entry_bar = -1
+        days_in_trade = 0
+        pnl = 0.0
+        trade_pnl = 0.0
+        
+        for ii in range(1, n_bars):
+            yest_1 = price_1[ii-1]
+            yest_2 = price_2[ii-1]
+            current_1 = price_1[ii]
+            current_2 = price_2[ii]
+            tr_ratio = ratios[ii-1]
+            zscore = zscores[ii-1]
+            
+            if zscore < -upper and not long_pos:
+                # WE HAVE A NEW LONG SIGNAL - COLLECT ALL OUR DATA
+                position = LONG
+                long_pos = True
+                pos1 = capital/current_1
+                pos2 = pos1 * tr_ratio * -1.0
+                orig_ratio = tr_ratio
+                pnl = 0.0
+                entry_bar = ii
+                records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                
+            if zscore > -lower and long_pos:
+                # WE NEED TO EXIT LONG SIGNAL - COLLECT ALL OUR DATA
+                days_in_trade += 1
+                pnl = ((current_1 - yest_1) * pos1) + ((current_2 - yest_2) * pos2)
+                trade_pnl += pnl
+                pnl_history[n_pnl] = pnl
+                n_pnl += 1
+                records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                # exit trade, keep our trade details, reset
+                closed_trades.append(self.trade_summary(trade_start, len(records), entry_bar, position, pos1, pos2,
+                                                        orig_ratio, ii, pnl_history[:n_pnl], days_in_trade, trade_pnl))
+                trade_start = len(records)
+                n_pnl = 0
+                trade_pnl, pnl, pos1, pos2, orig_ratio = 0.0, 0.0, 0.0, 0.0, 0.0
+                short_pos, long_pos, position, days_in_trade = False, False, FLAT, 0
+                
+            if zscore > upper and not short_pos:
+                # WE HAVE A NEW SHORT SIGNAL - COLLECT ALL OUR DATA
+                position = SHORT
+                short_pos = True
+                pos1 = capital/current_1 * -1.0
+                pos2 = pos1 * tr_ratio * -1.0
+                orig_ratio = tr_ratio
+                pnl = 0.0
+                entry_bar = ii
+                records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                
+            if zscore < lower and short_pos:
+                days_in_trade += 1
+                pnl = ((current_1 - yest_1) * pos1) + ((current_2 - yest_2) * pos2)
+                trade_pnl += pnl
+                pnl_history[n_pnl] = pnl
+                n_pnl += 1
+                records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                # exit trade, keep our trade details, reset
+                closed_trades.append(self.trade_summary(trade_start, len(records), entry_bar, position, pos1, pos2,
+                                                        orig_ratio, ii, pnl_history[:n_pnl], days_in_trade, trade_pnl))
+                trade_start = len(records)
+                n_pnl = 0
+                trade_pnl, pnl, pos1, pos2, orig_ratio = 0.0, 0.0, 0.0, 0.0, 0.0
+                short_pos, long_pos, position, days_in_trade = False, False, FLAT, 0
+                           
+            if ii == (n_bars-1):
+                if (long_pos or short_pos):
+                    days_in_trade += 1
+                    pnl = ((current_1 - yest_1) * pos1) + ((current_2 - yest_2) * pos2)
+                    trade_pnl += pnl
+                    pnl_history[n_pnl] = pnl
+                    n_pnl += 1
+                    records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                    closed_trades.append(self.trade_summary(trade_start, len(records), entry_bar, position, pos1, pos2,
+                                                            orig_ratio, ii, pnl_history[:n_pnl], days_in_trade, trade_pnl))
+                    instrumentation.progress('finished', "Finished trading for {0}", self.pair)
+                # nothing after the last bar reaches our output files
+                break
+            
+            if (long_pos or short_pos) and (ii != entry_bar):
+                days_in_trade += 1
+                pnl = ((current_1 - yest_1) * pos1) + ((current_2 - yest_2) * pos2)
+                trade_pnl += pnl
+                pnl_history[n_pnl] = pnl
+                n_pnl += 1
+                records.append((ii, position, zscore, pos1, pos2, tr_ratio, current_1, current_2, days_in_trade, pnl))
+                
+        self.write_trades(records.values(), closed_trades.values())
+        
+    def trade_summary(self, first_rec, last_rec, entry_bar, position, pos1, pos2, orig_ratio,
+                      exit_bar, pnl_history, days_in_trade, trade_pnl):
+        # numeric summary of a closed trade, a TRADE_DTYPE row formatted to text in write_trades
+        pnl_list = pnl_history.tolist()
+        if len(pnl_list) > 0:
+            # python sum to add up daily pnl in the same order as write_trade_master
+            trd_mean = sum(pnl_list)/len(pnl_list)
+            max_day = max(pnl_list)
+            min_day = min(pnl_list)
+        else:
+            trd_mean, max_day, min_day = [0.0, 0.0, 0.0]
+        return (first_rec, last_rec, entry_bar, position, pos1, pos2, orig_ratio, exit_bar,
+                trd_mean, max_day, min_day, days_in_trade, trade_pnl)
+    
+    def write_trades(self, records, closed_trades):
+        # save every closed trade of our pair in one pass, to the trade store or text files
+        if len(closed_trades) == 0:
+            return
+        trades = pair_trade_rows(self.stock_1, self.stock_2, date_strings(self.merged_df.index), records,
+                                 closed_trades)
+        write_trades(self.params, trades, self.store)
+
+    def backtest_reference(self):
+        # original bar by bar pandas implementation of backtest, kept to verify the array core
+        # we only enter trades using previous day z-score and ratio
+        self.reset_reference_state()
         for ii in range(1, len(self.ratios)):
-            self.YestP_S1 = self.merged_df[self.stock_1][ii-1]
-            self.YestP_S2 = self.merged_df[self.stock_2][ii-1]
-            self.CurrentP_S1 = self.merged_df[self.stock_1][ii]
-            self.CurrentP_S2 = self.merged_df[self.stock_2][ii]
-            self.TrRatio = self.ratios[ii-1]
+            self.YestP_S1 = self.merged_df[self.stock_1].iloc[ii-1]
+            self.YestP_S2 = self.merged_df[self.stock_2].iloc[ii-1]
+            self.CurrentP_S1 = self.merged_df[self.stock_1].iloc[ii]
+            self.CurrentP_S2 = self.merged_df[self.stock_2].iloc[ii]
+            self.TrRatio = self.ratios.iloc[ii-1]
             
             CurrentDate = self.merged_df.index[ii]
-            Zscore = self.zscore[ii-1]
+            Zscore = self.zscore.iloc[ii-1]
             
             if Zscore < -self.z_upper_thresh and not self.long_pos:
                 # WE HAVE A NEW LONG SIGNAL - COLLECT ALL OUR DATA
@@ -209,14 +636,14 @@ class PairBackTester():
                 if (self.long_pos or self.short_pos):
                     self.days_in_trade += 1
                     self.calc_day_PnL()
-                    self.ExitP_S1 = self.merged_df[self.stock_1][ii]
-                    self.ExitP_S2 = self.merged_df[self.stock_2][ii]
+                    self.ExitP_S1 = self.merged_df[self.stock_1].iloc[ii]
+                    self.ExitP_S2 = self.merged_df[self.stock_2].iloc[ii]
                     self.ExitDateStr = CurrentDate.strftime('%Y%m%d')
                     self.collect_data(ii, self.position , self.pos1, self.pos2, self.TrRatio, self.ExitP_S1, self.ExitP_S2)
                     self.write_all_data()
                 else:
                     continue
-                print("Finished trading for {0}".format(self.pair))
+                instrumentation.progress('finished', "Finished trading for {0}", self.pair)
             
             if (self.long_pos or self.short_pos) and (CurrentDate != self.EntryDate):
                 self.days_in_trade += 1
@@ -224,79 +651,305 @@ class PairBackTester():
                 self.collect_data(ii, self.position, self.pos1, self.pos2, self.TrRatio, self.CurrentP_S1, self.CurrentP_S2)
 
 
+class BatchPairBackTester():
+    
+    def __init__(self, pairs, price_panel, z_threshold, lookback_periods, initial_capital, store=None,
+                 hedge_mode="ratio"):
+        # backtest every pair of a window at once from one shared Date x ticker price panel.
+        # each pair keeps its own bars (dates where both tickers have a price), so trades
+        # and files match running PairBackTester on every pair one at a time.
+        # hedge_mode "kalman" filters every pair's hedge ratio together, see hedge_signal
+        self.pairs = list(pairs)
+        self.price_panel = price_panel
+        self.store = store
+        self.z_upper_thresh = z_threshold[0]
+        self.z_lower_thresh = z_threshold[1]
+        self.short_lookback = lookback_periods[0]
+        self.long_lookback = lookback_periods[1]
+        self.params = results_params(lookback_periods, hedge_mode)
+        self.initial_capital = initial_capital
+        self.build_pair_arrays()
+        # time x pair arrays, column p holds bar 0..n_bars[p]-1 of pair p
+        self.ratios, signal = hedge_signal(self.price_1, self.price_2, hedge_mode)
+        signal = pd.DataFrame(signal)
+        ma_short = signal.rolling(window = self.short_lookback, center = False).mean()
+        ma_long = signal.rolling(window = self.long_lookback, center = False).mean()
+        std = signal.rolling(window = self.long_lookback, center = False).std()
+        self.zscore = ((ma_short - ma_long)/std).values
+        self.create_directories()
+        
+    def build_pair_arrays(self):
+        # line up the bars of every pair as columns of one padded array
+        self.n_bars, self.bar_rows, self.price_1, self.price_2 = pair_price_arrays(self.pairs, self.price_panel)
+            
+    def create_directories(self):
+        main_directory = "PairsResults"+self.params
+        
+        if not os.path.exists(main_directory):
+            os.makedirs(main_directory)
+        if self.store is not None:
+            # pair directories only hold text trade files
+            return
+        for stock_1, stock_2 in self.pairs:
+            directory_pair = main_directory + "/{0}_{1}".format(stock_1, stock_2)
+            if not os.path.exists(directory_pair):
+                os.makedirs(directory_pair)
+                
+    def reset_state(self):
+        # one element per pair for every piece of PairBackTester trade state
+        n_pairs = len(self.pairs)
+        self.long_pos = np.zeros(n_pairs, dtype=bool)
+        self.short_pos = np.zeros(n_pairs, dtype=bool)
+        self.position = np.full(n_pairs, FLAT, dtype=int)
+        self.pos1 = np.zeros(n_pairs)
+        self.pos2 = np.zeros(n_pairs)
+        self.orig_ratio = np.zeros(n_pairs)
+        self.pnl = np.zeros(n_pairs)
+        self.trade_pnl = np.zeros(n_pairs)
+        self.max_day = np.zeros(n_pairs)
+        self.min_day = np.zeros(n_pairs)
+        self.n_pnl = np.zeros(n_pairs, dtype=int)
+        self.days_in_trade = np.zeros(n_pairs, dtype=int)
+        self.entry_bar = np.full(n_pairs, -1, dtype=int)
+        self.trade_no = np.zeros(n_pairs, dtype=int)
+        self.finished_open = np.zeros(n_pairs, dtype=bool)
+        self.seq = 0
+        self.records = RecordBuffer(BATCH_RECORD_DTYPE, 64 * n_pairs)
+        self.trades = RecordBuffer(BATCH_TRADE_DTYPE, 4 * n_pairs)
+        
+    def collect_data(self, mask, ii, bar):
+        # one BATCH_RECORD_DTYPE daily record for every pair in mask
+        current_1, current_2, yest_1, yest_2, tr_ratio, zscore = bar
+        idx = np.nonzero(mask)[0]
+        rec = self.records.extend(len(idx))
+        rec['pair'] = idx
+        rec['trade_no'] = self.trade_no[idx]
+        rec['seq'] = self.seq
+        rec['bar'] = ii
+        rec['position'] = self.position[idx]
+        rec['zscore'] = zscore[idx]
+        rec['pos1'] = self.pos1[idx]
+        rec['pos2'] = self.pos2[idx]
+        rec['ratio'] = tr_ratio[idx]
+        rec['price_1'] = current_1[idx]
+        rec['price_2'] = current_2[idx]
+        rec['days'] = self.days_in_trade[idx]
+        rec['pnl'] = self.pnl[idx]
+        self.seq += 1
+        
+    def set_new_trades(self, mask, side, ii, bar):
+        current_1, current_2, yest_1, yest_2, tr_ratio, zscore = bar
+        self.position[mask] = side
+        if side == LONG:
+            self.long_pos[mask] = True
+            self.pos1[mask] = self.initial_capital/current_1[mask]
+        else:
+            self.short_pos[mask] = True
+            self.pos1[mask] = self.initial_capital/current_1[mask] * -1.0
+        # if pos1 is long, pos2 is short, vice versa if pos1 is short, pos2 is long
+        self.pos2[mask] = self.pos1[mask] * tr_ratio[mask] * -1.0
+        self.orig_ratio[mask] = tr_ratio[mask]
+        self.pnl[mask] = 0.0
+        self.entry_bar[mask] = ii
+        self.collect_data(mask, ii, bar)
+        
+    def calc_day_PnL(self, mask, ii, bar):
+        current_1, current_2, yest_1, yest_2, tr_ratio, zscore = bar
+        self.days_in_trade[mask] += 1
+        pnl = ((current_1[mask] - yest_1[mask]) * self.pos1[mask]) + ((current_2[mask] - yest_2[mask]) * self.pos2[mask])
+        self.pnl[mask] = pnl
+        self.trade_pnl[mask] += pnl
+        # running max / min that keep the first extreme, like max() and min() on a list
+        first = self.n_pnl[mask] == 0
+        self.max_day[mask] = np.where(first | (pnl > self.max_day[mask]), pnl, self.max_day[mask])
+        self.min_day[mask] = np.where(first | (pnl < self.min_day[mask]), pnl, self.min_day[mask])
+        self.n_pnl[mask] += 1
+        self.collect_data(mask, ii, bar)
+        
+    def close_trades(self, mask, ii):
+        # BATCH_TRADE_DTYPE summary of every trade closing today, first_rec and last_rec
+        # are filled in write_all_data
+        idx = np.nonzero(mask)[0]
+        n_pnl = self.n_pnl[idx]
+        has_pnl = n_pnl > 0
+        trade = self.trades.extend(len(idx))
+        trade['pair'] = idx
+        trade['trade_no'] = self.trade_no[idx]
+        trade['entry_bar'] = self.entry_bar[idx]
+        trade['position'] = self.position[idx]
+        trade['pos1'] = self.pos1[idx]
+        trade['pos2'] = self.pos2[idx]
+        trade['orig_ratio'] = self.orig_ratio[idx]
+        trade['exit_bar'] = ii
+        # trade_pnl adds daily pnl in order, so it equals sum() of the pnl history
+        trade['trd_mean'] = np.where(has_pnl, self.trade_pnl[idx] / np.maximum(n_pnl, 1), 0.0)
+        trade['max_day'] = np.where(has_pnl, self.max_day[idx], 0.0)
+        trade['min_day'] = np.where(has_pnl, self.min_day[idx], 0.0)
+        trade['days'] = self.days_in_trade[idx]
+        trade['pnl'] = self.trade_pnl[idx]
+        
+    def reset_trades(self, mask):
+        self.trade_pnl[mask] = 0.0
+        self.pnl[mask] = 0.0
+        self.pos1[mask] = 0.0
+        self.pos2[mask] = 0.0
+        self.orig_ratio[mask] = 0.0
+        self.short_pos[mask] = False
+        self.long_pos[mask] = False
+        self.position[mask] = FLAT
+        self.days_in_trade[mask] = 0
+        self.n_pnl[mask] = 0
+        self.trade_no[mask] += 1
+        
+    def backtest(self):
+        # step the PairBackTester entry / exit blocks for every pair on each bar
+        self.reset_state()
+        last_bar = self.n_bars - 1
+
+        # callbacks of step_trade_rules, they read the bar being stepped
+        def enter(mask, side):
+            self.set_new_trades(mask, side, ii, bar)
+
+        def mark(mask):
+            self.calc_day_PnL(mask, ii, bar)
+
+        def close(mask, final):
+            self.close_trades(mask, ii)
+            if final:
+                self.finished_open[mask] = True
+            else:
+                self.reset_trades(mask)
+
+        for ii in range(1, len(self.price_1)):
+            active = ii <= last_bar
+            bar = (self.price_1[ii], self.price_2[ii], self.price_1[ii-1], self.price_2[ii-1],
+                   self.ratios[ii-1], self.zscore[ii-1])
+            step_trade_rules(ii, bar[5], active, ii == last_bar, self.long_pos, self.short_pos, self.entry_bar,
+                             self.z_upper_thresh, self.z_lower_thresh, enter, mark, close)
+
+        self.write_all_data()
+        
+    def write_all_data(self):
+        # sort records and trades by pair, then write every pair in list order
+        n_pairs = len(self.pairs)
+        records = self.records.values()
+        trades = self.trades.values()
+        records = records[np.lexsort((records['seq'], records['pair']))]
+        trades = trades[np.lexsort((trades['trade_no'], trades['pair']))]
+        # the sorted copies replace the buffers
+        self.records = None
+        self.trades = None
+        rec_bounds = np.searchsorted(records['pair'], np.arange(n_pairs + 1))
+        trd_bounds = np.searchsorted(trades['pair'], np.arange(n_pairs + 1))
+        window_dates = date_strings(self.price_panel.index)
+        batch_trades = []
+        
+        for pp, (stock_1, stock_2) in enumerate(self.pairs):
+            pair_records = records[rec_bounds[pp]:rec_bounds[pp+1]]
+            pair_trades = trades[trd_bounds[pp]:trd_bounds[pp+1]]
+            if len(pair_trades):
+                # records of one trade are contiguous once sorted by sequence
+                pair_trades['first_rec'] = np.searchsorted(pair_records['trade_no'], pair_trades['trade_no'], side='left')
+                pair_trades['last_rec'] = np.searchsorted(pair_records['trade_no'], pair_trades['trade_no'], side='right')
+                dates = [window_dates[row] for row in self.bar_rows[:self.n_bars[pp], pp].tolist()]
+                batch_trades.extend(pair_trade_rows(stock_1, stock_2, dates, pair_records, pair_trades))
+            if self.finished_open[pp]:
+                instrumentation.progress('finished', "Finished trading for {0}", (stock_1, stock_2))
+            # text rows are formatted and written in batches, not held for the whole window
+            if len(batch_trades) >= WRITE_BATCH_TRADES:
+                write_trades(self.params, batch_trades, self.store)
+                batch_trades = []
+        
+        write_trades(self.params, batch_trades, self.store)
+
+
 def main():
+    # simulate all pairs of a window together, False runs one PairBackTester per pair
+    use_batch_engine = True
+    # save trades to one indexed trade store, False writes the original text files
+    use_trade_store = True
+    # hedge ratio of the second leg, "ratio" (price ratio) or "kalman" (time varying, kalman_hedge).
+    # kalman results go to their own PairsResults_5_30_kalman directory and store
+    hedge_mode = "ratio"
+    # rate limited progress messages, logging.DEBUG shows every one
+    instrumentation.configure_logging(logging.INFO)
     # DB INFO FILE - host, user, password, db_name
-    db_credential_info_p = "\\" + "database_info.txt"
+    db_credential_info_p = "database_info.txt"
     
     # create our instance variables for host, username, password and database name
-    db_host, db_user, db_password, db_name = cm.load_db_credential_info(db_credential_info_p)
-    conn = psycopg2.connect(host=db_host,database=db_name, user=db_user, password=db_password)
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
     
     # LOAD ALL COINTEGRATED FILE NAMES INTO A LIST
     all_pairs_files = []
+    store = None
     
-    for file_name in glob.glob("coint_method_pairs_*.txt"):
+    # window order, same trade order as the store written by pipeline.py
+    for file_name in sorted(glob.glob("coint_method_pairs_*.txt")):
         all_pairs_files.append(file_name)
 
     
     for pairs_file in all_pairs_files:
         
         # LOAD COINTEGRATED PAIRS
-        cur_path = os.getcwd()
-        full_path = cur_path + "\\" + pairs_file
-        
-        # extract start date from file name
-        # creating dates for the start of backtest and end of backtest
-        year_int = int(pairs_file.split(".")[0].split('_')[-1][0:4])
-        end_yr_int = year_int + 1
-        month_int = int(pairs_file.split(".")[0].split('_')[-1][4:6])
+        full_path = os.path.join(os.getcwd(), pairs_file)
+        # out of sample dates of the window, z-scores warm up over the month before
+        trd_start_dt, trd_end_dt = trading_window(pairs_file, conn)
+        sector_pairs = load_pairs_file(full_path)
+      
+        print("Starting BT from {0} to {1}".format(trd_start_dt.strftime('%Y%m%d'), trd_end_dt.strftime('%Y%m%d')))
         
-        # start in month 11 not 12 to allow zscores to be calculated
-        mth = 11
-        last_tr_day_start = cm.fetch_last_day_any_mth(end_yr_int, mth, conn)
-        trd_start_dt = datetime.date(year_int,month_int - 1,last_tr_day_start)
+        short_window = 5
+        long_window = 30
         
-        # we need the final day of our year
-        mth = 12
-        last_tr_day_end = cm.fetch_last_day_any_mth(end_yr_int, mth, conn)
-        trd_end_dt = datetime.date(end_yr_int,month_int,last_tr_day_end)
+        # BUILDING OUR CLASS
+        z_threshold = [1.0, 0.0]
+        lookback_periods = [short_window, long_window]
+        initial_capital = 50000.0
         
-        # load each pair to its appropriate sector key
-        pairs_dict = {}
+        if use_trade_store and store is None:
+            # a rerun replaces the trades of an earlier run instead of adding a second copy
+            store_directory = "PairsResults" + results_params(lookback_periods, hedge_mode)
+            trade_store.remove_store(store_directory)
+            store = trade_store.TradeStore(store_directory)
         
-        with open(full_path) as f:
-            for line in f:
-               (key, val1, val2) = line.split(",")
-               if key in pairs_dict:
-                   pairs_dict[key].append((val1, val2.strip("\n")))
-               else:
-                   pairs_dict[key] = [(val1, val2.strip("\n"))]
-      
-        print("Starting BT from {0} to {1}".format(trd_start_dt.strftime('%Y%m%d'), trd_end_dt.strftime('%Y%m%d')))
+        # all pairs of our window, in file order
+        window_pairs = [pair for sector, pair in sector_pairs]
         
-        # BEGIN OUR BACKTEST PER EQUITY PAIR PER DATE RANGE
-        for sector, ticker_arr in pairs_dict.items():
-            for pair in ticker_arr:
-                if pair != ('GOOG','GOOGL'):
+        window_str = trd_end_dt.strftime('%Y%m%d')
+        instrumentation.count('pairs_backtested', len(window_pairs))
+        if use_batch_engine:
+            with instrumentation.tagged(window=window_str):
+                # OUT OF SAMPLE DATA - one panel for every ticker of the window
+                tickers = list(dict.fromkeys([ticker for pair in window_pairs for ticker in pair]))
+                price_panel = cm.load_price_panel(tickers, trd_start_dt, trd_end_dt, conn)
+                
+                with instrumentation.span('backtest'):
+                    window_bt = BatchPairBackTester(window_pairs, price_panel, z_threshold, lookback_periods,
+                                                    initial_capital, store, hedge_mode)
+                    window_bt.backtest()
+        else:
+            # BEGIN OUR BACKTEST PER EQUITY PAIR PER DATE RANGE
+            for pair in window_pairs:
+                # per pair spans, the run report lists the slowest pairs
+                with instrumentation.tagged(window=window_str, pair="{0}-{1}".format(*pair)):
                     # OUT OF SAMPLE DATA
-    
-                    array_df_data_tr = cm.load_df_stock_data_array(pair, trd_start_dt, trd_end_dt, conn)
-                    merged_data_tr = cm.data_array_merge(array_df_data_tr)
-                    
-                    short_window = 5
-                    long_window = 30
-                    #trade_PNL = trade(merged_data_tr, pair, short_window, long_window)
+                    merged_data_tr = cm.load_price_panel(pair, trd_start_dt, trd_end_dt, conn).dropna()
                     
-                    # BUILDING OUR CLASS
-                    z_threshold = [1.0, 0.0]
-                    lookback_periods = [short_window, long_window]
-                    initial_capital = 50000.0
-                    
-                    new_pair = PairBackTester(pair, merged_data_tr, z_threshold, lookback_periods, initial_capital)
-                    new_pair.backtest()
-
+                    with instrumentation.span('backtest'):
+                        new_pair = PairBackTester(pair, merged_data_tr, z_threshold, lookback_periods,
+                                                  initial_capital, store, hedge_mode)
+                        new_pair.backtest()
 
         print("Completed BT from {0} to {1}".format(trd_start_dt.strftime('%Y%m%d'), trd_end_dt.strftime('%Y%m%d')))
+    
+    if store is not None:
+        store.close()
+    # per stage totals, per window breakdowns and slowest pairs
+    instrumentation.write_report("run_report_pairs_backtester.json")
 
     
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:02:47 2026
+
+"""
+
+# PARAMETER SWEEP - LOOKBACK AND Z-SCORE THRESHOLD GRIDS
+# rolling statistics come from prefix sums computed once per pair, every z-score series
+# is reused across all entry / exit threshold combinations in one vectorized pass
+
+import glob
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+import common_methods as cm
+import pairs_backtester as pb
+
+RESULT_COLUMNS = ['Short', 'Long', 'Entry', 'Exit', 'Trades', 'Winners', 'WinPerc',
+                  'TotalPnL', 'AvgTrade', 'MaxWinner', 'MaxLoser', 'AvgWinner', 'AvgLoser', 'AvgDays']
+
+ACCUMULATOR_COLUMNS = ['Short', 'Long', 'Entry', 'Exit', 'Trades', 'Winners', 'TotalPnL',
+                       'WinPnL', 'MaxWinner', 'MaxLoser', 'TotalDays']
+
+
+def prefix_moments(values):
+    """
+    prefix sums and sums of squares of every column, with a leading row of zeros
+    args:
+        values: 2d np.array, time x pair, NaN padded past each pair's last bar
+    returns:
+        sums (np.array), sums_sq (np.array), means (np.array)
+        sums are of the values minus their column means, so sums of squares do not cancel out
+    """
+    counts = np.sum(~np.isnan(values), axis=0)
+    means = np.nansum(values, axis=0) / np.maximum(counts, 1)
+    centered = values - means
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.concatenate([zeros, np.cumsum(centered, axis=0)])
+    sums_sq = np.concatenate([zeros, np.cumsum(centered * centered, axis=0)])
+    return sums, sums_sq, means
+
+
+def rolling_mean(sums, means, window):
+    """
+    trailing rolling mean from prefix sums, NaN until a full window is available
+    args:
+        sums: prefix sums from prefix_moments
+        means: column means removed in prefix_moments
+        window: lookback, type int
+    returns:
+        2d np.array, time x pair
+    """
+    out = np.full((sums.shape[0] - 1, sums.shape[1]), np.nan)
+    out[window-1:] = (sums[window:] - sums[:-window]) / window + means
+    return out
+
+
+def rolling_std(sums, sums_sq, window):
+    """
+    trailing rolling sample standard deviation from prefix sums, NaN until a full window
+    args:
+        sums: prefix sums from prefix_moments
+        sums_sq: prefix sums of squares from prefix_moments
+        window: lookback, type int
+    returns:
+        2d np.array, time x pair
+    """
+    out = np.full((sums.shape[0] - 1, sums.shape[1]), np.nan)
+    win_sum = sums[window:] - sums[:-window]
+    win_sq = sums_sq[window:] - sums_sq[:-window]
+    var = (win_sq - win_sum * win_sum / window) / (window - 1)
+    out[window-1:] = np.sqrt(np.maximum(var, 0.0))
+    return out
+
+
+def simulate_trades(price_1, price_2, ratios, zscore, n_bars, upper, lower, capital):
+    """
+    pb.step_trade_rules for many columns at once, keeping only closed trade PnL and
+    length. columns can repeat a pair with different thresholds
+    args:
+        price_1, price_2, ratios, zscore: 2d np.array, time x column
+        n_bars: np.array, number of bars of every column
+        upper: np.array, entry threshold of every column
+        lower: np.array, exit threshold of every column
+        capital: capital allocated to each leg, type float
+    returns:
+        trade_col (np.array), trade_pnl (np.array), trade_days (np.array), one element per closed trade
+    """
+    n_cols = price_1.shape[1]
+    last_bar = n_bars - 1
+    long_pos = np.zeros(n_cols, dtype=bool)
+    short_pos = np.zeros(n_cols, dtype=bool)
+    pos1 = np.zeros(n_cols)
+    pos2 = np.zeros(n_cols)
+    entry_bar = np.full(n_cols, -1, dtype=int)
+    days = np.zeros(n_cols, dtype=int)
+    trade_pnl = np.zeros(n_cols)
+    closed = []
+
+    # callbacks of pb.step_trade_rules, they read the bar being stepped
+    def enter(mask, side):
+        if side == pb.LONG:
+            long_pos[mask] = True
+            pos1[mask] = capital/current_1[mask]
+        else:
+            short_pos[mask] = True
+            pos1[mask] = capital/current_1[mask] * -1.0
+        pos2[mask] = pos1[mask] * tr_ratio[mask] * -1.0
+        entry_bar[mask] = ii
+
+    def mark(mask):
+        days[mask] += 1
+        trade_pnl[mask] += (day_1[mask] * pos1[mask]) + (day_2[mask] * pos2[mask])
+
+    def close(mask, final):
+        idx = np.nonzero(mask)[0]
+        closed.append((idx, trade_pnl[idx].copy(), days[idx].copy()))
+        # a column never trades again after its last bar
+        if not final:
+            long_pos[mask] = False
+            short_pos[mask] = False
+            pos1[mask] = 0.0
+            pos2[mask] = 0.0
+            days[mask] = 0
+            trade_pnl[mask] = 0.0
+
+    for ii in range(1, price_1.shape[0]):
+        current_1 = price_1[ii]
+        day_1 = current_1 - price_1[ii-1]
+        day_2 = price_2[ii] - price_2[ii-1]
+        tr_ratio = ratios[ii-1]
+        pb.step_trade_rules(ii, zscore[ii-1], ii <= last_bar, ii == last_bar, long_pos, short_pos, entry_bar,
+                            upper, lower, enter, mark, close)
+
+    if not closed:
+        return np.zeros(0, dtype=int), np.zeros(0), np.zeros(0, dtype=int)
+    trade_col = np.concatenate([chunk[0] for chunk in closed])
+    pnl = np.concatenate([chunk[1] for chunk in closed])
+    trade_days = np.concatenate([chunk[2] for chunk in closed])
+    return trade_col, pnl, trade_days
+
+
+class ParameterSweep():
+
+    def __init__(self, pairs, price_panel, short_windows, long_windows, entry_thresholds,
+                 exit_thresholds, initial_capital):
+        self.pairs = list(pairs)
+        self.price_panel = price_panel
+        self.lookbacks = list(itertools.product(short_windows, long_windows))
+        self.thresholds = list(itertools.product(entry_thresholds, exit_thresholds))
+        self.initial_capital = initial_capital
+        self.n_bars, self.bar_rows, self.price_1, self.price_2 = pb.pair_price_arrays(self.pairs, self.price_panel)
+        self.ratios = self.price_1 / self.price_2
+        # shared by every lookback, any rolling window is now O(n)
+        self.sums, self.sums_sq, self.means = prefix_moments(self.ratios)
+
+    def zscore(self, short_window, long_window):
+        ma_short = rolling_mean(self.sums, self.means, short_window)
+        ma_long = rolling_mean(self.sums, self.means, long_window)
+        std = rolling_std(self.sums, self.sums_sq, long_window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (ma_short - ma_long)/std
+
+    def run(self):
+        """
+        backtest every lookback and threshold combination
+        returns:
+            pandas dataframe with accumulators per parameter set, see summarize
+        """
+        n_pairs = len(self.pairs)
+        n_thresh = len(self.thresholds)
+        # column k * n_pairs + p is pair p traded with threshold set k
+        upper = np.repeat([entry for entry, ext in self.thresholds], n_pairs)
+        lower = np.repeat([ext for entry, ext in self.thresholds], n_pairs)
+        tile = lambda arr: np.tile(arr, (1, n_thresh))
+        price_1 = tile(self.price_1)
+        price_2 = tile(self.price_2)
+        ratios = tile(self.ratios)
+        n_bars = np.tile(self.n_bars, n_thresh)
+
+        rows = []
+        for short_window, long_window in self.lookbacks:
+            zscore = tile(self.zscore(short_window, long_window))
+            trade_col, trade_pnl, trade_days = simulate_trades(price_1, price_2, ratios, zscore, n_bars,
+                                                               upper, lower, self.initial_capital)
+            thresh_idx = trade_col // max(n_pairs, 1)
+            for kk, (entry, ext) in enumerate(self.thresholds):
+                sel = thresh_idx == kk
+                rows.append(trade_accumulators(short_window, long_window, entry, ext,
+                                               trade_pnl[sel], trade_days[sel]))
+        return pd.DataFrame(rows, columns=ACCUMULATOR_COLUMNS)
+
+
+def trade_accumulators(short_window, long_window, entry, ext, trade_pnl, trade_days):
+    # additive per parameter set totals, so windows can be combined before summarize
+    return [short_window, long_window, entry, ext, len(trade_pnl), int(np.sum(trade_pnl > 0)),
+            trade_pnl.sum(), trade_pnl[trade_pnl > 0].sum(),
+            trade_pnl.max() if len(trade_pnl) else np.nan,
+            trade_pnl.min() if len(trade_pnl) else np.nan, int(trade_days.sum())]
+
+
+def summarize(accumulators):
+    """
+    compact results table, one row per parameter set, with the trade_stats metrics
+    args:
+        accumulators: pandas dataframe from ParameterSweep.run, or several concatenated
+    returns:
+        pandas dataframe with RESULT_COLUMNS
+    """
+    keys = ['Short', 'Long', 'Entry', 'Exit']
+    totals = accumulators.groupby(keys, sort=False).agg({'Trades': 'sum', 'Winners': 'sum',
+                                                         'TotalPnL': 'sum', 'WinPnL': 'sum',
+                                                         'MaxWinner': 'max', 'MaxLoser': 'min',
+                                                         'TotalDays': 'sum'}).reset_index()
+    trades = totals['Trades'].replace(0, np.nan)
+    losers = (totals['Trades'] - totals['Winners']).replace(0, np.nan)
+    totals['WinPerc'] = totals['Winners'] / trades
+    totals['AvgTrade'] = totals['TotalPnL'] / trades
+    totals['AvgWinner'] = totals['WinPnL'] / totals['Winners'].replace(0, np.nan)
+    totals['AvgLoser'] = (totals['TotalPnL'] - totals['WinPnL']) / losers
+    totals['AvgDays'] = totals['TotalDays'] / trades
+    return totals[RESULT_COLUMNS]
+
+
+def main():
+    # PARAMETER GRIDS
+    short_windows = [3, 5, 10]
+    long_windows = [20, 30, 60]
+    entry_thresholds = [0.75, 1.0, 1.5, 2.0]
+    exit_thresholds = [0.0, 0.25, 0.5]
+    initial_capital = 50000.0
+
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+
+    # create our instance variables for host, username, password and database name
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
+
+    window_results = []
+
+    for pairs_file in sorted(glob.glob("coint_method_pairs_*.txt")):
+        # same backtest date range and pairs as pairs_backtester.main
+        trd_start_dt, trd_end_dt = pb.trading_window(pairs_file, conn)
+        window_pairs = [pair for sector, pair in pb.load_pairs_file(os.path.join(os.getcwd(), pairs_file))]
+
+        tickers = list(dict.fromkeys([ticker for pair in window_pairs for ticker in pair]))
+        price_panel = cm.load_price_panel(tickers, trd_start_dt, trd_end_dt, conn)
+
+        sweep = ParameterSweep(window_pairs, price_panel, short_windows, long_windows,
+                               entry_thresholds, exit_thresholds, initial_capital)
+        window_results.append(sweep.run())
+        print("Completed sweep from {0} to {1}".format(trd_start_dt.strftime('%Y%m%d'), trd_end_dt.strftime('%Y%m%d')))
+
+    results = summarize(pd.concat(window_results, ignore_index=True))
+    results.to_csv("parameter_sweep_results.txt", index=False)
+    print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
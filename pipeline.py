@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 01:07:52 2026
+
+"""
+
+# PIPELINE - SCREENING, BACKTEST AND ANALYSIS AS ONE DAG OF CACHED TASKS
+# every unit of work is a task with a key, the keys of the tasks it reads from and the files
+# it writes. a task is skipped when its fingerprint and its outputs match our manifest:
+#
+#   screen/<window>/<sector>      coint pairs of one sector       <- tickers, prices, p-value, cascade
+#   pairs/<window>                coint_method_pairs_<window>.txt <- screen tasks of the window
+#   backtest/<params>/<window>    trade store of one window       <- pairs file, prices, backtest params
+#   store/<params>                PairsResults<params> store      <- backtest tasks of every window
+#   analysis/<params>             daily_results<params>.txt, ...  <- store, analysis dates
+#
+# fingerprint = sha1 of the task's own inputs plus the output digests of the tasks it reads from,
+# so a change only reruns the tasks downstream of it. when a rerun writes the same output as
+# before (ex: a new p-value keeps the pairs of a window) the tasks after it stay current.
+# the manifest keeps (size, mtime, sha1) of every output, a file is only re-hashed after it changed
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+import common_methods as cm
+import coint_cache
+import identifying_pairs
+import instrumentation
+import pairs_backtester as pb
+import trade_analysis
+import trade_store
+
+PIPELINE_DIRECTORY = "pipeline_cache"
+MANIFEST_NAME = "manifest.json"
+# every backtest is run once per parameter set, results go to PairsResults + pb.results_params
+PARAMETER_SETS = [{'z_threshold': [1.0, 0.0], 'lookback_periods': [5, 30], 'initial_capital': 50000.0,
+                   'hedge_mode': "ratio"}]
+
+
+def file_digest(path):
+    """
+    sha1 of a file's bytes
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prices_digest(price_panel):
+    """
+    one hash of every column of a price panel with its dates, see coint_cache.column_hashes
+    """
+    return hashlib.sha1(",".join(coint_cache.column_hashes(price_panel.index, price_panel.values)
+                                 ).encode()).hexdigest()
+
+
+def screening_settings(p_value, cascade):
+    """
+    settings that change the pairs found for the same prices
+    args:
+        p_value: threshold for accepting a pairs model, type float
+        cascade: screening_cascade.ScreeningCascade object or None
+    returns:
+        dict of json values
+    """
+    settings = {'p_value': p_value, 'coint': coint_cache.SETTINGS, 'exclude': ['SPY']}
+    if cascade is not None:
+        settings['cascade'] = {key: value for key, value in vars(cascade).items()
+                               if key not in ('report', 'survivors')}
+    return settings
+
+
+class Task():
+    # pipeline stage of the task, used for per stage counters and spans
+    stage = None
+
+    def __init__(self, key, deps=(), outputs=()):
+        """
+        args:
+            key: unique name of the task, ex: "screen/20061229/Energy"
+            deps: keys of the tasks whose outputs this task reads
+            outputs: paths of the files this task writes
+        """
+        self.key = key
+        self.deps = list(deps)
+        self.outputs = list(outputs)
+
+    def inputs(self, pipeline):
+        """
+        everything the task reads apart from the outputs of deps
+        returns:
+            json serializable value, part of the task fingerprint
+        """
+        return None
+
+    def run(self, pipeline):
+        raise NotImplementedError
+
+    @classmethod
+    def run_batch(cls, tasks, pipeline):
+        """
+        run stale tasks of this class, any error is caught so one bad task does not stop the run
+        returns:
+            list of error messages or None, one per task
+        """
+        errors = []
+        for task in tasks:
+            try:
+                task.run(pipeline)
+                errors.append(None)
+            except Exception as err:
+                errors.append(repr(err))
+        return errors
+
+
+class ScreenTask(Task):
+    stage = 'screen'
+
+    def __init__(self, task, p_value=identifying_pairs.P_VALUE, directory=PIPELINE_DIRECTORY):
+        """
+        args:
+            task: tuple (end_dt_str, sector, ticker_arr, start_dt, end_dt) from build_screening_tasks
+            p_value: threshold for accepting a pairs model, type float
+        """
+        end_dt_str, sector = task[0], task[1]
+        Task.__init__(self, "screen/{0}/{1}".format(end_dt_str, sector),
+                      outputs=[os.path.join(directory, "screen", "{0}_{1}.txt".format(end_dt_str, sector))])
+        self.task = task
+        self.p_value = p_value
+
+    def inputs(self, pipeline):
+        end_dt_str, sector, ticker_arr, start_dt, end_dt = self.task
+        price_panel = cm.load_price_panel(ticker_arr, start_dt, end_dt, pipeline.conn)
+        return {'tickers': list(ticker_arr), 'start': str(start_dt), 'end': str(end_dt),
+                'prices': prices_digest(price_panel),
+                'settings': screening_settings(self.p_value, identifying_pairs.SCREENING_CASCADE)}
+
+    @classmethod
+    def run_batch(cls, tasks, pipeline):
+        # every stale sector of every window on one process pool, one pool per p-value
+        groups = {}
+        for ii, task in enumerate(tasks):
+            groups.setdefault(task.p_value, []).append(ii)
+        errors = [None] * len(tasks)
+        for p_value, task_ids in groups.items():
+            results = identifying_pairs.run_screening_tasks([tasks[ii].task for ii in task_ids], pipeline.db_info,
+                                                            pipeline.n_workers, p_value=p_value)
+            for ii, (pairs, error) in zip(task_ids, results):
+                if error is not None:
+                    errors[ii] = error
+                    continue
+                task = tasks[ii]
+                directory = os.path.dirname(task.outputs[0])
+                if not os.path.exists(directory):
+                    os.makedirs(directory)
+                instrumentation.count("pairs_found", len(pairs))
+                cm.write_dict_text(os.path.splitext(task.outputs[0])[0], {task.task[1]: pairs})
+        return errors
+
+
+class PairsFileTask(Task):
+    stage = 'pairs'
+
+    def __init__(self, end_dt_str, screen_tasks):
+        """
+        one coint_method_pairs file from the screen tasks of a window, in sector order
+        """
+        Task.__init__(self, "pairs/{0}".format(end_dt_str), [task.key for task in screen_tasks],
+                      ["coint_method_pairs_{0}.txt".format(end_dt_str)])
+        self.sector_files = [task.outputs[0] for task in screen_tasks]
+
+    def run(self, pipeline):
+        with open(self.outputs[0], 'w') as f:
+            for f_name in self.sector_files:
+                with open(f_name) as sector_file:
+                    f.write(sector_file.read())
+
+
+class BacktestTask(Task):
+    stage = 'backtest'
+
+    def __init__(self, pairs_task, parameters, directory=PIPELINE_DIRECTORY):
+        """
+        args:
+            pairs_task: PairsFileTask of the window
+            parameters: dict of z_threshold, lookback_periods, initial_capital and hedge_mode
+        """
+        self.params = pb.results_params(parameters['lookback_periods'], parameters['hedge_mode'])
+        self.window = pairs_task.key.split("/")[1]
+        self.store_directory = os.path.join(directory, "backtest" + self.params, self.window)
+        Task.__init__(self, "backtest/{0}/{1}".format(self.params, self.window), [pairs_task.key],
+                      [os.path.join(self.store_directory, trade_store.STORE_NAME)])
+        self.pairs_file = pairs_task.outputs[0]
+        self.parameters = parameters
+        self.price_panel = None
+
+    def inputs(self, pipeline):
+        self.trd_start_dt, self.trd_end_dt = pb.trading_window(self.pairs_file, pipeline.conn)
+        self.pairs = [pair for sector, pair in pb.load_pairs_file(self.pairs_file)]
+        tickers = list(dict.fromkeys([ticker for pair in self.pairs for ticker in pair]))
+        # kept for run, the panel is only loaded once
+        self.price_panel = cm.load_price_panel(tickers, self.trd_start_dt, self.trd_end_dt, pipeline.conn)
+        return {'parameters': self.parameters, 'start': str(self.trd_start_dt), 'end': str(self.trd_end_dt),
+                'prices': prices_digest(self.price_panel)}
+
+    def run(self, pipeline):
+        trade_store.remove_store(self.store_directory)
+        store = trade_store.TradeStore(self.store_directory)
+        try:
+            instrumentation.count('pairs_backtested', len(self.pairs))
+            if self.pairs:
+                with instrumentation.tagged(window=self.trd_end_dt.strftime('%Y%m%d')), instrumentation.span('backtest'):
+                    window_bt = pb.BatchPairBackTester(self.pairs, self.price_panel, self.parameters['z_threshold'],
+                                                       self.parameters['lookback_periods'],
+                                                       self.parameters['initial_capital'], store,
+                                                       self.parameters['hedge_mode'])
+                    window_bt.backtest()
+        finally:
+            store.close()
+            self.price_panel = None
+
+
+class StoreTask(Task):
+    stage = 'store'
+
+    def __init__(self, backtest_tasks, params):
+        """
+        the PairsResults store of one parameter set, every window in window order
+        """
+        self.main_directory = "PairsResults" + params
+        Task.__init__(self, "store/{0}".format(params), [task.key for task in backtest_tasks],
+                      [os.path.join(self.main_directory, trade_store.STORE_NAME)])
+        self.window_directories = [task.store_directory for task in backtest_tasks]
+
+    def run(self, pipeline):
+        trade_store.remove_store(self.main_directory)
+        store = trade_store.TradeStore(self.main_directory)
+        try:
+            for directory in self.window_directories:
+                window_store = trade_store.TradeStore(directory)
+                trades = window_store.read_trades()
+                window_store.close()
+                store.add_trades(trades)
+        finally:
+            store.close()
+
+
+class AnalysisTask(Task):
+    stage = 'analysis'
+
+    def __init__(self, store_task, params, start_yr, end_yr):
+        Task.__init__(self, "analysis/{0}".format(params), [store_task.key], trade_analysis.analysis_files(params))
+        self.params = params
+        self.start_yr = start_yr
+        self.end_yr = end_yr
+
+    def inputs(self, pipeline):
+        self.start_dt, self.end_dt = trade_analysis.analysis_window(self.start_yr, self.end_yr, pipeline.conn)
+        return {'start': str(self.start_dt), 'end': str(self.end_dt)}
+
+    def run(self, pipeline):
+        with instrumentation.tagged(params=self.params):
+            trade_analysis.analyze_results(self.params, self.start_dt, self.end_dt, pipeline.conn)
+
+
+def build_tasks(screening_tasks, parameter_sets, start_yr, end_yr, p_value=identifying_pairs.P_VALUE,
+                directory=PIPELINE_DIRECTORY):
+    """
+    every task of a full run, deps before the tasks reading them
+    args:
+        screening_tasks: list of tasks from identifying_pairs.build_screening_tasks
+        parameter_sets: list of backtest parameter dicts, see PARAMETER_SETS
+        start_yr, end_yr: years of our analysis, see trade_analysis.analysis_window
+        p_value: threshold for accepting a pairs model, type float
+        directory: folder for the screen results and per window trade stores
+    returns:
+        list of Task objects
+    """
+    screens = {}
+    for task in screening_tasks:
+        screens.setdefault(task[0], []).append(ScreenTask(task, p_value, directory))
+    tasks = [task for window_screens in screens.values() for task in window_screens]
+    pairs_tasks = [PairsFileTask(end_dt_str, window_screens) for end_dt_str, window_screens in screens.items()]
+    tasks.extend(pairs_tasks)
+
+    seen = {}
+    for parameters in parameter_sets:
+        params = pb.results_params(parameters['lookback_periods'], parameters['hedge_mode'])
+        if params in seen:
+            raise ValueError("parameter sets {0} and {1} share the results directory PairsResults{2}".format(
+                             seen[params], parameters, params))
+        seen[params] = parameters
+        backtests = [BacktestTask(pairs_task, parameters, directory) for pairs_task in pairs_tasks]
+        store_task = StoreTask(backtests, params)
+        tasks.extend(backtests)
+        tasks.extend([store_task, AnalysisTask(store_task, params, start_yr, end_yr)])
+    return tasks
+
+
+class Pipeline():
+
+    def __init__(self, db_info, directory=PIPELINE_DIRECTORY, n_workers=1):
+        """
+        args:
+            db_info: array of db_host, db_user, db_password, db_name
+            directory: folder of our manifest and intermediate outputs
+            n_workers: worker processes of the screen stage, type int
+        """
+        self.db_info = db_info
+        self.directory = directory
+        self.n_workers = n_workers
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.conn = None
+        # key -> {'fingerprint': sha1, 'outputs': {path: [size, mtime_ns, sha1]}}
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        # key -> 'current', 'run', 'failed' or 'blocked' after run
+        self.status = {}
+        self.failures = []
+
+    def save_manifest(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(self.manifest_path + ".tmp", 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def output_digests(self, task, recorded=None):
+        """
+        (size, mtime_ns, sha1) of every output of a task, None when an output is missing.
+        the sha1 of an output whose size and mtime match recorded is not recomputed
+        """
+        recorded = recorded or {}
+        digests = {}
+        for path in task.outputs:
+            if not os.path.exists(path):
+                return None
+            stat = os.stat(path)
+            entry = recorded.get(path)
+            if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                digests[path] = entry
+            else:
+                digests[path] = [stat.st_size, stat.st_mtime_ns, file_digest(path)]
+        return digests
+
+    def fingerprint(self, task):
+        """
+        sha1 of the task inputs and the output digests of its deps
+        """
+        deps = {key: sorted([(path, entry[2]) for path, entry in self.manifest[key]['outputs'].items()])
+                for key in task.deps}
+        value = json.dumps({'inputs': task.inputs(self), 'deps': deps}, sort_keys=True, default=str)
+        return hashlib.sha1(value.encode()).hexdigest()
+
+    def is_current(self, task, fingerprint):
+        entry = self.manifest.get(task.key)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return False
+        digests = self.output_digests(task, entry['outputs'])
+        if digests is None:
+            return False
+        # an output changed by hand is rebuilt
+        if [digests[path][2] for path in task.outputs] != [entry['outputs'][path][2] for path in task.outputs]:
+            return False
+        entry['outputs'] = digests
+        return True
+
+    def set_status(self, task, status, error=None):
+        self.status[task.key] = status
+        instrumentation.count("pipeline_{0}_{1}".format(task.stage, status))
+        if error is not None:
+            self.failures.append("{0},{1}".format(task.key, error))
+            instrumentation.progress('pipeline_failed', "Task {0} {1}: {2}", task.key, status, error,
+                                     level=logging.WARNING)
+
+    def run(self, tasks):
+        """
+        run every task that is not current, in dependency order. tasks whose deps are ready run
+        together, one run_batch call per task class
+        args:
+            tasks: list of Task objects, see build_tasks
+        returns:
+            dict of key -> 'current', 'run', 'failed' or 'blocked'
+        """
+        by_key = {}
+        for task in tasks:
+            if task.key in by_key:
+                raise ValueError("duplicate task {0}".format(task.key))
+            by_key[task.key] = task
+        for task in tasks:
+            for key in task.deps:
+                if key not in by_key:
+                    raise ValueError("task {0} depends on unknown task {1}".format(task.key, key))
+
+        self.status = {}
+        self.failures = []
+        if self.conn is None:
+            self.conn = cm.connect_db(self.db_info)
+            # bring our local price cache up to date, all price loads read from it
+            cm.refresh_price_cache(self.conn)
+        remaining = list(tasks)
+        while remaining:
+            ready = [task for task in remaining if all([key in self.status for key in task.deps])]
+            if not ready:
+                raise ValueError("dependency cycle between tasks {0}".format([task.key for task in remaining]))
+            ready_keys = set([task.key for task in ready])
+            remaining = [task for task in remaining if task.key not in ready_keys]
+
+            stale = {}
+            for task in ready:
+                if any([self.status[key] in ('failed', 'blocked') for key in task.deps]):
+                    self.set_status(task, 'blocked')
+                    continue
+                try:
+                    with instrumentation.span('pipeline_fingerprint', pipeline_stage=task.stage):
+                        fingerprint = self.fingerprint(task)
+                except Exception as err:
+                    self.set_status(task, 'failed', repr(err))
+                    continue
+                if self.is_current(task, fingerprint):
+                    self.set_status(task, 'current')
+                    instrumentation.progress('pipeline_current', "Task {0} is current", task.key, level=logging.DEBUG)
+                else:
+                    stale.setdefault(type(task), []).append((task, fingerprint))
+
+            for task_class, stale_tasks in stale.items():
+                with instrumentation.span('pipeline_' + task_class.stage):
+                    errors = task_class.run_batch([task for task, fingerprint in stale_tasks], self)
+                for (task, fingerprint), error in zip(stale_tasks, errors):
+                    digests = self.output_digests(task) if error is None else None
+                    if digests is None:
+                        # rerun next time
+                        self.manifest.pop(task.key, None)
+                        self.set_status(task, 'failed', error or "missing outputs {0}".format(task.outputs))
+                    else:
+                        self.manifest[task.key] = {'fingerprint': fingerprint, 'outputs': digests}
+                        self.set_status(task, 'run')
+                        instrumentation.progress('pipeline_run', "Task {0} complete", task.key)
+            # a stopped run keeps every finished task
+            self.save_manifest()
+        return self.status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def format_summary(tasks, status):
+    """
+    one line per stage with the number of tasks in each status
+    """
+    stages = {}
+    for task in tasks:
+        counts = stages.setdefault(task.stage, {})
+        counts[status[task.key]] = counts.get(status[task.key], 0) + 1
+    return "\n".join(["{0:<10}".format(stage) + " ".join(["{0}={1}".format(name, count)
+                                                         for name, count in sorted(counts.items())])
+                      for stage, counts in stages.items()])
+
+
+def main():
+    skip_etfs = True
+    # threshold for accepting a pairs model, a change reruns screening and whatever it changes downstream
+    p_value = identifying_pairs.P_VALUE
+    # backtest parameter sets, see PARAMETER_SETS
+    parameter_sets = PARAMETER_SETS
+    # first years of the two year screening windows and the years of our analysis
+    year_array = list(range(2004, 2015))
+    start_yr = 2006
+    end_yr = 2017
+    # worker processes of the screen stage
+    n_workers = os.cpu_count() or 1
+    # rate limited progress messages, logging.DEBUG shows every task
+    instrumentation.configure_logging(logging.INFO)
+
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+
+    pipeline = Pipeline(db_info, n_workers=n_workers)
+    pipeline.conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(pipeline.conn)
+    screening_tasks = identifying_pairs.build_screening_tasks(year_array, pipeline.conn, skip_etfs)
+    tasks = build_tasks(screening_tasks, parameter_sets, start_yr, end_yr, p_value)
+
+    start = datetime.datetime.now()
+    status = pipeline.run(tasks)
+    pipeline.close()
+    if identifying_pairs.COINT_CACHE is not None:
+        # drop the least recently used results beyond the cache size limit
+        cache = coint_cache.CointCache(identifying_pairs.COINT_CACHE)
+        cache.evict()
+        cache.close()
+    print(format_summary(tasks, status))
+    print("Pipeline finished in {0}".format(datetime.datetime.now() - start))
+    if pipeline.failures:
+        cm.write_results_text_file("pipeline_failures", pipeline.failures)
+        print("{0} of {1} tasks failed.".format(len(pipeline.failures), len(tasks)))
+    # per stage totals, the pipeline_<stage>_<status> counters list skipped and rerun tasks
+    instrumentation.write_report("run_report_pipeline.json")
+
+
+if __name__ == "__main__":
+    main()
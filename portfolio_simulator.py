@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 00:21:40 2026
+
+"""
+
+# PORTFOLIO SIMULATOR - EVERY PAIR TRADED FROM ONE BOOK UNDER CAPITAL CONSTRAINTS
+# PairBackTester gives every pair its own initial_capital, so adding up trade PnLs assumes
+# as many books as there are open pairs. here the entry / exit signals of every candidate
+# pair of every window are merged into one pass over the trading days, and each day:
+#
+#   1. open positions are marked to market on the day's prices
+#   2. exits: pb.step_trade_rules, the rules of PairBackTester, plus the last bar of a pair's window
+#   3. entries: signals of flat pairs, strongest |z| first, accepted while every cap holds
+#      max_gross       - gross exposure of the book after the entry, in dollars
+#      max_pairs       - pairs open at once
+#      max_per_sector  - pairs of one sector open at once
+#      max_per_ticker  - open pairs holding the same ticker
+#
+# a rejected signal is not queued, the pair can still enter on a later bar while its
+# z-score stays past the entry threshold. prices, hedge ratios and z-scores of a window
+# are date x pair arrays built once from one price panel, no trade file is read
+
+import glob
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import common_methods as cm
+import instrumentation
+import pairs_backtester as pb
+
+TRADE_COLUMNS = ['Trade_Id', 'Entry_Date', 'Exit_Date', 'Position', 'Sector', 'Ticker1', 'Ticker2',
+                 'Ticker1_Shares', 'Ticker2_Shares', 'Ratio', 'ZScore', 'Days', 'Total_PnL']
+DAILY_COLUMNS = ['Date', 'PnL', 'Equity', 'Gross', 'OpenPairs', 'Entries', 'Exits', 'Rejected']
+REJECT_REASONS = ('gross', 'pairs', 'sector', 'ticker')
+
+
+class WindowBlock():
+
+    def __init__(self, first_row, last_row, sector_pairs, ids, price_panel, lookback_periods,
+                 hedge_mode="ratio"):
+        """
+        date x pair arrays of one window, row r is global date row first_row + r
+        args:
+            first_row, last_row: global date rows of the window, last_row excluded
+            sector_pairs: list of (sector, pair) tuples of the window
+            ids: np.array of the global candidate id of every pair
+            price_panel: Date x ticker panel of the window rows
+            lookback_periods, hedge_mode: same as BatchPairBackTester
+        """
+        self.first_row = first_row
+        self.last_row = last_row
+        self.ids = ids
+        # ids are consecutive, candidate state of the block is a view through this slice
+        self.cands = slice(ids[0], ids[-1] + 1)
+        pairs = [pair for sector, pair in sector_pairs]
+        n_rows = last_row - first_row
+        n_pairs = len(pairs)
+        # bars of every pair, hedge ratios and z-scores exactly as BatchPairBackTester
+        n_bars, bar_rows, price_1, price_2 = pb.pair_price_arrays(pairs, price_panel)
+        hedge, signal = pb.hedge_signal(price_1, price_2, hedge_mode)
+        signal = pd.DataFrame(signal)
+        ma_short = signal.rolling(window = lookback_periods[0], center = False).mean()
+        ma_long = signal.rolling(window = lookback_periods[1], center = False).mean()
+        std = signal.rolling(window = lookback_periods[1], center = False).std()
+        zscore = ((ma_short - ma_long)/std).values
+
+        # scatter bars to date rows, a bar trades on the hedge ratio and z-score of the bar before
+        kk, pp = np.nonzero(bar_rows >= 0)
+        rows = bar_rows[kk, pp]
+        self.bar = np.zeros((n_rows, n_pairs), dtype=bool)
+        self.bar[rows, pp] = True
+        self.price_1 = np.full((n_rows, n_pairs), np.nan)
+        self.price_2 = np.full((n_rows, n_pairs), np.nan)
+        self.price_1[rows, pp] = price_1[kk, pp]
+        self.price_2[rows, pp] = price_2[kk, pp]
+        self.zscore = np.full((n_rows, n_pairs), np.nan)
+        self.hedge = np.full((n_rows, n_pairs), np.nan)
+        lagged = kk > 0
+        self.zscore[rows[lagged], pp[lagged]] = zscore[kk[lagged] - 1, pp[lagged]]
+        self.hedge[rows[lagged], pp[lagged]] = hedge[kk[lagged] - 1, pp[lagged]]
+        # days without a bar keep the last price, so marking them adds nothing
+        self.price_1 = pd.DataFrame(self.price_1).ffill().values
+        self.price_2 = pd.DataFrame(self.price_2).ffill().values
+        # row of the last bar of every pair, -1 for a pair without bars
+        self.final_row = np.where(n_bars > 0, bar_rows[np.maximum(n_bars - 1, 0), np.arange(n_pairs)], -1)
+
+
+class PortfolioSimulator():
+
+    def __init__(self, price_panel, windows, sectors, z_threshold, lookback_periods, leg_capital,
+                 book_size=1000000.0, max_gross=None, max_pairs=None, max_per_sector=None,
+                 max_per_ticker=None, hedge_mode="ratio"):
+        """
+        args:
+            price_panel: Date x ticker panel of every ticker over every window, ex: cm.load_price_panel
+            windows: list of (trd_start_dt, trd_end_dt, list of (sector, pair) tuples), a window
+                     trades the panel rows after trd_start_dt up to trd_end_dt
+            sectors: list of sector names, every sector of the windows
+            z_threshold: [entry, exit] z-score thresholds, same as PairBackTester
+            lookback_periods: [short, long] rolling windows, same as PairBackTester
+            leg_capital: dollars put in the first leg of each trade, initial_capital of PairBackTester
+            book_size: starting equity of the book, type float
+            max_gross: highest gross exposure in dollars after an entry, None for no cap
+            max_pairs: most pairs open at once, None for no cap
+            max_per_sector: most pairs of one sector open at once, None for no cap
+            max_per_ticker: most open pairs holding the same ticker, None for no cap
+            hedge_mode: "ratio" or "kalman", see pairs_backtester.hedge_signal
+        """
+        self.price_panel = price_panel
+        self.dates = price_panel.index
+        self.z_upper_thresh = z_threshold[0]
+        self.z_lower_thresh = z_threshold[1]
+        self.leg_capital = leg_capital
+        self.book_size = book_size
+        self.max_gross = np.inf if max_gross is None else max_gross
+        self.max_pairs = np.inf if max_pairs is None else max_pairs
+        self.max_per_sector = np.inf if max_per_sector is None else max_per_sector
+        self.max_per_ticker = np.inf if max_per_ticker is None else max_per_ticker
+
+        # one candidate per (window, pair), state arrays are indexed by candidate id
+        self.candidates = [(sector, pair) for start_dt, end_dt, sector_pairs in windows
+                           for sector, pair in sector_pairs]
+        sector_index = dict([(sector, ss) for ss, sector in enumerate(sectors)])
+        ticker_index = dict([(ticker, tt) for tt, ticker in enumerate(price_panel.columns)])
+        self.cand_sector = np.array([sector_index[sector] for sector, pair in self.candidates], dtype=int)
+        self.cand_ticker_1 = np.array([ticker_index[pair[0]] for sector, pair in self.candidates], dtype=int)
+        self.cand_ticker_2 = np.array([ticker_index[pair[1]] for sector, pair in self.candidates], dtype=int)
+        self.n_sectors = len(sectors)
+        self.n_tickers = len(price_panel.columns)
+
+        day_numbers = np.array(self.dates, dtype='datetime64[D]')
+        self.blocks = []
+        first_id = 0
+        with instrumentation.span('portfolio_signals'):
+            for start_dt, end_dt, sector_pairs in windows:
+                first_row = np.searchsorted(day_numbers, np.datetime64(start_dt, 'D'), side='right')
+                last_row = np.searchsorted(day_numbers, np.datetime64(end_dt, 'D'), side='right')
+                tickers = list(dict.fromkeys([ticker for sector, pair in sector_pairs for ticker in pair]))
+                ids = np.arange(first_id, first_id + len(sector_pairs))
+                first_id += len(sector_pairs)
+                if len(sector_pairs) == 0 or last_row <= first_row:
+                    continue
+                self.blocks.append(WindowBlock(first_row, last_row, sector_pairs, ids,
+                                               price_panel.iloc[first_row:last_row][tickers],
+                                               lookback_periods, hedge_mode))
+        self.blocks.sort(key=lambda block: block.first_row)
+
+    def reset_state(self):
+        n_cands = len(self.candidates)
+        self.position = np.full(n_cands, pb.FLAT, dtype=int)
+        self.long_pos = np.zeros(n_cands, dtype=bool)
+        self.short_pos = np.zeros(n_cands, dtype=bool)
+        self.pos1 = np.zeros(n_cands)
+        self.pos2 = np.zeros(n_cands)
+        self.entry_row = np.full(n_cands, -1, dtype=int)
+        self.entry_ratio = np.zeros(n_cands)
+        self.entry_z = np.zeros(n_cands)
+        self.days_in_trade = np.zeros(n_cands, dtype=int)
+        self.trade_pnl = np.zeros(n_cands)
+        self.sector_open = np.zeros(self.n_sectors, dtype=int)
+        self.ticker_open = np.zeros(self.n_tickers, dtype=int)
+        self.n_open = 0
+        self.trade_chunks = []
+        self.rejected = dict([(reason, 0) for reason in REJECT_REASONS])
+
+    def close_trades(self, ids, row):
+        # trade summary of every candidate in ids, then flat
+        if len(ids) == 0:
+            return
+        chunk = np.empty((len(ids), 10))
+        chunk[:, 0] = ids
+        chunk[:, 1] = self.entry_row[ids]
+        chunk[:, 2] = row
+        chunk[:, 3] = self.position[ids]
+        chunk[:, 4] = self.pos1[ids]
+        chunk[:, 5] = self.pos2[ids]
+        chunk[:, 6] = self.entry_ratio[ids]
+        chunk[:, 7] = self.entry_z[ids]
+        chunk[:, 8] = self.days_in_trade[ids]
+        chunk[:, 9] = self.trade_pnl[ids]
+        self.trade_chunks.append(chunk)
+        np.subtract.at(self.sector_open, self.cand_sector[ids], 1)
+        np.subtract.at(self.ticker_open, self.cand_ticker_1[ids], 1)
+        np.subtract.at(self.ticker_open, self.cand_ticker_2[ids], 1)
+        self.n_open -= len(ids)
+        self.position[ids] = pb.FLAT
+        self.long_pos[ids] = False
+        self.short_pos[ids] = False
+        self.pos1[ids] = 0.0
+        self.pos2[ids] = 0.0
+        self.days_in_trade[ids] = 0
+        self.trade_pnl[ids] = 0.0
+
+    def accept_entries(self, requests, row, gross):
+        """
+        greedy entry of the day's signals, strongest |z| first
+        args:
+            requests: list of (ids, side, zscore, price_1, price_2, hedge) np.array tuples, one per block
+            row: global date row
+            gross: gross exposure of the book before the entries, type float
+        returns:
+            gross exposure after the entries, number of entries, number rejected
+        """
+        ids, side, zscore, price_1, price_2, hedge = [np.concatenate(column) for column in zip(*requests)]
+        pos1 = self.leg_capital / price_1 * side
+        # if pos1 is long, pos2 is short, vice versa if pos1 is short, pos2 is long
+        pos2 = pos1 * hedge * -1.0
+        entry_gross = np.abs(pos1) * price_1 + np.abs(pos2) * price_2
+        # strongest signal first, candidate order breaks ties
+        order = np.lexsort((ids, -np.abs(zscore)))
+        n_entries = 0
+        n_rejected = 0
+        for kk in order.tolist():
+            cand = ids[kk]
+            sector = self.cand_sector[cand]
+            ticker_1 = self.cand_ticker_1[cand]
+            ticker_2 = self.cand_ticker_2[cand]
+            if gross + entry_gross[kk] > self.max_gross:
+                reason = 'gross'
+            elif self.n_open >= self.max_pairs:
+                reason = 'pairs'
+            elif self.sector_open[sector] >= self.max_per_sector:
+                reason = 'sector'
+            elif max(self.ticker_open[ticker_1], self.ticker_open[ticker_2]) >= self.max_per_ticker:
+                reason = 'ticker'
+            else:
+                reason = None
+            if reason is not None:
+                self.rejected[reason] += 1
+                n_rejected += 1
+                continue
+            self.position[cand] = side[kk]
+            self.long_pos[cand] = side[kk] == pb.LONG
+            self.short_pos[cand] = side[kk] == pb.SHORT
+            self.pos1[cand] = pos1[kk]
+            self.pos2[cand] = pos2[kk]
+            self.entry_row[cand] = row
+            self.entry_ratio[cand] = hedge[kk]
+            self.entry_z[cand] = zscore[kk]
+            self.sector_open[sector] += 1
+            self.ticker_open[ticker_1] += 1
+            self.ticker_open[ticker_2] += 1
+            self.n_open += 1
+            gross += entry_gross[kk]
+            n_entries += 1
+        return gross, n_entries, n_rejected
+
+    def run(self):
+        """
+        one pass over the trading days of every window
+        returns:
+            daily: pandas dataframe with DAILY_COLUMNS, one row per trading day
+            trades: pandas dataframe with TRADE_COLUMNS, one row per closed trade
+        """
+        self.reset_state()
+        upper = self.z_upper_thresh
+        lower = self.z_lower_thresh
+        first_row = self.blocks[0].first_row if self.blocks else 0
+        last_row = max([block.last_row for block in self.blocks]) if self.blocks else 0
+        daily = np.zeros((max(last_row - first_row, 0), len(DAILY_COLUMNS) - 1))
+        active = []
+        next_block = 0
+
+        with instrumentation.span('portfolio_simulation'):
+            for row in range(first_row, last_row):
+                while next_block < len(self.blocks) and self.blocks[next_block].first_row <= row:
+                    active.append(self.blocks[next_block])
+                    next_block += 1
+                active = [block for block in active if block.last_row > row]
+                day_pnl = 0.0
+                n_exits = 0
+                requests = []
+
+                for block in active:
+                    rr = row - block.first_row
+                    if rr == 0:
+                        # the first row of a window only starts its prices, like bar 0 of PairBackTester
+                        continue
+                    ids = block.ids
+                    cands = block.cands
+                    zscore = block.zscore[rr]
+                    day_1 = block.price_1[rr] - block.price_1[rr - 1]
+                    day_2 = block.price_2[rr] - block.price_2[rr - 1]
+                    block_pnl = np.zeros(len(ids))
+                    side = np.full(len(ids), pb.FLAT, dtype=int)
+                    last = block.final_row == rr
+
+                    # callbacks of pb.step_trade_rules, entries wait for the caps below
+                    def enter(mask, entry_side):
+                        side[mask] = entry_side
+
+                    def mark(mask):
+                        pnl = self.pos1[cands][mask] * day_1[mask] + self.pos2[cands][mask] * day_2[mask]
+                        block_pnl[mask] += pnl
+                        self.trade_pnl[cands][mask] += pnl
+                        self.days_in_trade[cands][mask] += 1
+
+                    def close(mask, final):
+                        nonlocal n_exits
+                        self.close_trades(ids[mask], row)
+                        n_exits += int(mask.sum())
+
+                    # 1. mark to market and 2. exits, on the pair's own bars and at the end of its window
+                    pb.step_trade_rules(row, zscore, block.bar[rr], last, self.long_pos[cands], self.short_pos[cands],
+                                        self.entry_row[cands], upper, lower, enter, mark, close)
+                    day_pnl += block_pnl.sum()
+                    # 3. entry signals of pairs flat after the exits, none on the last bar of a window
+                    signals = (side != pb.FLAT) & (self.position[cands] == pb.FLAT) & ~last
+                    if signals.any():
+                        requests.append((ids[signals], side[signals], zscore[signals],
+                                         block.price_1[rr][signals], block.price_2[rr][signals],
+                                         block.hedge[rr][signals]))
+
+                gross = self.gross_exposure(active, row)
+                n_entries = 0
+                n_rejected = 0
+                if requests:
+                    gross, n_entries, n_rejected = self.accept_entries(requests, row, gross)
+                daily[row - first_row] = [day_pnl, 0.0, gross, self.n_open, n_entries, n_exits, n_rejected]
+                instrumentation.progress('portfolio', "Simulated {0}, {1} pairs open",
+                                         self.dates[row], self.n_open, level=logging.DEBUG)
+
+        for reason, n_rejected in self.rejected.items():
+            instrumentation.count("portfolio_rejected_{0}".format(reason), n_rejected)
+        daily_df = pd.DataFrame(daily, columns=DAILY_COLUMNS[1:])
+        daily_df.insert(0, 'Date', self.dates[first_row:last_row])
+        daily_df['Equity'] = self.book_size + daily_df['PnL'].cumsum()
+        for column in ['OpenPairs', 'Entries', 'Exits', 'Rejected']:
+            daily_df[column] = daily_df[column].astype(int)
+        return daily_df, self.trade_frame()
+
+    def gross_exposure(self, active, row):
+        # dollars long plus dollars short of every open position at the day's prices
+        gross = 0.0
+        for block in active:
+            rr = row - block.first_row
+            ids = block.ids
+            held = self.position[ids] != pb.FLAT
+            if held.any():
+                gross += (np.abs(self.pos1[ids][held]) * block.price_1[rr][held] +
+                          np.abs(self.pos2[ids][held]) * block.price_2[rr][held]).sum()
+        return gross
+
+    def trade_frame(self):
+        # closed trades in exit order, same trade ids as PairBackTester
+        trades = np.concatenate(self.trade_chunks) if self.trade_chunks else np.empty((0, 10))
+        # one exit day closes long, short and last bar trades apart, candidate order within a day
+        trades = trades[np.lexsort((trades[:, 0], trades[:, 2]))]
+        rows = []
+        for trade in trades.tolist():
+            sector, (stock_1, stock_2) = self.candidates[int(trade[0])]
+            entry_date_str = self.dates[int(trade[1])].strftime('%Y%m%d')
+            position_str = pb.POSITION_NAMES[int(trade[3])]
+            trd_id = entry_date_str + "_" + position_str + "{0}{1}".format(stock_1, stock_2)
+            rows.append((trd_id, entry_date_str, self.dates[int(trade[2])].strftime('%Y%m%d'), position_str,
+                         sector, stock_1, stock_2, trade[4], trade[5], trade[6], trade[7], int(trade[8]), trade[9]))
+        return pd.DataFrame(rows, columns=TRADE_COLUMNS)
+
+
+def main():
+    # CONSTRAINTS OF OUR BOOK
+    book_size = 1000000.0
+    leg_capital = 50000.0
+    max_gross = 2.0 * book_size
+    max_pairs = 20
+    max_per_sector = 5
+    max_per_ticker = 1
+    short_window = 5
+    long_window = 30
+    z_threshold = [1.0, 0.0]
+    lookback_periods = [short_window, long_window]
+    # rate limited progress messages, logging.DEBUG shows every day
+    instrumentation.configure_logging(logging.INFO)
+
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
+
+    windows = []
+    for pairs_file in sorted(glob.glob("coint_method_pairs_*.txt")):
+        trd_start_dt, trd_end_dt = pb.trading_window(pairs_file, conn)
+        windows.append((trd_start_dt, trd_end_dt, pb.load_pairs_file(os.path.join(os.getcwd(), pairs_file))))
+    sectors = sorted(set([sector for start_dt, end_dt, sector_pairs in windows for sector, pair in sector_pairs]))
+    tickers = list(dict.fromkeys([ticker for start_dt, end_dt, sector_pairs in windows
+                                  for sector, pair in sector_pairs for ticker in pair]))
+    # one panel for every ticker of every window
+    price_panel = cm.load_price_panel(tickers, min([window[0] for window in windows]),
+                                      max([window[1] for window in windows]), conn)
+    conn.close()
+
+    simulator = PortfolioSimulator(price_panel, windows, sectors, z_threshold, lookback_periods, leg_capital,
+                                   book_size, max_gross, max_pairs, max_per_sector, max_per_ticker)
+    daily, trades = simulator.run()
+
+    params = "_{0}_{1}".format(short_window, long_window)
+    daily.to_csv("portfolio_daily" + params + ".txt", index=False)
+    trades.to_csv("portfolio_trades" + params + ".txt", index=False)
+    print("{0} trades, final equity {1:.2f}, rejected signals: {2}".format(
+          len(trades), daily['Equity'].iloc[-1] if len(daily) else book_size, simulator.rejected))
+    instrumentation.write_report("run_report_portfolio_simulator" + params + ".json")
+
+
+if __name__ == "__main__":
+    main()
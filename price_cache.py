@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:20:05 2026
+
+"""
+
+# LOCAL COLUMNAR PRICE CACHE
+# full adj_close_price history of daily_data stored as memory-mappable numpy files
+#
+# price_cache/
+#   |-  CURRENT            name of the live version directory
+#   |-  v7/
+#         |-  dates.npy      sorted trading dates, datetime64[D]
+#         |-  tickers.npy    ticker of every column
+#         |-  adj_close.npy  dates x tickers float64, column-major so each ticker is contiguous
+#
+# a write fills a new version directory, then points CURRENT at it with one os.replace.
+# a crash leaves either the old or the new arrays, never dates of one with prices of the other
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import data_sources
+
+CACHE_DIR = "price_cache"
+CURRENT_NAME = "CURRENT"
+DATES_NAME = "dates.npy"
+TICKERS_NAME = "tickers.npy"
+PRICES_NAME = "adj_close.npy"
+
+
+def save_synced(path, array):
+    # np.save that is on disk before CURRENT can point at it
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class PriceCache():
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.current_path = os.path.join(self.cache_dir, CURRENT_NAME)
+        self.load()
+
+    def exists(self):
+        # a complete cache was found and loaded
+        return self.dates is not None
+
+    def current_version(self):
+        # name of the live version directory, None before the first write
+        if not os.path.exists(self.current_path):
+            return None
+        with open(self.current_path) as f:
+            return f.read().strip()
+
+    def load(self):
+        # memory map the arrays of the live version, only the slices we read are paged in.
+        # a missing, unreadable or inconsistent cache loads nothing and refresh() builds it again
+        self.dates = None
+        self.tickers = []
+        self.prices = None
+        self.col_index = {}
+        version = self.current_version()
+        if not version:
+            return
+        directory = os.path.join(self.cache_dir, version)
+        try:
+            dates = np.load(os.path.join(directory, DATES_NAME), mmap_mode='r')
+            tickers = [str(ticker) for ticker in np.load(os.path.join(directory, TICKERS_NAME))]
+            prices = np.load(os.path.join(directory, PRICES_NAME), mmap_mode='r')
+        except (OSError, ValueError):
+            return
+        if prices.shape != (len(dates), len(tickers)):
+            return
+        self.dates = dates
+        self.tickers = tickers
+        self.prices = prices
+        self.col_index = {ticker: col for col, ticker in enumerate(self.tickers)}
+
+    def max_date(self):
+        if self.dates is None or len(self.dates) == 0:
+            return None
+        return self.dates[-1].astype(object)
+
+    def export_rows(self, conn, after_date=None):
+        """
+        bulk export of daily_data rows, with COPY ... TO STDOUT from PostgreSQL
+        args:
+            conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+            after_date: datetime object, only export rows after this date. None exports all
+        returns:
+            pandas dataframe with columns Ticker, Date (datetime64), Adj_Close (float64)
+        """
+        return data_sources.get_source(conn).export_rows(after_date)
+
+    def write(self, dates, tickers, prices):
+        # fill a new version directory, then swap CURRENT to it in one step
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        version = self.next_version()
+        directory = os.path.join(self.cache_dir, version)
+        os.makedirs(directory)
+        save_synced(os.path.join(directory, DATES_NAME), np.asarray(dates, dtype='datetime64[D]'))
+        save_synced(os.path.join(directory, TICKERS_NAME), np.asarray(tickers, dtype=str))
+        save_synced(os.path.join(directory, PRICES_NAME), np.asfortranarray(prices, dtype=np.float64))
+
+        tmp_path = self.current_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.current_path)
+        # release our memory maps of the old version before removing it
+        self.dates = None
+        self.prices = None
+        self.remove_stale(version)
+        self.load()
+
+    def next_version(self):
+        numbers = [int(name[1:]) for name in os.listdir(self.cache_dir) if name[:1] == "v" and name[1:].isdigit()]
+        return "v{0}".format(max(numbers) + 1 if numbers else 1)
+
+    def remove_stale(self, version):
+        # older versions, versions a crash left unfinished, and the files of the unversioned layout
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name[:1] == "v" and name[1:].isdigit() and name != version:
+                # another process may still map an old version, windows then keeps it until the next write
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in (DATES_NAME, TICKERS_NAME, PRICES_NAME) or name.endswith(".tmp.npy"):
+                os.remove(path)
+
+    def build(self, conn):
+        """
+        fill the cache from scratch with one bulk export of daily_data
+        args:
+            conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+        returns:
+            integer, number of rows exported
+        """
+        rows = self.export_rows(conn)
+        panel = rows.pivot(index='Date', columns='Ticker', values='Adj_Close').sort_index()
+        self.write(panel.index.values, list(panel.columns), panel.values)
+        return len(rows)
+
+    def refresh(self, conn):
+        """
+        append rows newer than the cached maximum date, build the cache if it does not exist.
+        prices revised before the cached maximum date need a full build()
+        args:
+            conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+        returns:
+            integer, number of rows added
+        """
+        if not self.exists():
+            return self.build(conn)
+
+        rows = self.export_rows(conn, self.max_date())
+        if len(rows) == 0:
+            return 0
+
+        new_panel = rows.pivot(index='Date', columns='Ticker', values='Adj_Close').sort_index()
+        new_tickers = [ticker for ticker in new_panel.columns if ticker not in self.col_index]
+        tickers = self.tickers + new_tickers
+        # new tickers get an empty history, existing tickers keep their column
+        old_prices = np.full((len(self.dates), len(tickers)), np.nan)
+        old_prices[:, :len(self.tickers)] = self.prices
+        new_prices = new_panel.reindex(columns=tickers).values
+
+        dates = np.concatenate([np.asarray(self.dates), new_panel.index.values.astype('datetime64[D]')])
+        self.write(dates, tickers, np.vstack([old_prices, new_prices]))
+        return len(rows)
+
+    def panel(self, stocks, start_date, end_date):
+        """
+        wide Date x ticker panel sliced from the cache, same layout as common_methods.load_price_panel
+        args:
+            stocks: tuple or list of strings, each string is ticker
+            start_date: datetime object, panel starts after this date
+            end_date: datetime object, panel ends on or before this date
+        returns:
+            pandas dataframe indexed by Date, one float64 column per ticker in stocks order
+        """
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, 'D'), side='right')
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, 'D'), side='right')
+        values = np.full((hi - lo, len(stocks)), np.nan)
+        for col, ticker in enumerate(stocks):
+            if ticker in self.col_index:
+                values[:, col] = self.prices[lo:hi, self.col_index[ticker]]
+
+        index = pd.Index(self.dates[lo:hi].astype(object), name='Date')
+        panel = pd.DataFrame(values, index=index, columns=list(stocks))
+        # the database only returns dates where at least one ticker traded
+        return panel.dropna(how='all')
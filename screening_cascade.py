@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:40:12 2026
+
+"""
+
+# CANDIDATE PRE-FILTER CASCADE AHEAD OF THE COINTEGRATION TEST
+# cheap stages prune intra-sector pairs that are clearly not cointegrated,
+# only the survivors go to the exact Engle-Granger test
+#
+# stages, cheapest first:
+#   exclude      - pairs with a ticker we drop afterwards anyway, ex: SPY
+#   correlation  - daily log return correlation below min_correlation
+#   distance     - sum of squared differences of standardized prices, keep the closest fraction
+#   stationarity - optional Dickey-Fuller statistic (no lags) of the hedge residual above max_df_stat
+#   coint        - exact test, coint_engine.batch_coint
+
+import time
+import warnings
+
+import numpy as np
+
+import coint_engine
+import benchmark_coint
+
+
+class ScreeningCascade():
+
+    def __init__(self, min_correlation=0.2, distance_keep=0.5, max_df_stat=None, exclude=('SPY',)):
+        """
+        args:
+            min_correlation: lowest daily log return correlation kept, None skips the stage
+            distance_keep: fraction of the remaining pairs with the smallest standardized price
+                           distance kept, None skips the stage
+            max_df_stat: highest residual Dickey-Fuller statistic kept, None skips the stage
+            exclude: tickers whose pairs are never tested
+        """
+        self.min_correlation = min_correlation
+        self.distance_keep = distance_keep
+        self.max_df_stat = max_df_stat
+        self.exclude = exclude
+        # one dict per stage of the last run: stage, pairs_in, pruned, seconds
+        self.report = []
+        # candidate pairs (idx_i, idx_j) left after every stage of the last run
+        self.survivors = []
+
+    def add_stage(self, stage, idx_i, idx_j, keep, start):
+        self.report.append({'stage': stage, 'pairs_in': len(idx_i), 'pruned': int(len(keep) - keep.sum()),
+                            'seconds': time.perf_counter() - start})
+        idx_i = idx_i[keep]
+        idx_j = idx_j[keep]
+        self.survivors.append((stage, idx_i, idx_j))
+        return idx_i, idx_j
+
+    def candidates(self, data):
+        """
+        run the pre-filter stages
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+        returns:
+            two np.arrays, (i, j) column indices of the surviving pairs with i < j
+        """
+        self.report = []
+        self.survivors = []
+        prices = np.asarray(data.values, dtype=float)
+        idx_i, idx_j = coint_engine.pair_indices(prices.shape[1])
+
+        start = time.perf_counter()
+        dropped = np.array([key in self.exclude for key in data.keys()], dtype=bool)
+        keep = ~(dropped[idx_i] | dropped[idx_j])
+        idx_i, idx_j = self.add_stage('exclude', idx_i, idx_j, keep, start)
+
+        if self.min_correlation is not None:
+            start = time.perf_counter()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = np.corrcoef(np.diff(np.log(prices), axis=0), rowvar=False)
+            # a constant price has no correlation, leave it to the exact test
+            corr = np.atleast_2d(corr)[idx_i, idx_j]
+            keep = ~(corr < self.min_correlation)
+            idx_i, idx_j = self.add_stage('correlation', idx_i, idx_j, keep, start)
+
+        if self.distance_keep is not None:
+            start = time.perf_counter()
+            # prices scaled to mean 0 and standard deviation 1, so the distance does not depend on
+            # the hedge ratio or the price level, squared distance from one gram
+            norm_prices = (prices - prices.mean(axis=0)) / prices.std(axis=0)
+            gram = norm_prices.T.dot(norm_prices)
+            sq = np.diag(gram)
+            ssd = sq[idx_i] + sq[idx_j] - 2.0 * gram[idx_i, idx_j]
+            n_keep = int(np.ceil(self.distance_keep * len(ssd)))
+            keep = np.zeros(len(ssd), dtype=bool)
+            keep[np.argsort(ssd, kind='stable')[:n_keep]] = True
+            idx_i, idx_j = self.add_stage('distance', idx_i, idx_j, keep, start)
+
+        if self.max_df_stat is not None:
+            start = time.perf_counter()
+            df_stats = coint_engine.dickey_fuller_stats(prices, idx_i, idx_j)
+            keep = ~(df_stats > self.max_df_stat)
+            idx_i, idx_j = self.add_stage('stationarity', idx_i, idx_j, keep, start)
+
+        return idx_i, idx_j
+
+    def find_cointegrated_pairs(self, data, p_value=0.01, cache=None):
+        """
+        drop in for find_cointegrated_pairs, pairs pruned by the cascade keep
+        a score of 0 and a p-value of 1
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+            p_value: threshold for accepting a pairs model (float), default 0.01
+            cache: coint_cache.CointCache object, only survivors missing from it are tested
+        returns:
+            score_matrix (np.array), pvalue_matrix (np.array), pairs (array)
+        """
+        n = data.shape[1]
+        score_matrix = np.zeros((n, n))
+        pvalue_matrix = np.ones((n, n))
+        keys = data.keys()
+        idx_i, idx_j = self.candidates(data)
+
+        start = time.perf_counter()
+        compute = lambda ii, jj: coint_engine.batch_coint(data.values, ii, jj)
+        if cache is None:
+            scores, pvalues = compute(idx_i, idx_j)
+        else:
+            scores, pvalues = cache.coint(data, idx_i, idx_j, compute)
+        score_matrix[idx_i, idx_j] = scores
+        pvalue_matrix[idx_i, idx_j] = pvalues
+        keep = pvalues < p_value
+        self.add_stage('coint', idx_i, idx_j, keep, start)
+        pairs = [(keys[i], keys[j]) for i, j in zip(idx_i[keep], idx_j[keep])]
+        return score_matrix, pvalue_matrix, pairs
+
+    def recall(self, data, p_value=0.01):
+        """
+        compare the cascade with the full screen of every pair
+        args:
+            data: pd_df where each column = individual ticker Adj_Close, no missing values
+            p_value: threshold for accepting a pairs model (float), default 0.01
+        returns:
+            recall: share of the full screen pairs (without excluded tickers) found by the cascade
+            lost: dict of stage name to the number of full screen pairs that stage pruned
+        """
+        keys = data.keys()
+        full = coint_engine.find_cointegrated_pairs_batched(data, p_value=p_value)[2]
+        full = set([pair for pair in full if pair[0] not in self.exclude and pair[1] not in self.exclude])
+        found = set(self.find_cointegrated_pairs(data, p_value)[2])
+
+        lost = {}
+        remaining = full
+        for stage, idx_i, idx_j in self.survivors[:-1]:
+            kept = set([(keys[i], keys[j]) for i, j in zip(idx_i, idx_j)])
+            lost[stage] = len(remaining - kept)
+            remaining = remaining & kept
+        if not full:
+            return 1.0, lost
+        return len(full & found) / float(len(full)), lost
+
+
+def format_report(report):
+    """
+    one line per stage, ex: "correlation: 1225 in, 640 pruned, 0.002s"
+    """
+    return "\n".join(["{0}: {1} in, {2} pruned, {3:.3f}s".format(
+                      row['stage'], row['pairs_in'], row['pruned'], row['seconds']) for row in report])
+
+
+def main():
+    # tune thresholds on synthetic sectors, no database required
+    n_days = 504
+    sector_sizes = [25, 50, 100]
+    settings = [(None, None, None), (0.2, 0.5, None), (0.3, 0.5, -2.0), (0.5, 0.25, -2.5)]
+
+    warnings.simplefilter("ignore")
+    for n_tickers in sector_sizes:
+        data = benchmark_coint.factor_sector(n_tickers, n_days, n_planted=n_tickers // 5)
+        data = data.rename(columns={data.columns[-1]: 'SPY'})
+        for min_correlation, distance_keep, max_df_stat in settings:
+            cascade = ScreeningCascade(min_correlation, distance_keep, max_df_stat)
+            recall, lost = cascade.recall(data)
+            print("{0} tickers, min_correlation={1}, distance_keep={2}, max_df_stat={3}".format(
+                  n_tickers, min_correlation, distance_keep, max_df_stat))
+            print(format_report(cascade.report))
+            print("recall: {0:.3f}, full screen pairs lost per stage: {1}".format(recall, lost))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:20:36 2026
+
+"""
+
+# STREAMING SIGNALS - ONE NEW BAR AT A TIME FOR THOUSANDS OF PAIRS
+# every pair keeps a ring buffer of its last long_lookback ratios plus running sums,
+# so a new bar updates ma_short, ma_long, std and zscore in constant time per pair.
+# entry / exit rules are pb.step_trade_rules, the same as PairBackTester.backtest, events
+# are emitted instead of daily records, memory does not grow with history
+
+import collections
+import datetime
+import glob
+import os
+
+import numpy as np
+
+import common_methods as cm
+import pairs_backtester as pb
+
+EVENT_COLUMNS = ('Date', 'Pair', 'Event', 'Position', 'ZScore', 'Ratio', 'Pos1', 'Pos2',
+                 'Ticker1_P', 'Ticker2_P', 'Days', 'PnL')
+
+# one entry or exit of a pair. PnL is the trade PnL on exits, 0.0 on entries
+SignalEvent = collections.namedtuple('SignalEvent', EVENT_COLUMNS)
+
+
+class SignalStream():
+
+    def __init__(self, pairs, z_threshold, lookback_periods, initial_capital):
+        """
+        args:
+            pairs: list of tuples, each tuple is two tickers
+            z_threshold: [entry, exit] z-score thresholds, same as PairBackTester
+            lookback_periods: [short, long] rolling windows, same as PairBackTester
+            initial_capital: dollars per leg, type float
+        """
+        self.pairs = list(pairs)
+        self.z_upper_thresh = z_threshold[0]
+        self.z_lower_thresh = z_threshold[1]
+        self.short_lookback = lookback_periods[0]
+        self.long_lookback = lookback_periods[1]
+        if self.short_lookback > self.long_lookback:
+            raise ValueError("short lookback {0} is longer than long lookback {1}".format(
+                             self.short_lookback, self.long_lookback))
+        self.initial_capital = initial_capital
+        n_pairs = len(self.pairs)
+
+        # rolling statistics. sums are of ratio - shift, shift is reset to the window mean
+        # every long_lookback bars when the sums are rebuilt from the buffer, so rounding
+        # error does not build up and sums of squares do not cancel out
+        self.buffer = np.zeros((self.long_lookback, n_pairs))
+        self.n_bars = np.zeros(n_pairs, dtype=int)
+        self.shift = np.zeros(n_pairs)
+        self.sum_short = np.zeros(n_pairs)
+        self.sum_long = np.zeros(n_pairs)
+        self.sum_sq_long = np.zeros(n_pairs)
+        self.ratio = np.full(n_pairs, np.nan)
+        self.zscore = np.full(n_pairs, np.nan)
+        self.price_1 = np.full(n_pairs, np.nan)
+        self.price_2 = np.full(n_pairs, np.nan)
+
+        # trade state, one element per pair like BatchPairBackTester
+        self.long_pos = np.zeros(n_pairs, dtype=bool)
+        self.short_pos = np.zeros(n_pairs, dtype=bool)
+        self.position = np.full(n_pairs, pb.FLAT, dtype=int)
+        self.pos1 = np.zeros(n_pairs)
+        self.pos2 = np.zeros(n_pairs)
+        self.orig_ratio = np.zeros(n_pairs)
+        self.trade_pnl = np.zeros(n_pairs)
+        self.days_in_trade = np.zeros(n_pairs, dtype=int)
+        self.entry_bar = np.full(n_pairs, -1, dtype=int)
+
+    def update(self, date, price_1, price_2, last_bar=False):
+        """
+        process one bar for every pair
+        args:
+            date: date of the bar, copied to the events
+            price_1: np.array of first ticker prices, one per pair, NaN = no bar for that pair
+            price_2: np.array of second ticker prices, one per pair, NaN = no bar for that pair
+            last_bar: bool or bool np.array, pairs whose final bar this is. open trades are
+                      closed like the last bar of PairBackTester.backtest, live feeds leave it False
+        returns:
+            list of SignalEvent, in the block order of PairBackTester.backtest
+        """
+        price_1 = np.asarray(price_1, dtype=float)
+        price_2 = np.asarray(price_2, dtype=float)
+        active = ~np.isnan(price_1) & ~np.isnan(price_2)
+        last_bar = np.asarray(last_bar, dtype=bool) & active
+        events = []
+
+        # we only enter trades using previous bar z-score and ratio
+        trading = active & (self.n_bars > 0)
+        if trading.any():
+            self.trade(date, trading, last_bar, price_1, price_2, events)
+
+        idx = np.nonzero(active)[0]
+        self.price_1[idx] = price_1[idx]
+        self.price_2[idx] = price_2[idx]
+        self.add_ratios(idx, price_1[idx] / price_2[idx])
+        return events
+
+    def add_ratios(self, idx, ratios):
+        # constant time ring buffer update of the rolling sums of pairs idx
+        short, long_ = self.short_lookback, self.long_lookback
+        bar = self.n_bars[idx]
+        first = bar == 0
+        self.shift[idx[first]] = ratios[first]
+        x = ratios - self.shift[idx]
+
+        slot = bar % long_
+        # value leaving the long window is overwritten in the buffer, the one leaving
+        # the short window is still there, short_lookback slots back
+        full_long = bar >= long_
+        old_long = np.where(full_long, self.buffer[slot, idx] - self.shift[idx], 0.0)
+        full_short = bar >= short
+        old_short = np.where(full_short, self.buffer[(bar - short) % long_, idx] - self.shift[idx], 0.0)
+        self.buffer[slot, idx] = ratios
+        self.sum_short[idx] += x - old_short
+        self.sum_long[idx] += x - old_long
+        self.sum_sq_long[idx] += x * x - old_long * old_long
+        self.n_bars[idx] = bar + 1
+        self.ratio[idx] = ratios
+
+        # rebuild the sums of pairs whose buffer just wrapped around
+        rebuild = idx[(bar + 1) % long_ == 0]
+        if len(rebuild) > 0:
+            self.rebuild_sums(rebuild)
+
+        bar = bar + 1
+        ready = bar >= long_
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diff = self.sum_short[idx] / short - self.sum_long[idx] / long_
+            var = (self.sum_sq_long[idx] - self.sum_long[idx] * self.sum_long[idx] / long_) / (long_ - 1)
+            zscore = diff / np.sqrt(np.maximum(var, 0.0))
+        self.zscore[idx] = np.where(ready, zscore, np.nan)
+
+    def rebuild_sums(self, idx):
+        # exact sums from the buffer, O(long_lookback) once every long_lookback bars
+        short, long_ = self.short_lookback, self.long_lookback
+        window = self.buffer[:, idx]
+        shift = window.mean(axis=0)
+        x = window - shift
+        # newest short_lookback values sit in the slots before the next write position
+        slots = (self.n_bars[idx][None, :] - 1 - np.arange(short)[:, None]) % long_
+        self.shift[idx] = shift
+        self.sum_long[idx] = x.sum(axis=0)
+        self.sum_sq_long[idx] = (x * x).sum(axis=0)
+        self.sum_short[idx] = (np.take_along_axis(window, slots, axis=0) - shift).sum(axis=0)
+
+    def trade(self, date, trading, last_bar, price_1, price_2, events):
+        # pb.step_trade_rules for every pair with a bar today, bar numbers are counted per pair.
+        # a closed trade is always reset, a live feed can carry on past a pair's last_bar
+        def enter(mask, side):
+            self.open_trades(date, mask, side, price_1, price_2, events)
+
+        def mark(mask):
+            self.calc_day_PnL(mask, price_1, price_2)
+
+        def close(mask, final):
+            self.close_trades(date, mask, price_1, price_2, events)
+
+        pb.step_trade_rules(self.n_bars, self.zscore, trading, last_bar, self.long_pos, self.short_pos,
+                            self.entry_bar, self.z_upper_thresh, self.z_lower_thresh, enter, mark, close)
+
+    def open_trades(self, date, mask, side, price_1, price_2, events):
+        self.position[mask] = side
+        if side == pb.LONG:
+            self.long_pos[mask] = True
+            self.pos1[mask] = self.initial_capital/price_1[mask]
+        else:
+            self.short_pos[mask] = True
+            self.pos1[mask] = self.initial_capital/price_1[mask] * -1.0
+        # if pos1 is long, pos2 is short, vice versa if pos1 is short, pos2 is long
+        self.pos2[mask] = self.pos1[mask] * self.ratio[mask] * -1.0
+        self.orig_ratio[mask] = self.ratio[mask]
+        self.entry_bar[mask] = self.n_bars[mask]
+        self.add_events(date, 'Entry', mask, price_1, price_2, events)
+
+    def calc_day_PnL(self, mask, price_1, price_2):
+        self.days_in_trade[mask] += 1
+        pnl = (((price_1[mask] - self.price_1[mask]) * self.pos1[mask]) +
+               ((price_2[mask] - self.price_2[mask]) * self.pos2[mask]))
+        self.trade_pnl[mask] += pnl
+
+    def close_trades(self, date, mask, price_1, price_2, events):
+        self.add_events(date, 'Exit', mask, price_1, price_2, events)
+        self.trade_pnl[mask] = 0.0
+        self.pos1[mask] = 0.0
+        self.pos2[mask] = 0.0
+        self.orig_ratio[mask] = 0.0
+        self.short_pos[mask] = False
+        self.long_pos[mask] = False
+        self.position[mask] = pb.FLAT
+        self.days_in_trade[mask] = 0
+
+    def add_events(self, date, event, mask, price_1, price_2, events):
+        for pp in np.nonzero(mask)[0].tolist():
+            events.append(SignalEvent(date, self.pairs[pp], event, pb.POSITION_NAMES[int(self.position[pp])],
+                                      float(self.zscore[pp]), float(self.ratio[pp]), float(self.pos1[pp]),
+                                      float(self.pos2[pp]), float(price_1[pp]), float(price_2[pp]),
+                                      int(self.days_in_trade[pp]), float(self.trade_pnl[pp])))
+
+    def open_positions(self):
+        """
+        returns:
+            list of (pair, position name, pos1, pos2, days_in_trade, trade_pnl) for pairs in a trade
+        """
+        return [(self.pairs[pp], pb.POSITION_NAMES[int(self.position[pp])], float(self.pos1[pp]),
+                 float(self.pos2[pp]), int(self.days_in_trade[pp]), float(self.trade_pnl[pp]))
+                for pp in np.nonzero(self.long_pos | self.short_pos)[0].tolist()]
+
+
+def replay_panel(stream, price_panel, close_last_bar=True):
+    """
+    feed every row of a price panel through a stream, one bar at a time
+    args:
+        stream: SignalStream
+        price_panel: pandas dataframe indexed by Date, one column per ticker
+        close_last_bar: close open trades on each pair's last bar, like PairBackTester.backtest
+    returns:
+        list of SignalEvent
+    """
+    columns = {ticker: col for col, ticker in enumerate(price_panel.columns)}
+    col_1 = np.array([columns[stock_1] for stock_1, stock_2 in stream.pairs], dtype=int)
+    col_2 = np.array([columns[stock_2] for stock_1, stock_2 in stream.pairs], dtype=int)
+    values = price_panel.values.astype(float)
+    n_pairs = len(stream.pairs)
+
+    last_row = np.full(n_pairs, -1, dtype=int)
+    if close_last_bar:
+        both = ~np.isnan(values[:, col_1]) & ~np.isnan(values[:, col_2])
+        has_bar = both.any(axis=0)
+        last_row[has_bar] = len(values) - 1 - np.argmax(both[::-1], axis=0)[has_bar]
+
+    events = []
+    for row, date in enumerate(price_panel.index):
+        events.extend(stream.update(date, values[row, col_1], values[row, col_2], last_row == row))
+    return events
+
+
+def main():
+    # warm up on the latest backtest window, then print the signals of the last bar
+    short_window = 5
+    long_window = 30
+    z_threshold = [1.0, 0.0]
+    lookback_periods = [short_window, long_window]
+    initial_capital = 50000.0
+
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+
+    # create our instance variables for host, username, password and database name
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
+
+    pairs_file = sorted(glob.glob("coint_method_pairs_*.txt"))[-1]
+    # warm up from the start of the window, live bars run up to today
+    trd_start_dt = pb.trading_window(pairs_file, conn)[0]
+    window_pairs = [pair for sector, pair in pb.load_pairs_file(os.path.join(os.getcwd(), pairs_file))]
+
+    tickers = list(dict.fromkeys([ticker for pair in window_pairs for ticker in pair]))
+    price_panel = cm.load_price_panel(tickers, trd_start_dt, datetime.date.today(), conn)
+
+    stream = SignalStream(window_pairs, z_threshold, lookback_periods, initial_capital)
+    # history only, no forced exits: trades still open are live positions
+    replay_panel(stream, price_panel.iloc[:-1], close_last_bar=False)
+    last = price_panel.iloc[-1]
+    price_1 = np.array([last[stock_1] for stock_1, stock_2 in window_pairs], dtype=float)
+    price_2 = np.array([last[stock_2] for stock_1, stock_2 in window_pairs], dtype=float)
+    for event in stream.update(price_panel.index[-1], price_1, price_2):
+        print(event)
+    print("Open positions: {0}".format(len(stream.open_positions())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 01:52:10 2026
+
+"""
+
+# SIGNIFICANCE - BOOTSTRAP CONFIDENCE INTERVALS AND RANDOM ENTRY NULL TESTS OF OUR RESULTS
+# trade_stats reports point estimates. here every trade_stats metric gets a distribution:
+#
+#   Bootstrap        resamples the daily PnL series (stationary or moving block bootstrap, so
+#                    runs of correlated days stay together) or the trade PnLs (iid), and gives
+#                    percentile confidence intervals of the daily and trade statistics
+#   RandomEntryNull  keeps every trade's pair, side and holding days but enters it on a random
+#                    bar of the same year. the p-value of a metric is the share of null books
+#                    doing at least as well as ours
+#
+# resamples are index matrices (resample x day or resample x trade) evaluated with batched numpy,
+# in chunks spread over a process pool. every chunk has its own seed, so results do not depend
+# on the number of worker processes
+
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import common_methods as cm
+import instrumentation
+import pairs_backtester as pb
+import trade_analysis
+import trade_store
+
+# trade_stats results in trade_stats order
+STAT_NAMES = ['total', 'winners', 'total_pnl', 'win_percent', 'avg', 'max_winner', 'max_loser',
+              'avg_winner', 'avg_loser']
+BOOTSTRAP_METHODS = ("stationary", "block", "iid")
+# resample x value elements evaluated at once, bounds the memory of a chunk
+CHUNK_ELEMENTS = 2000000
+REPORT_COLUMNS = ['Test', 'Metric', 'Observed', 'Low', 'High', 'Null_Mean', 'P_Value']
+
+# the sampler of every resample chunk run in this process
+_worker_sampler = None
+
+
+def batch_trade_stats(values, formatting='trade'):
+    """
+    trade_stats of every row at once, without the printing
+    args:
+        values: 2d np.array, one PnL series per row
+        formatting: 'daily' leaves out days with 0 PnL like trade_stats, 'trade' keeps every value
+    returns:
+        2d np.array, one row per series and one column per STAT_NAMES metric,
+        NaN where a metric is undefined (ex: avg_loser of a series without losers)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if formatting == 'daily':
+        included = values != 0
+    else:
+        included = np.ones(values.shape, dtype=bool)
+    win = included & (values > 0)
+    lose = included & ~win
+    total = included.sum(axis=1)
+    winners = win.sum(axis=1)
+    total_pnl = np.where(included, values, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats = np.column_stack([
+            total,
+            winners,
+            total_pnl,
+            winners / total,
+            total_pnl / total,
+            np.where(total > 0, np.where(included, values, -np.inf).max(axis=1, initial=-np.inf), np.nan),
+            np.where(total > 0, np.where(included, values, np.inf).min(axis=1, initial=np.inf), np.nan),
+            np.where(win, values, 0.0).sum(axis=1) / winners,
+            np.where(lose, values, 0.0).sum(axis=1) / (total - winners),
+        ])
+    return stats
+
+
+def stationary_bootstrap_indices(n, n_resamples, mean_block, rng):
+    """
+    Politis and Romano stationary bootstrap. each day starts a new block with probability
+    1 / mean_block, otherwise it follows the day before, wrapping around the end of the series
+    args:
+        n: length of the series, type int
+        n_resamples: number of resamples, type int
+        mean_block: mean block length in days, type float
+        rng: np.random.RandomState
+    returns:
+        2d np.array of indices, n_resamples x n
+    """
+    starts = rng.randint(n, size=(n_resamples, n))
+    new_block = rng.random_sample((n_resamples, n)) < 1.0 / mean_block
+    new_block[:, 0] = True
+    pos = np.arange(n)
+    # position where the current block started, and where that block starts in the series
+    block_pos = np.maximum.accumulate(np.where(new_block, pos, 0), axis=1)
+    block_start = np.take_along_axis(starts, block_pos, axis=1)
+    return (block_start + pos - block_pos) % n
+
+
+def block_bootstrap_indices(n, n_resamples, block, rng):
+    """
+    moving block bootstrap, blocks of block days from random starts laid end to end
+    returns:
+        2d np.array of indices, n_resamples x n
+    """
+    block = int(min(max(block, 1), n))
+    n_blocks = -(-n // block)
+    starts = rng.randint(n - block + 1, size=(n_resamples, n_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(n_resamples, -1)[:, :n]
+
+
+def default_block(n):
+    # mean block length growing with n ** (1/3), 14 days for ten years of trading days
+    return max(1, int(round(n ** (1.0 / 3.0))))
+
+
+class Bootstrap():
+
+    def __init__(self, values, formatting='daily', method="stationary", block=None):
+        """
+        args:
+            values: 1d array of PnL, daily PnL in date order or one PnL per trade
+            formatting: 'daily' or 'trade', see batch_trade_stats
+            method: "stationary", "block" (moving block) or "iid"
+            block: mean block length of "stationary", block length of "block", None uses default_block
+        """
+        if method not in BOOTSTRAP_METHODS:
+            raise ValueError("method must be one of {0}, got {1}".format(BOOTSTRAP_METHODS, method))
+        self.values = np.asarray(values, dtype=np.float64)
+        self.n = len(self.values)
+        self.formatting = formatting
+        self.method = method
+        self.block = default_block(self.n) if block is None else block
+
+    def observed(self):
+        return batch_trade_stats(self.values[None, :], self.formatting)[0]
+
+    def indices(self, n_resamples, rng):
+        if self.method == "stationary":
+            return stationary_bootstrap_indices(self.n, n_resamples, self.block, rng)
+        if self.method == "block":
+            return block_bootstrap_indices(self.n, n_resamples, self.block, rng)
+        return rng.randint(self.n, size=(n_resamples, self.n))
+
+    def sample_stats(self, n_resamples, rng):
+        """
+        returns:
+            2d np.array of batch_trade_stats, one row per resample
+        """
+        return batch_trade_stats(self.values[self.indices(n_resamples, rng)], self.formatting)
+
+
+class RandomEntryNull():
+
+    def __init__(self, price_panel, df_trades, initial_capital):
+        """
+        every trade of a backtest re-entered on random bars, same pair, side and holding days.
+        PnL is the backtester's: pos1 = +/- initial_capital / entry price, pos2 = -pos1 * price
+        ratio of the bar before entry, held for Tr_Length bars. the hedge is the price ratio
+        of the "ratio" hedge mode
+        args:
+            price_panel: Date x ticker panel covering every trade, see cm.load_price_panel
+            df_trades: master dataframe with MASTER_COLUMNS, see trade_store.TradeStore.read_master
+            initial_capital: dollars of the first leg, same as the backtest, type float
+        """
+        self.initial_capital = initial_capital
+        pair_list = list(zip(df_trades['Ticker1'], df_trades['Ticker2']))
+        pairs = list(dict.fromkeys(pair_list))
+        pair_col = {pair: col for col, pair in enumerate(pairs)}
+        n_bars, bar_rows, price_1, price_2 = pb.pair_price_arrays(pairs, price_panel)
+
+        # bars of every pair laid end to end, a trade only draws bars of its own pair
+        valid = (np.arange(bar_rows.shape[0])[:, None] < n_bars).T
+        self.price_1 = price_1.T[valid]
+        self.price_2 = price_2.T[valid]
+        rows = bar_rows.T[valid]
+        offsets = np.concatenate([[0], np.cumsum(n_bars)])
+        col = np.repeat(np.arange(len(pairs)), n_bars)
+        dates = np.asarray(price_panel.index, dtype='datetime64[D]')
+        bar_years = dates[rows].astype('datetime64[Y]').astype(int) + 1970
+        bar_ints = np.array([int(day.replace("-", "")) for day in dates.astype(str)], dtype=np.int64)[rows]
+
+        trade_col = np.array([pair_col[pair] for pair in pair_list], dtype=np.int64)
+        entry = df_trades['Entry_Date'].values.astype(np.int64)
+        self.side = np.where(df_trades['Position'].values == "Long", 1.0, -1.0)
+        self.length = df_trades['Tr_Length'].values.astype(np.int64)
+        self.total_pnl = df_trades['Total_PnL'].values.astype(np.float64)
+        # opened on the last bar of a window, the backtester books that bar's move as one day
+        self.last_bar_entry = entry == df_trades['Exit_Date'].values.astype(np.int64)
+        self.n = len(entry)
+
+        # flat bar of every observed entry, and the first and last bar of its pair in its year
+        key = col * 100000000 + bar_ints
+        self.entry_bar = np.searchsorted(key, trade_col * 100000000 + entry)
+        year_key = col * 10000 + bar_years
+        trade_year = trade_col * 10000 + entry // 10000
+        first = np.maximum(np.searchsorted(year_key, trade_year, side='left'), offsets[trade_col] + 1)
+        last = np.searchsorted(year_key, trade_year, side='right') - 1 - self.length
+        # a trade that cannot move keeps its observed entry
+        fixed = last < first
+        self.first = np.where(fixed, self.entry_bar, first)
+        self.span = np.where(fixed, 1, last - first + 1)
+
+    def trade_pnl(self, entry_bar):
+        """
+        PnL of every trade entered on entry_bar, same shape as entry_bar
+        """
+        # a last bar entry of the last pair would step past our bars
+        exit_bar = np.minimum(entry_bar + self.length, len(self.price_1) - 1)
+        p1 = self.price_1[entry_bar]
+        p2 = self.price_2[entry_bar]
+        ratio = self.price_1[entry_bar - 1] / self.price_2[entry_bar - 1]
+        pos1 = self.side * self.initial_capital / p1
+        pos2 = pos1 * ratio * -1.0
+        return pos1 * (self.price_1[exit_bar] - p1) + pos2 * (self.price_2[exit_bar] - p2)
+
+    def replay(self):
+        """
+        PnL of our trades on their own entries, equal to Total_PnL up to rounding for a
+        "ratio" backtest, except last_bar_entry trades which replay a day past their window
+        """
+        return self.trade_pnl(self.entry_bar)
+
+    def observed(self):
+        return batch_trade_stats(self.total_pnl[None, :], 'trade')[0]
+
+    def sample_stats(self, n_resamples, rng):
+        entry_bar = self.first + (rng.random_sample((n_resamples, self.n)) * self.span).astype(np.int64)
+        return batch_trade_stats(self.trade_pnl(entry_bar), 'trade')
+
+
+def init_worker(sampler):
+    """
+    keep the sampler in every worker process, it is sent once instead of with every chunk
+    """
+    global _worker_sampler
+    _worker_sampler = sampler
+
+
+def sample_chunk(chunk):
+    n_resamples, seed = chunk
+    return _worker_sampler.sample_stats(n_resamples, np.random.RandomState(seed))
+
+
+def resample(sampler, n_resamples, seed=0, n_workers=1, chunk_size=None):
+    """
+    statistics of n_resamples resamples of a Bootstrap or RandomEntryNull
+    args:
+        sampler: Bootstrap or RandomEntryNull object
+        n_resamples: number of resamples, type int
+        seed: random seed, type int
+        n_workers: number of worker processes, type int. 1 runs serially
+        chunk_size: resamples per chunk, None keeps a chunk near CHUNK_ELEMENTS values.
+                    results depend on seed and chunk_size, not on n_workers
+    returns:
+        2d np.array, one row per resample and one column per STAT_NAMES metric
+    """
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // max(sampler.n, 1))
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.RandomState(seed).randint(2**31 - 1, size=len(sizes)).tolist()
+    chunks = list(zip(sizes, seeds))
+    instrumentation.count('resamples', n_resamples)
+
+    if n_workers <= 1 or len(chunks) <= 1:
+        init_worker(sampler)
+        results = [sample_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker,
+                                 initargs=(sampler,)) as executor:
+            results = list(executor.map(sample_chunk, chunks))
+    if not results:
+        return np.empty((0, len(STAT_NAMES)))
+    return np.concatenate(results)
+
+
+def significance_report(test, observed, samples, alpha=0.05, null=False):
+    """
+    one row per STAT_NAMES metric
+    args:
+        test: name of the test, type string
+        observed: 1d np.array of our statistics, see batch_trade_stats
+        samples: 2d np.array from resample
+        alpha: two sided level of the percentile confidence interval, type float
+        null: True when samples come from a null model, the report then holds the null mean
+              and the p-value of doing at least as well as observed, instead of an interval
+    returns:
+        pandas dataframe with REPORT_COLUMNS
+    """
+    rows = []
+    for col, name in enumerate(STAT_NAMES):
+        # undefined metrics of a resample (ex: no losing day) are left out
+        values = samples[:, col]
+        values = values[~np.isnan(values)]
+        low, high, null_mean, p_value = np.nan, np.nan, np.nan, np.nan
+        if len(values) and null:
+            null_mean = values.mean()
+            # add one so a p-value is never 0 from a finite number of resamples
+            p_value = (1.0 + np.count_nonzero(values >= observed[col])) / (1.0 + len(values))
+        elif len(values):
+            low, high = np.percentile(values, [100.0 * alpha / 2.0, 100.0 * (1.0 - alpha / 2.0)])
+        rows.append([test, name, observed[col], low, high, null_mean, p_value])
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+
+def main():
+    # these parameters impact file name and sub-folder to gather data from, same as trade_analysis.main
+    short_window = 5
+    long_window = 30
+    hedge_mode = "ratio"
+    initial_capital = 50000.0
+    params = pb.results_params([short_window, long_window], hedge_mode)
+    start_yr = 2006
+    end_yr = 2017
+    # resamples of every test, confidence level and random seed
+    n_resamples = 10000
+    alpha = 0.05
+    seed = 0
+    # "stationary", "block" or "iid" resampling of the daily PnL, None block uses default_block
+    daily_method = "stationary"
+    block = None
+    n_workers = os.cpu_count() or 1
+    # rate limited progress messages
+    instrumentation.configure_logging(logging.INFO)
+
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    # bring our local price cache up to date, all price loads read from it
+    cm.refresh_price_cache(conn)
+    start_dt, end_dt = trade_analysis.analysis_window(start_yr, end_yr, conn)
+
+    # trades saved by pairs_backtester or pipeline.py to our trade store
+    store = trade_store.TradeStore("PairsResults" + params)
+    df_res = store.read_master()
+    daily_pnl, daily_statistics = trade_analysis.daily_stats(df_res[['Trade_Id', 'Entry_Date', 'Ticker1', 'Ticker2']],
+                                                             start_dt, end_dt, params, store, cm.get_calendar(conn))
+    store.close()
+    tickers = list(dict.fromkeys(list(df_res['Ticker1']) + list(df_res['Ticker2'])))
+    price_panel = cm.load_price_panel(tickers, start_dt - datetime.timedelta(days=10), end_dt, conn)
+    conn.close()
+
+    reports = []
+    daily = Bootstrap([row[1] for row in daily_pnl], 'daily', daily_method, block)
+    with instrumentation.span('daily_bootstrap'):
+        samples = resample(daily, n_resamples, seed, n_workers)
+    reports.append(significance_report("daily_" + daily_method, daily.observed(), samples, alpha))
+
+    trades = Bootstrap(df_res['Total_PnL'].values, 'trade', "iid")
+    with instrumentation.span('trade_bootstrap'):
+        samples = resample(trades, n_resamples, seed, n_workers)
+    reports.append(significance_report("trade_iid", trades.observed(), samples, alpha))
+
+    null = RandomEntryNull(price_panel, df_res, initial_capital)
+    replay_gap = np.abs(null.replay() - null.total_pnl)[~null.last_bar_entry]
+    print("Random entry null replays {0} of our trades within {1:.2e} (median {2:.2e})".format(
+          len(replay_gap), np.nanmax(replay_gap) if len(replay_gap) else 0.0,
+          np.nanmedian(replay_gap) if len(replay_gap) else 0.0))
+    with instrumentation.span('random_entry_null'):
+        samples = resample(null, n_resamples, seed, n_workers)
+    reports.append(significance_report("random_entry", null.observed(), samples, alpha, null=True))
+
+    report = pd.concat(reports, ignore_index=True)
+    print(report.to_string(index=False))
+    report.to_csv("model_significance" + params + ".txt", index=False)
+    instrumentation.write_report("run_report_significance" + params + ".json")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,27 +12,33 @@ import pandas as pd
 # http://dateutil.readthedocs.io/en/stable/rrule.html
 from dateutil.rrule import DAILY, rrule, MO, TU, WE, TH, FR
 import datetime
-import psycopg2
 import common_methods as cm
 import numpy as np
+import instrumentation
+import logging
+import pairs_backtester as pb
+import trade_store
 
 
 class NewTrade():
     
-    def __init__(self, trd_id, ticker_1, ticker_2, params):
+    def __init__(self, trd_id, ticker_1, ticker_2, params, store=None):
         self.trd_id = trd_id
         self.cur_dir = os.getcwd()
         self.ticker1 = ticker_1
         self.ticker2 = ticker_2
         self.params = params
+        self.store = store
         # load our trd data into a df
         self.daily_trd_df = self.load_trd_history()
         self.exit_date = self.daily_trd_df.iloc[-1]['Date']
 
     def load_trd_history(self):
         # need to load our trd history into a pd dataframe
-        ticker_dir = self.ticker1 + "_" + self.ticker2 + "\\"
-        path_load = self.cur_dir + "\\PairsResults" + self.params + "\\" + ticker_dir + self.trd_id + ".txt"
+        if self.store is not None:
+            return self.store.read_trade(self.trd_id)
+        ticker_dir = self.ticker1 + "_" + self.ticker2
+        path_load = os.path.join(self.cur_dir, "PairsResults" + self.params, ticker_dir, self.trd_id + ".txt")
         daily_trd_df = pd.read_csv(path_load, sep=',' , header=0)
         return daily_trd_df
     
@@ -66,8 +72,134 @@ def daterange(start_date, end_date):
     return rrule(DAILY, dtstart=start_date, until=end_date, byweekday=(MO,TU,WE,TH,FR))
 
 
-def daily_stats(df_trds, st_dt, end_dt, params):
+def business_days(start_date, end_date):
     """
+    every business day between two dates, same days as daterange
+    args:
+        start_date: datetime obj
+        end_date: datetime obj
+    returns:
+        np.array of integer dates, ex: 20161230
+    """
+    days = pd.bdate_range(start_date, end_date)
+    return np.asarray(days.year * 10000 + days.month * 100 + days.day, dtype=np.int64)
+
+
+@instrumentation.timed('query')
+def load_daily_paths(trd_ids, ticker_1s, ticker_2s, params, store=None):
+    """
+    daily rows of every trade stacked into one dataframe, in trd_ids order
+    args:
+        trd_ids: list of trade ids, each id loaded once
+        ticker_1s: list of first tickers, same order as trd_ids
+        ticker_2s: list of second tickers, same order as trd_ids
+        params: directory suffix of our backtest results, ex: "_5_30", type string
+        store: trade_store.TradeStore to load from, None loads one text file per trade
+    returns:
+        pandas dataframe with columns Trade (position in trd_ids), Date and PnL
+    """
+    if store is not None:
+        paths = store.read_daily_paths()
+        trd_pos = pd.Series(np.arange(len(trd_ids)), index=trd_ids)
+        paths = paths[paths['Trade_Id'].isin(trd_pos.index)]
+        paths = paths.assign(Trade=trd_pos.loc[paths['Trade_Id']].values)
+        # stable sort keeps the daily rows of each trade in date order
+        paths = paths.sort_values('Trade', kind='stable')
+        return paths[['Trade', 'Date', 'PnL']].reset_index(drop=True)
+
+    frames = []
+    for pos, (trd_id, ticker_1, ticker_2) in enumerate(zip(trd_ids, ticker_1s, ticker_2s)):
+        daily_trd_df = NewTrade(trd_id, ticker_1, ticker_2, params).daily_trd_df
+        frames.append(daily_trd_df[['Date', 'PnL']].assign(Trade=pos))
+    if not frames:
+        return pd.DataFrame({'Trade': [], 'Date': [], 'PnL': []})
+    return pd.concat(frames, ignore_index=True)[['Trade', 'Date', 'PnL']]
+
+
+@instrumentation.timed('analysis')
+def daily_stats(df_trds, st_dt, end_dt, params, store=None, calendar=None):
+    """
+    cumulative daily PnL and open trade count for all trades on every business day in a given range.
+    all daily trade paths are loaded once and summed per date with np.bincount, same
+    results as daily_stats_reference when calendar is None
+    args:
+        df_trds: four column dataframe containing a trade_id, entry_date, ticker1 and ticker2
+                 trade_id is used to load the daily trade outcome
+        st_dt: start of our analysis, datetime obj
+        end_dt: end of our analysis, datetime obj
+        params: directory suffix of our backtest results, ex: "_5_30", type string
+        store: trade_store.TradeStore to load daily trade outcomes from, None loads text files
+        calendar: trading_calendar.TradingCalendar, only its sessions are reported so market
+                  holidays are left out. None reports every weekday like daily_stats_reference
+    returns:
+        daily_pnl: list of [date, PnL, number of open trades]
+        daily_stats: list of trade_stats results for our daily PnL
+    """
+    if calendar is None:
+        days = business_days(st_dt, end_dt)
+    else:
+        days = calendar.session_ints(st_dt, end_dt)
+    n_days = len(days)
+    
+    # trades open on a business day in our range, by entry date then file order.
+    # a trade id repeated on the same entry date is one trade
+    trds = df_trds.iloc[:, 0:4].set_axis(['Trade_Id', 'Entry_Date', 'Ticker1', 'Ticker2'], axis=1)
+    trds = trds.sort_values('Entry_Date', kind='stable').drop_duplicates('Trade_Id')
+    entry = trds['Entry_Date'].values.astype(np.int64)
+    entry_day = np.searchsorted(days, entry)
+    opened = entry_day < n_days
+    opened[opened] = days[entry_day[opened]] == entry[opened]
+    trds = trds[opened]
+    entry, entry_day = entry[opened], entry_day[opened]
+    
+    paths = load_daily_paths(list(trds['Trade_Id']), list(trds['Ticker1']), list(trds['Ticker2']),
+                             params, store)
+    trade = paths['Trade'].values.astype(np.int64)
+    path_dates = paths['Date'].values.astype(np.int64)
+    
+    # a trade counts from the day after entry until its exit date. open trades are
+    # dropped on the first business day of a new year
+    last_row = np.flatnonzero(np.r_[trade[1:] != trade[:-1], True]) if len(trade) else trade
+    exit_date = np.zeros(len(trds), dtype=np.int64)
+    exit_date[trade[last_row]] = path_dates[last_row]
+    year_end = np.searchsorted(days, (entry // 10000 + 1) * 10000 + 101)
+    exit_day = np.searchsorted(days, exit_date)
+    exits = (exit_day < n_days) & (exit_date > entry)
+    exits[exits] = days[exit_day[exits]] == exit_date[exits]
+    first_day = entry_day + 1
+    last_day = np.minimum(np.where(exits, exit_day + 1, year_end), year_end)
+    
+    counts = np.cumsum(np.bincount(first_day, minlength=n_days + 1) -
+                       np.bincount(last_day, minlength=n_days + 1))[:n_days]
+    
+    # first row of a trade on each open day. rows are in trade order, so np.bincount adds
+    # each day's PnL in the same order as the day by day loop
+    first_row = ~pd.DataFrame({'Trade': trade, 'Date': path_dates}).duplicated().values
+    path_day = np.minimum(np.searchsorted(days, path_dates), n_days - 1)
+    in_trade = (first_row & (days[path_day] == path_dates) &
+                (path_day >= first_day[trade]) & (path_day < last_day[trade]))
+    path_day, pnl = path_day[in_trade], paths['PnL'].values[in_trade].astype(np.float64)
+    day_pnl = np.bincount(path_day, weights=pnl, minlength=n_days)
+    has_pnl = np.bincount(path_day, minlength=n_days) > 0
+    
+    daily_pnl = []
+    for date_int, days_pnl, no_trades, has_day in zip(days.tolist(), day_pnl, counts.tolist(), has_pnl):
+        if not has_day:
+            days_pnl = 0.0
+        daily_pnl.append([date_int, days_pnl, no_trades])
+        instrumentation.progress('daily_stats', "Currently at {0} with PnL: {1}, number tr: {2}",
+                                 date_int, days_pnl, no_trades)
+    
+    # COMPUTE DAILY STATS
+    daily_df = pd.DataFrame(daily_pnl, columns = ['Date', 'PnL', 'TradeCount'])
+    daily_stats = trade_stats('daily', daily_df, 'PnL')    
+    
+    return daily_pnl, daily_stats
+
+
+def daily_stats_reference(df_trds, st_dt, end_dt, params, store=None):
+    """
+    original day by day version of daily_stats, kept as a reference.
     on every business day in a given range, load trades from backtest to calculate
     cumulative daily PnL for all trades
     args:
@@ -75,6 +207,7 @@ def daily_stats(df_trds, st_dt, end_dt, params):
                  trade_id is used to load a text file containing daily trade outcome
         st_dt: start of our analysis, datetime obj
         end_dt: start of our analysis, datetime obj
+        store: trade_store.TradeStore to load daily trade outcomes from, None loads text files
     returns:
         
     """
@@ -109,9 +242,6 @@ def daily_stats(df_trds, st_dt, end_dt, params):
         
         trds_to_delete = []
         
-        if date_int == 20070119:
-            print("debug")
-            
         #this avoids an error by using .copy().items() rather than .items()
         for k, trd in trd_holder.copy().items():
             # renamed key to deleted - avoid these trds
@@ -130,7 +260,8 @@ def daily_stats(df_trds, st_dt, end_dt, params):
             
         daily_pnl.append([date_int, days_pnl, no_trades])
         
-        print("Currently at {0} with PnL: {1}, number tr: {2}".format(date_int, days_pnl, no_trades))
+        instrumentation.progress('daily_stats', "Currently at {0} with PnL: {1}, number tr: {2}",
+                                 date_int, days_pnl, no_trades)
         
         if date_int in trd_dict:
             # we need to load all trade_ids for given date
@@ -141,7 +272,7 @@ def daily_stats(df_trds, st_dt, end_dt, params):
                 ticker_1 = trade[1]
                 ticker_2 = trade[2]
                 # we need to load new trade objects and append to our list
-                new_trd = NewTrade(trd_id, ticker_1, ticker_2, params)
+                new_trd = NewTrade(trd_id, ticker_1, ticker_2, params, store)
                 trd_holder[trd_id] = new_trd
 
     # COMPUTE DAILY STATS
@@ -217,51 +348,71 @@ def trade_stats(formatting, df_results, pnl_col_name):
             max_winner, max_loser, avg_winner, avg_loser]
 
 
-def main():
-    
-    # DB INFO FILE - host, user, password, db_name
-    db_credential_info_p = "\\" + "database_info.txt"
-    
-    # create our instance variables for host, username, password and database name
-    db_host, db_user, db_password, db_name = cm.load_db_credential_info(db_credential_info_p)
-    conn = psycopg2.connect(host=db_host,database=db_name, user=db_user, password=db_password)
-    
+def analysis_files(params):
+    """
+    files written by analyze_results, ex: daily_results_5_30.txt
+    args:
+        params: directory suffix of our backtest results, ex: "_5_30", type string
+    returns:
+        list of file names
+    """
+    return [name + params + ".txt" for name in ("daily_results", "model_daily_stats", "model_trade_stats")]
+
+
+def analysis_window(start_yr, end_yr, conn):
+    """
+    last trading day of December of the first and last year of our analysis
+    args:
+        start_yr: first year, type int
+        end_yr: last year, type int
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        start_dt, end_dt as datetime objects
+    """
+    mth_ = 12
+    start_dt_day = cm.fetch_last_day_any_mth(start_yr, mth_, conn)
+    end_dt_day = cm.fetch_last_day_any_mth(end_yr, mth_, conn)
+    return datetime.date(start_yr,mth_,start_dt_day), datetime.date(end_yr,mth_,end_dt_day)
+
+
+def analyze_results(params, start_dt, end_dt, conn):
+    """
+    trade and daily statistics of one backtest results directory, written to analysis_files(params)
+    args:
+        params: directory suffix of our backtest results, ex: "_5_30", type string
+        start_dt: first day of our daily statistics, datetime obj
+        end_dt: last day of our daily statistics, datetime obj
+        conn: a Postgres DB connection object or a data_sources.EmbeddedSource
+    returns:
+        NoneType
+    """
     cur_path = os.getcwd()
+    results_dir = os.path.join(cur_path, "PairsResults" + params)
+    store = None
     
-    ## these parameters impact file name and sub-folder to gather data from
-    params = "_TimeLimit_30"
-    
-    results_file = cur_path + "\\PairsResults" + params + "\\MasterResults.txt"
-    
-    # load results_file to pandas df
-    df_res = pd.read_table(results_file, 
-                           delimiter =",", 
-                           names = ('Trade_Id', 'Entry_Date', 'Position', 
-                                    'Ticker1', 'Ticker2', 
-                                    'Pos1', 'Pos2', 'Ratio', 
-                                    'Exit_Date', 'Avg_Day', 
-                                    'Max_Day', 'Min_Day', 'Tr_Length', 
-                                    'Total_PnL'), 
-                           index_col = False)
+    if os.path.exists(os.path.join(results_dir, trade_store.STORE_NAME)):
+        # trades saved by pairs_backtester to our trade store
+        store = trade_store.TradeStore(results_dir)
+        df_res = store.read_master()
+    else:
+        results_file = os.path.join(results_dir, "MasterResults.txt")
+        
+        # load results_file to pandas df
+        df_res = pd.read_table(results_file, 
+                               delimiter =",", 
+                               names = trade_store.MASTER_COLUMNS, 
+                               index_col = False)
     
     # TRADE SATISTICS - compute and output trade stats
-    trade_statistics = trade_stats('trade', df_res, 'Total_PnL')
+    with instrumentation.span('analysis'):
+        trade_statistics = trade_stats('trade', df_res, 'Total_PnL')
     
     # DAILY STATISTICS
     dly_stats_df = df_res[['Trade_Id','Entry_Date', 'Ticker1', 'Ticker2']]
     
-    # back test start_date and end_date as datetime objects
-
-    start_yr = 2006
-    end_yr = 2017
-    mth_ = 12
-    start_dt_day = cm.fetch_last_day_mth(start_yr, mth_, conn)
-    end_dt_day = cm.fetch_last_day_mth(end_yr, mth_, conn)
-
-    start_dt = datetime.date(start_yr,mth_,start_dt_day)
-    end_dt = datetime.date(end_yr,mth_,end_dt_day)
-    
-    daily_pnl, daily_statistics = daily_stats(dly_stats_df, start_dt, end_dt, params)
+    # trading sessions only, market holidays are not reported as flat days
+    daily_pnl, daily_statistics = daily_stats(dly_stats_df, start_dt, end_dt, params, store,
+                                              cm.get_calendar(conn))
     
     # write our data to text file
     f_name = "daily_results" + params
@@ -272,7 +423,40 @@ def main():
     cm.write_results_text_file(f_name2, daily_statistics)
     cm.write_results_text_file(f_name3, trade_statistics)
     
+    if store is not None:
+        store.close()
+    
     #df_res.hist(column='Total_PnL', figsize = (20,20), bins=100)
+
+
+def main():
+    # rate limited progress messages, logging.DEBUG shows every day
+    instrumentation.configure_logging(logging.INFO)
+    
+    # DB INFO FILE - host, user, password, db_name
+    db_credential_info_p = "database_info.txt"
+    
+    # create our instance variables for host, username, password and database name
+    db_info = cm.load_db_credential_info(db_credential_info_p)
+    # PostgreSQL, or the embedded copy when database_host is "embedded"
+    conn = cm.connect_db(db_info)
+    
+    ## these parameters impact file name and sub-folder to gather data from,
+    ## same settings as pairs_backtester.main, ex: "_5_30"
+    short_window = 5
+    long_window = 30
+    hedge_mode = "ratio"
+    params = pb.results_params([short_window, long_window], hedge_mode)
+    
+    # back test start_date and end_date as datetime objects
+    start_yr = 2006
+    end_yr = 2017
+    start_dt, end_dt = analysis_window(start_yr, end_yr, conn)
+    
+    analyze_results(params, start_dt, end_dt, conn)
+    # per stage totals of our analysis run
+    instrumentation.write_report("run_report_trade_analysis" + params + ".json")
+    
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
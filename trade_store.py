@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:31:09 2026
+
+"""
+
+# TRADE STORE - ONE INDEXED SQLITE FILE FOR ALL BACKTEST TRADES
+# replaces one text file per trade plus an append-mode MasterResults.txt.
+# the text layout can still be produced with write_text_trades or TradeStore.export_text
+#
+# trades: one row per closed trade, same fields as a MasterResults.txt row
+# daily:  one row per trade day, same fields as a trade text file, linked by trade_no
+
+import os
+import sqlite3
+
+import pandas as pd
+
+STORE_NAME = "trades.sqlite"
+
+DAILY_HEADER = "Date,Position,Ticker1,Ticker2,ZScore,Ticker1_Shares,Ticker2_Shares,Ratio,Ticker1_P,Ticker2_P,Days,PnL"
+
+MASTER_COLUMNS = ('Trade_Id', 'Entry_Date', 'Position', 'Ticker1', 'Ticker2', 'Pos1', 'Pos2', 'Ratio',
+                  'Exit_Date', 'Avg_Day', 'Max_Day', 'Min_Day', 'Tr_Length', 'Total_PnL')
+DAILY_COLUMNS = tuple(DAILY_HEADER.split(","))
+
+SCHEMA = """
+         CREATE TABLE IF NOT EXISTS trades (
+             trade_no INTEGER PRIMARY KEY,
+             trade_id TEXT NOT NULL,
+             entry_date INTEGER NOT NULL,
+             position TEXT NOT NULL,
+             ticker1 TEXT NOT NULL,
+             ticker2 TEXT NOT NULL,
+             pos1 REAL,
+             pos2 REAL,
+             ratio REAL,
+             exit_date INTEGER NOT NULL,
+             avg_day REAL,
+             max_day REAL,
+             min_day REAL,
+             tr_length INTEGER,
+             total_pnl REAL
+         );
+         CREATE TABLE IF NOT EXISTS daily (
+             trade_no INTEGER NOT NULL REFERENCES trades(trade_no),
+             date INTEGER NOT NULL,
+             position TEXT,
+             ticker1 TEXT,
+             ticker2 TEXT,
+             zscore REAL,
+             ticker1_shares REAL,
+             ticker2_shares REAL,
+             ratio REAL,
+             ticker1_p REAL,
+             ticker2_p REAL,
+             days INTEGER,
+             pnl REAL
+         );
+         CREATE INDEX IF NOT EXISTS idx_trades_trade_id ON trades(trade_id);
+         CREATE INDEX IF NOT EXISTS idx_daily_trade_no ON daily(trade_no, date);
+         CREATE INDEX IF NOT EXISTS idx_daily_date ON daily(date);
+         """
+
+
+def _float(value):
+    # sqlite stores NaN as NULL, turn it back into nan for the text layout
+    return float('nan') if value is None else value
+
+
+def format_master_row(row):
+    """
+    MasterResults.txt line for a master row tuple
+    args:
+        row: tuple in MASTER_COLUMNS order, dates as 'YYYYMMDD' strings
+    returns:
+        string, without newline
+    """
+    (trd_id, entry_date, position, stock_1, stock_2, pos1, pos2, ratio, exit_date,
+     trd_mean, max_day, min_day, days_in_trade, trade_pnl) = row
+    return ",".join([trd_id, entry_date, position, stock_1, stock_2,
+                     repr(pos1), repr(pos2), repr(ratio), exit_date,
+                     repr(trd_mean), repr(max_day), repr(min_day),
+                     repr(days_in_trade), repr(trade_pnl)])
+
+
+def format_daily_row(row):
+    """
+    trade text file line for a daily row tuple
+    args:
+        row: tuple of trade id followed by DAILY_COLUMNS values, date as 'YYYYMMDD' string
+    returns:
+        string, without newline
+    """
+    (trd_id, date, position, stock_1, stock_2, zscore, pos1, pos2, ratio,
+     stock1_p, stock2_p, days_in_trade, pnl) = row
+    return (date + "," + position + "," + stock_1 + "," + stock_2 + "," + repr(zscore) + "," +
+            repr(pos1) + "," + repr(pos2) + "," + repr(ratio) + "," +
+            repr(stock1_p) + "," + repr(stock2_p) + "," + repr(days_in_trade) + "," + repr(pnl))
+
+
+def write_text_trades(main_directory, trades):
+    """
+    original text layout: one file per trade in a pair directory, plus MasterResults.txt
+    args:
+        main_directory: ex: "PairsResults_5_30", type string
+        trades: list of (master row, list of daily rows) tuples, see format_master_row
+                and format_daily_row
+    returns:
+        NoneType
+    """
+    for master_row, daily_rows in trades:
+        trd_id, stock_1, stock_2 = master_row[0], master_row[3], master_row[4]
+        directory_pair = main_directory + "/{0}_{1}".format(stock_1, stock_2)
+        if not os.path.exists(directory_pair):
+            os.makedirs(directory_pair)
+        lines = [DAILY_HEADER] + [format_daily_row(row) for row in daily_rows]
+        with open((directory_pair + "/{0}.txt".format(trd_id)),"w") as ff:
+            ff.write("\n".join(lines) + "\n")
+
+    if trades:
+        main_file = main_directory + "/MasterResults.txt"
+        with open(main_file,"a") as ff:
+            ff.write("".join([format_master_row(master_row) + "\n" for master_row, daily_rows in trades]))
+
+
+def remove_store(main_directory):
+    """
+    delete the trade store of a directory, a run that rewrites its trades starts from an empty store
+    args:
+        main_directory: ex: "PairsResults_5_30", type string
+    returns:
+        NoneType
+    """
+    path = os.path.join(main_directory, STORE_NAME)
+    for f_name in [path, path + "-wal", path + "-shm"]:
+        if os.path.exists(f_name):
+            os.remove(f_name)
+
+
+class TradeStore():
+
+    def __init__(self, main_directory):
+        self.main_directory = main_directory
+        if not os.path.exists(self.main_directory):
+            os.makedirs(self.main_directory)
+        self.path = os.path.join(self.main_directory, STORE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_trades(self, trades):
+        """
+        insert a batch of trades and their daily rows in one transaction
+        args:
+            trades: list of (master row, list of daily rows) tuples, see format_master_row
+                    and format_daily_row
+        returns:
+            NoneType
+        """
+        if not trades:
+            return
+        with self.conn:
+            cur = self.conn.cursor()
+            for master_row, daily_rows in trades:
+                values = list(master_row)
+                values[1] = int(values[1])
+                values[8] = int(values[8])
+                cur.execute("INSERT INTO trades (trade_id, entry_date, position, ticker1, ticker2, pos1, pos2, "
+                            "ratio, exit_date, avg_day, max_day, min_day, tr_length, total_pnl) "
+                            "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", values)
+                trade_no = cur.lastrowid
+                cur.executemany("INSERT INTO daily VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                                [(trade_no, int(row[1])) + tuple(row[2:]) for row in daily_rows])
+
+    def read_master(self):
+        """
+        every trade in insertion order
+        returns:
+            pandas dataframe with MASTER_COLUMNS, same values as reading MasterResults.txt
+        """
+        SQL = """
+              SELECT trade_id, entry_date, position, ticker1, ticker2, pos1, pos2, ratio,
+                     exit_date, avg_day, max_day, min_day, tr_length, total_pnl
+              FROM trades ORDER BY trade_no
+              """
+        return pd.read_sql_query(SQL, self.conn).set_axis(list(MASTER_COLUMNS), axis=1)
+
+    def read_trade(self, trd_id):
+        """
+        daily rows of one trade, the latest trade stored under trd_id
+        args:
+            trd_id: trade id, ex: "20160430_ShortZTSVRTX", type string
+        returns:
+            pandas dataframe with DAILY_COLUMNS, same values as reading the trade text file
+        """
+        SQL = """
+              SELECT date, position, ticker1, ticker2, zscore, ticker1_shares, ticker2_shares,
+                     ratio, ticker1_p, ticker2_p, days, pnl
+              FROM daily
+              WHERE trade_no = (SELECT MAX(trade_no) FROM trades WHERE trade_id = ?)
+              ORDER BY rowid
+              """
+        return pd.read_sql_query(SQL, self.conn, params=(trd_id,)).set_axis(list(DAILY_COLUMNS), axis=1)
+
+    def read_daily_paths(self):
+        """
+        daily rows of every trade with their trade id. only the latest trade of a repeated trade id
+        returns:
+            pandas dataframe with Trade_Id followed by DAILY_COLUMNS
+        """
+        SQL = """
+              SELECT trades.trade_id, daily.date, daily.position, daily.ticker1, daily.ticker2,
+                     daily.zscore, daily.ticker1_shares, daily.ticker2_shares, daily.ratio,
+                     daily.ticker1_p, daily.ticker2_p, daily.days, daily.pnl
+              FROM daily
+              INNER JOIN trades ON trades.trade_no = daily.trade_no
+              WHERE daily.trade_no IN (SELECT MAX(trade_no) FROM trades GROUP BY trade_id)
+              ORDER BY daily.rowid
+              """
+        return pd.read_sql_query(SQL, self.conn).set_axis(['Trade_Id'] + list(DAILY_COLUMNS), axis=1)
+
+    def read_trades(self):
+        """
+        every trade with its daily rows in insertion order, the layout add_trades takes
+        returns:
+            list of (master row, list of daily rows) tuples, see format_master_row and format_daily_row
+        """
+        daily = {}
+        for row in self.conn.execute("SELECT trade_no, date, position, ticker1, ticker2, zscore, ticker1_shares, "
+                                     "ticker2_shares, ratio, ticker1_p, ticker2_p, days, pnl "
+                                     "FROM daily ORDER BY rowid"):
+            daily.setdefault(row[0], []).append([_float(value) for value in row])
+        
+        trades = []
+        for row in self.conn.execute("SELECT trade_no, trade_id, entry_date, position, ticker1, ticker2, pos1, "
+                                     "pos2, ratio, exit_date, avg_day, max_day, min_day, tr_length, total_pnl "
+                                     "FROM trades ORDER BY trade_no"):
+            master_row = [_float(value) for value in row[1:]]
+            master_row[1] = "{0:08d}".format(master_row[1])
+            master_row[8] = "{0:08d}".format(master_row[8])
+            daily_rows = [(master_row[0], "{0:08d}".format(day[1])) + tuple(day[2:]) for day in daily.get(row[0], [])]
+            trades.append((tuple(master_row), daily_rows))
+        return trades
+
+    def export_text(self):
+        """
+        write the original text layout (pair directories and MasterResults.txt) from the store
+        returns:
+            NoneType
+        """
+        trades = self.read_trades()
+        master_file = os.path.join(self.main_directory, "MasterResults.txt")
+        if os.path.exists(master_file):
+            os.remove(master_file)
+        write_text_trades(self.main_directory, trades)
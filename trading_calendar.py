@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:58:02 2026
+
+"""
+
+# TRADING CALENDAR - SESSION LOOKUPS FROM ONE SORTED ARRAY OF DATES
+# sessions are the distinct dates in daily_data, loaded once: from the price cache
+# when it exists (dates.npy holds every date with a price), otherwise with one
+# DISTINCT query. every lookup is a binary search of the sorted sessions, no SQL
+#
+#   calendar = cm.get_calendar(conn)
+#   calendar.last_session_of_month(2016, 12)   -> datetime.date(2016, 12, 30)
+#   calendar.next_session(datetime.date(2016, 12, 30))
+#   calendar.sessions(start_date, end_date)
+
+import datetime
+
+import numpy as np
+
+
+class TradingCalendar():
+
+    def __init__(self, sessions):
+        """
+        args:
+            sessions: array like of trading dates, any order, duplicates allowed
+        """
+        self.sessions_arr = np.unique(np.asarray(sessions, dtype='datetime64[D]'))
+
+    def __len__(self):
+        return len(self.sessions_arr)
+
+    def session(self, pos):
+        # datetime.date of the session at pos, None outside the calendar
+        if pos < 0 or pos >= len(self.sessions_arr):
+            return None
+        return self.sessions_arr[pos].astype(object)
+
+    def first_on_or_after(self, date):
+        return self.session(np.searchsorted(self.sessions_arr, np.datetime64(date, 'D'), side='left'))
+
+    def last_on_or_before(self, date):
+        return self.session(np.searchsorted(self.sessions_arr, np.datetime64(date, 'D'), side='right') - 1)
+
+    def is_session(self, date):
+        return self.first_on_or_after(date) == np.datetime64(date, 'D').astype(object)
+
+    def next_session(self, date):
+        """
+        first session after date, None past the last session
+        """
+        return self.session(np.searchsorted(self.sessions_arr, np.datetime64(date, 'D'), side='right'))
+
+    def previous_session(self, date):
+        """
+        last session before date, None before the first session
+        """
+        return self.session(np.searchsorted(self.sessions_arr, np.datetime64(date, 'D'), side='left') - 1)
+
+    def first_session_of_month(self, year_, mth_):
+        """
+        args:
+            year_: year, type int
+            mth_: month, type int
+        returns:
+            datetime.date of the first session in the month, None if the month has no session
+        """
+        first = self.first_on_or_after(datetime.date(year_, mth_, 1))
+        if first is None or (first.year, first.month) != (year_, mth_):
+            return None
+        return first
+
+    def last_session_of_month(self, year_, mth_):
+        """
+        args:
+            year_: year, type int
+            mth_: month, type int
+        returns:
+            datetime.date of the last session in the month, None if the month has no session
+        """
+        next_month = np.datetime64("{0:04d}-{1:02d}".format(year_, mth_), 'M') + 1
+        last = self.previous_session(next_month.astype('datetime64[D]'))
+        if last is None or (last.year, last.month) != (year_, mth_):
+            return None
+        return last
+
+    def first_session_of_year(self, year_):
+        first = self.first_on_or_after(datetime.date(year_, 1, 1))
+        if first is None or first.year != year_:
+            return None
+        return first
+
+    def last_session_of_year(self, year_):
+        last = self.previous_session(datetime.date(year_ + 1, 1, 1))
+        if last is None or last.year != year_:
+            return None
+        return last
+
+    def sessions(self, start_date, end_date):
+        """
+        every session from start_date to end_date, both included
+        returns:
+            np.array of datetime64[D]
+        """
+        lo = np.searchsorted(self.sessions_arr, np.datetime64(start_date, 'D'), side='left')
+        hi = np.searchsorted(self.sessions_arr, np.datetime64(end_date, 'D'), side='right')
+        return self.sessions_arr[lo:hi]
+
+    def session_ints(self, start_date, end_date):
+        """
+        sessions from start_date to end_date as integer dates, ex: 20161230
+        returns:
+            np.array of int64
+        """
+        days = self.sessions(start_date, end_date)
+        months = days.astype('datetime64[M]')
+        years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+        return (years * 10000 + (months.astype(np.int64) % 12 + 1) * 100 +
+                (days - months.astype('datetime64[D]')).astype(np.int64) + 1)